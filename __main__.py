@@ -0,0 +1,9 @@
+"""Run TextTransmute pipelines from the command line, see cli.py"""
+import sys
+
+if __name__ == "__main__":
+    try:
+        from .cli import main
+    except (ImportError, ValueError, SystemError):
+        from cli import main
+    sys.exit(main())
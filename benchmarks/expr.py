@@ -0,0 +1,74 @@
+"""Overhead of the resource guard on everyday expressions
+
+Run from the package directory with python benchmarks/expr.py
+
+Exits with status 1 when the guard costs any expression more than
+OVERHEAD_LIMIT of its unguarded time.
+"""
+
+import os
+import sys
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from commands import compile_expr, compile_limited, UNLIMITED
+
+EXPRESSIONS = ["2 + 2",
+               "1 + 2*3**(4^5) / (6 + -7)",
+               "(12.5 * 4 - 3) / 7 + 2 ** 10",
+               "{$} * 1.08",
+               "{$} ** 2 + {$} * 3"]
+NUMBER = 100000
+REPEAT = 21
+OVERHEAD_LIMIT = 0.25
+
+
+def measure(expr, number=NUMBER):
+    """Best times of expr guarded and unguarded, and the overhead of the
+    guard
+
+    Both are timed in turns so they see the same load on the machine,
+    the overhead is the median of the turns.
+    """
+    guarded = compile_expr(expr)
+    unguarded = compile_expr(expr, UNLIMITED)
+    times = ([], [])
+    for i in range(REPEAT):
+        for function, results in zip((guarded, unguarded), times):
+            results.append(timeit.timeit(lambda: function(3), number=number))
+    ratios = sorted(a / b for a, b in zip(*times))
+    return min(times[0]), min(times[1]), ratios[len(ratios) // 2] - 1
+
+
+def main():
+    print("%-32s %12s %12s %9s" % ("expression", "guarded", "unguarded",
+                                   "overhead"))
+    over = []
+    for expr in EXPRESSIONS:
+        guarded, unguarded, overhead = measure(expr)
+        if overhead > OVERHEAD_LIMIT:
+            over.append(expr)
+        print("%-32s %10.3fus %10.3fus %8.1f%%%s" %
+              (expr,
+               guarded / NUMBER * 1e6,
+               unguarded / NUMBER * 1e6,
+               overhead * 100,
+               " over" if overhead > OVERHEAD_LIMIT else ""))
+
+    # parsing and limit checks are paid once per distinct expression
+    compile_limited.cache_clear()
+    parse = min(timeit.repeat(lambda: (compile_limited.cache_clear(),
+                                       compile_expr(EXPRESSIONS[1])),
+                              number=10000, repeat=5))
+    print("compiling %r: %.3fus" % (EXPRESSIONS[1], parse / 10000 * 1e6))
+
+    if over:
+        print("guard overhead above %d%% for %s" %
+              (OVERHEAD_LIMIT * 100, ", ".join(map(repr, over))))
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
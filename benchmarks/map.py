@@ -0,0 +1,75 @@
+"""Map over key/value dumps of 10^4 to 10^6 pairs in every format
+
+Run from the package directory with python benchmarks/map.py
+
+The time per pair should stay flat as the number of pairs grows. The
+py format is also compared with the earlier implementation, which
+concatenated the output one entry at a time.
+"""
+
+import os
+import re
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from commands import Map, MAP_FORMATS
+
+PAIRS = [10 ** 4, 10 ** 5, 10 ** 6]
+FORMATS = sorted(set(MAP_FORMATS) - {"cljs"})
+REPEAT = 3
+
+
+def concatenated_py(body, indent="    "):
+    """Map py output as it was built before"""
+    ws_pattern = re.compile(r'''((?:[^\s"'`]|"[^"]*"|'[^']*'|`[^`]*`)+)''')
+    split_body = [x for x in ws_pattern.split(body)[1::2]]
+    leading_ws = " " * (len(body) - len(body.lstrip(' ')))
+    output = leading_ws + split_body[0] + " = {\n"
+    for i in range(1, len(split_body)):
+        if (i % 2 != 0):
+            output += (leading_ws +
+                       indent +
+                       "\"" +
+                       split_body[i].replace("\"", "\\\"") +
+                       "\": ")
+        else:
+            output += split_body[i] + "\n"
+    output += leading_ws + "}"
+    return output
+
+
+def dump(count):
+    return "settings\n" + "\n".join("key%d \"value %d\"" % (i, i) if i % 2
+                                    else "key%d %d" % (i, i)
+                                    for i in range(count))
+
+
+def measure(function):
+    times = []
+    for i in range(REPEAT):
+        start = time.perf_counter()
+        function()
+        times.append(time.perf_counter() - start)
+    return min(times)
+
+
+def main():
+    transmutation = Map()
+    print("%-12s %10s %12s %12s" % ("format", "pairs", "time", "per pair"))
+    for extension in FORMATS + ["py (before)"]:
+        for count in PAIRS:
+            body = dump(count)
+            if extension == "py (before)":
+                seconds = measure(lambda: concatenated_py(body))
+            else:
+                seconds = measure(lambda: transmutation.transmute(
+                    body, [extension]))
+            print("%-12s %10d %10.1fms %10.3fus" % (extension, count,
+                                                   seconds * 1000,
+                                                   seconds / count * 1e6))
+
+
+if __name__ == '__main__':
+    main()
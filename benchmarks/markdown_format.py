@@ -0,0 +1,49 @@
+"""Formatting rendered markdown with and without BeautifulSoup
+
+Run from the package directory with python benchmarks/markdown_format.py
+"""
+
+import os
+import sys
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import markdown
+
+from htmlformat import format_html, prettify_html
+from mdcache import MARKDOWN_EXTENSIONS
+
+README = os.path.join(os.path.dirname(os.path.dirname(
+    os.path.abspath(__file__))), "README.md")
+COPIES = [1, 10, 40]
+
+
+def measure(function, html, number):
+    return min(timeit.repeat(lambda: function(html), number=number,
+                             repeat=5)) / number
+
+
+def main():
+    with open(README, encoding="utf-8") as f:
+        readme = f.read()
+    print("%-14s %10s %12s %12s %8s" % ("document", "html", "beautifulsoup",
+                                        "formatter", "speedup"))
+    for copies in COPIES:
+        html = markdown.markdown(readme * copies,
+                                 extensions=MARKDOWN_EXTENSIONS,
+                                 output_format="xhtml5")
+        assert format_html(html) == prettify_html(html)
+        number = max(1, 20 // copies)
+        soup = measure(prettify_html, html, number)
+        formatter = measure(format_html, html, number)
+        print("%-14s %9dK %11.1fms %11.1fms %7.1fx" %
+              ("README x %d" % copies,
+               len(html) // 1024,
+               soup * 1000,
+               formatter * 1000,
+               soup / formatter))
+
+
+if __name__ == '__main__':
+    main()
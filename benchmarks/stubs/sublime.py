@@ -0,0 +1,374 @@
+"""Minimal stand-in for the sublime module, enough to drive plugin.py
+
+Views hold their text in memory and replace it lazily, so commands
+editing thousands of regions of a large buffer cost about as much as
+they would in the editor. Callbacks scheduled with set_timeout run on
+the calling thread from run_until_idle, set_timeout_async callbacks on
+a single background thread, as in the editor.
+"""
+
+import queue
+import threading
+from collections import deque
+
+HIDDEN = 128
+LAYOUT_INLINE = 0
+LAYOUT_BELOW = 1
+LAYOUT_BLOCK = 2
+DRAW_NO_FILL = 32
+DRAW_NO_OUTLINE = 256
+
+PACKAGES_PATH = None
+SETTINGS = {}
+ERRORS = []
+STATUS = []
+DIALOGS = []
+# answer given to every ok_cancel_dialog
+OK_CANCEL = True
+
+_main = deque()
+_async = queue.Queue()
+_idle = threading.Condition()
+_pending = [0]
+_window = None
+
+
+class Region(object):
+
+    def __init__(self, a, b=None):
+        self.a = a
+        self.b = a if b is None else b
+
+    def begin(self):
+        return min(self.a, self.b)
+
+    def end(self):
+        return max(self.a, self.b)
+
+    def size(self):
+        return abs(self.b - self.a)
+
+    def empty(self):
+        return self.a == self.b
+
+    def __eq__(self, other):
+        return (isinstance(other, Region) and
+                (self.a, self.b) == (other.a, other.b))
+
+    def __hash__(self):
+        return hash((self.a, self.b))
+
+    def __repr__(self):
+        return "Region(%d, %d)" % (self.a, self.b)
+
+
+class Selection(object):
+
+    def __init__(self, regions=()):
+        self.regions = list(regions)
+
+    def add(self, region):
+        self.regions.append(region)
+
+    def add_all(self, regions):
+        self.regions.extend(regions)
+
+    def clear(self):
+        self.regions = []
+
+    def __iter__(self):
+        return iter(self.regions)
+
+    def __len__(self):
+        return len(self.regions)
+
+    def __getitem__(self, index):
+        return self.regions[index]
+
+
+class Settings(dict):
+
+    def get(self, key, default=None):
+        return dict.get(self, key, default)
+
+    def set(self, key, value):
+        self[key] = value
+
+    def erase(self, key):
+        self.pop(key, None)
+
+    def has(self, key):
+        return key in self
+
+    def add_on_change(self, tag, callback):
+        pass
+
+    def clear_on_change(self, tag):
+        pass
+
+
+class View(object):
+    """A buffer of text with selections and named regions
+
+    Replacements are kept aside and applied in a single pass when the
+    text is next read, as long as each one lies entirely before or
+    after those already kept, which holds for every edit plugin.py
+    makes.
+    """
+
+    def __init__(self, text="", regions=(), variables=None):
+        self.text = text
+        self.edits = []
+        self.delta = 0
+        self.selection = Selection(Region(a, b) for a, b in regions)
+        self.regions = {}
+        self.variables = variables or {}
+        self.status = {}
+        self.phantoms = {}
+
+    def size(self):
+        return len(self.text) + self.delta
+
+    def substr(self, region):
+        self.flush()
+        if isinstance(region, int):
+            return self.text[region:region + 1]
+        return self.text[region.begin():region.end()]
+
+    def sel(self):
+        return self.selection
+
+    def insert(self, edit, point, text):
+        self.replace(edit, Region(point, point), text)
+        return len(text)
+
+    def erase(self, edit, region):
+        self.replace(edit, region, "")
+
+    def replace(self, edit, region, text):
+        begin, end = region.begin(), region.end()
+        if self.edits and begin >= self.edits[-1][1] + self.delta:
+            self.edits.append((begin - self.delta, end - self.delta, text))
+        elif not self.edits or end <= self.edits[0][0]:
+            self.edits.insert(0, (begin, end, text))
+        else:
+            self.flush()
+            self.edits.append((begin, end, text))
+        change = len(text) - (end - begin)
+        self.delta += change
+        for key, regions in self.regions.items():
+            self.regions[key] = [Region(shift(r.a, begin, end, change),
+                                        shift(r.b, begin, end, change))
+                                 for r in regions]
+
+    def flush(self):
+        if not self.edits:
+            return
+        pieces = []
+        position = 0
+        for begin, end, text in self.edits:
+            pieces.append(self.text[position:begin])
+            pieces.append(text)
+            position = end
+        pieces.append(self.text[position:])
+        self.text = "".join(pieces)
+        self.edits = []
+        self.delta = 0
+
+    def add_regions(self, key, regions, scope="", icon="", flags=0):
+        self.regions[key] = list(regions)
+
+    def get_regions(self, key):
+        return list(self.regions.get(key, ()))
+
+    def erase_regions(self, key):
+        self.regions.pop(key, None)
+
+    def set_status(self, key, value):
+        self.status[key] = value
+
+    def erase_status(self, key):
+        self.status.pop(key, None)
+
+    def file_name(self):
+        return self.variables.get("file")
+
+    def set_name(self, name):
+        self.name = name
+
+    def set_scratch(self, scratch):
+        self.scratch = scratch
+
+    def window(self):
+        return active_window()
+
+    def run_command(self, name, args=None):
+        import sublime_plugin
+        if name == "append":
+            self.insert(None, self.size(), args["characters"])
+            return
+        command = sublime_plugin.text_command(name)
+        if command is not None:
+            command(self).run(Edit(self), **(args or {}))
+
+
+class Phantom(object):
+
+    def __init__(self, region, content, layout, on_navigate=None):
+        self.region = region
+        self.content = content
+        self.layout = layout
+        self.on_navigate = on_navigate
+
+
+class PhantomSet(object):
+    """Phantoms shown in a view, kept in view.phantoms under their key"""
+
+    def __init__(self, view, key=""):
+        self.view = view
+        self.key = key
+
+    def update(self, phantoms):
+        self.view.phantoms[self.key] = list(phantoms)
+
+
+class Edit(object):
+
+    def __init__(self, view):
+        self.view = view
+
+
+class Window(object):
+
+    def __init__(self):
+        self.view = View()
+        self.panels = {}
+
+    def active_view(self):
+        return self.view
+
+    def set_view(self, view):
+        self.view = view
+
+    def extract_variables(self):
+        return dict(self.view.variables)
+
+    def create_output_panel(self, name):
+        self.panels[name] = View()
+        return self.panels[name]
+
+    def run_command(self, name, args=None):
+        pass
+
+    def open_file(self, path):
+        return View(variables={"file": path})
+
+    def new_file(self):
+        self.view = View()
+        return self.view
+
+    def show_input_panel(self, caption, initial, on_done, on_change,
+                         on_cancel):
+        return View(initial)
+
+    def show_quick_panel(self, items, on_select, *args):
+        pass
+
+
+def shift(point, begin, end, change):
+    if point >= end:
+        return point + change
+    if point > begin:
+        return begin
+    return point
+
+
+def active_window():
+    global _window
+    if _window is None:
+        _window = Window()
+    return _window
+
+
+def windows():
+    return [active_window()]
+
+
+def load_settings(name):
+    return SETTINGS.setdefault(name, Settings())
+
+
+def save_settings(name):
+    pass
+
+
+def packages_path():
+    return PACKAGES_PATH
+
+
+def platform():
+    import sys
+    if sys.platform.startswith("win"):
+        return "windows"
+    return "osx" if sys.platform == "darwin" else "linux"
+
+
+def version():
+    return "3211"
+
+
+def status_message(message):
+    STATUS.append(message)
+
+
+def error_message(message):
+    ERRORS.append(message)
+
+
+def message_dialog(message):
+    pass
+
+
+def ok_cancel_dialog(message, ok_title=""):
+    DIALOGS.append(message)
+    return OK_CANCEL
+
+
+def set_timeout(callback, delay=0):
+    with _idle:
+        _main.append(callback)
+        _idle.notify_all()
+
+
+def set_timeout_async(callback, delay=0):
+    with _idle:
+        _pending[0] += 1
+    _async.put(callback)
+
+
+def run_until_idle():
+    """Run main thread callbacks until nothing is left to run anywhere"""
+    while True:
+        with _idle:
+            while not _main and _pending[0]:
+                _idle.wait()
+            if not _main:
+                return
+            callback = _main.popleft()
+        callback()
+
+
+def _run_async():
+    while True:
+        callback = _async.get()
+        try:
+            callback()
+        finally:
+            with _idle:
+                _pending[0] -= 1
+                _idle.notify_all()
+
+
+_thread = threading.Thread(target=_run_async)
+_thread.daemon = True
+_thread.start()
@@ -0,0 +1,43 @@
+"""Minimal stand-in for the sublime_plugin module
+
+Commands are found by name as the editor finds them, TextTransmuteExec
+and TextTransmuteExecCommand both answer to text_transmute_exec.
+"""
+
+import re
+
+TEXT_COMMANDS = {}
+
+
+def command_name(class_name):
+    if class_name.endswith("Command"):
+        class_name = class_name[:-len("Command")]
+    return re.sub(r'(?<!^)(?=[A-Z])', '_', class_name).lower()
+
+
+def text_command(name):
+    return TEXT_COMMANDS.get(name)
+
+
+class TextCommand(object):
+
+    def __init__(self, view):
+        self.view = view
+
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        TEXT_COMMANDS[command_name(cls.__name__)] = cls
+
+
+class WindowCommand(object):
+
+    def __init__(self, window):
+        self.window = window
+
+
+class ApplicationCommand(object):
+    pass
+
+
+class EventListener(object):
+    pass
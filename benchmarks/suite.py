@@ -0,0 +1,400 @@
+"""Throughput of every built-in transmutation and of the editor command
+
+Run from the package directory with python benchmarks/suite.py
+
+Transmutations are measured over selections of 1K up to 100M, and the
+whole text_transmute_parse command, from reading the selections of a
+view to replacing them, over 1 to 10,000 selections of those sizes.
+plugin.py runs against the stand-in sublime modules in stubs/ and http
+against a local server. Results are written to results.json, saving
+them as a baseline makes later runs fail when a case gets slower:
+
+    python benchmarks/suite.py --quick --save-baseline
+    python benchmarks/suite.py --quick
+"""
+
+import argparse
+import importlib
+import importlib.util
+import json
+import multiprocessing
+import os
+import platform
+import shutil
+import sys
+import tempfile
+import time
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+ROOT = os.path.dirname(HERE)
+PACKAGE = "TextTransmute"
+
+sys.path.insert(0, os.path.join(HERE, "stubs"))
+
+import sublime
+
+SIZES = "1K,100K,10M,100M"
+QUICK_SIZES = "1K,100K"
+REGION_COUNTS = "1,100,10000"
+QUICK_REGION_COUNTS = "1,100"
+HTTP_MAX_REGIONS = 1000
+MIN_REGION_CHARS = 16
+THRESHOLD = 0.25
+# cases faster than this vary too much from run to run to compare
+MIN_COMPARED = 0.001
+MIN_TIME = 0.2
+MAX_REPEAT = 5
+RESULTS = os.path.join(HERE, "results.json")
+BASELINE = os.path.join(HERE, "baseline.json")
+UNITS = {"K": 1 << 10, "M": 1 << 20, "G": 1 << 30}
+META = {"file": "", "file_extension": "txt", "folder": ROOT}
+
+
+def words(i):
+    return "item %d alpha beta gamma delta" % i
+
+
+def padded(i):
+    return "   item %d alpha  \t" % i
+
+
+def sums(i):
+    return "%d * 3 + %d / 7" % (i, i % 97)
+
+
+def pairs(i):
+    return "key%d value%d" % (i, i)
+
+
+def blocks(i):
+    return ("## Section %d\n\nSome *text* with `code` %d\n\n- a\n- b\n" %
+            (i, i))
+
+
+def urls(i):
+    return "{url}/item/%05d" % i
+
+
+# name, user input, lines of the selection and the largest size worth
+# measuring, mklist generates {count} lines instead of reading any
+TRANSMUTATIONS = [
+    ("swap", "swap alpha omega beta psi", words, None),
+    ("swap-words", "swap -w alpha omega beta psi", words, None),
+    ("filter", "filter 7", words, None),
+    ("filter-any", "filter 7 omega", words, None),
+    ("filter-regex", "filter -e 7\\d$", words, None),
+    ("strip", "strip", padded, None),
+    ("expand", "expand", words, None),
+    ("compress", "compress", words, None),
+    ("dupl", "dupl 3", words, None),
+    ("expr", "expr -l", sums, "1M"),
+    ("mklist", "mklist 0 {count}", None, None),
+    ("map", "map py", pairs, "10M"),
+    ("markdown", "markdown", blocks, "1M"),
+    ("pipeline", "swap alpha omega | filter 7 | strip", words, None),
+]
+
+# name, user input and lines of every selection of the editor command
+COMMANDS = [
+    ("swap", "swap alpha omega", words),
+    ("filter", "filter 7 | strip", words),
+    ("dupl", "dupl", words),
+]
+
+
+class BenchmarkError(Exception):
+    pass
+
+
+class ErrorRecorder(object):
+
+    def __init__(self):
+        self.errors = []
+
+    def display_err(self, message):
+        self.errors.append(message)
+
+
+def parse_size(text):
+    text = text.strip().upper()
+    if text[-1:] in UNITS:
+        return int(float(text[:-1]) * UNITS[text[-1]])
+    return int(text)
+
+
+def format_size(size):
+    for unit in "GMK":
+        if size >= UNITS[unit] and size % UNITS[unit] == 0:
+            return "%d%s" % (size // UNITS[unit], unit)
+    return str(size)
+
+
+def sample(line, size):
+    """Text of about size characters made of numbered lines"""
+    block = "\n".join(line(i) for i in range(1000)) + "\n"
+    text = block * (size // len(block) + 1)
+    end = text.rfind("\n", 0, size)
+    return text[:end] if end > 0 else text[:text.find("\n")]
+
+
+def selections(text, count):
+    """Split text into up to count selections of whole lines"""
+    step = len(text) // count
+    regions = []
+    begin = 0
+    for i in range(1, count + 1):
+        end = text.find("\n", max(i * step, begin + 1))
+        if i == count or end == -1:
+            end = len(text)
+        regions.append((begin, end))
+        begin = end + 1
+        if begin >= len(text):
+            break
+    return regions
+
+
+def measure(run, setup=None):
+    """Best of a few runs of run(setup()), timing run only"""
+    times = []
+    while len(times) < MAX_REPEAT and (not times or sum(times) < MIN_TIME):
+        state = setup() if setup else None
+        start = time.perf_counter()
+        run(state)
+        times.append(time.perf_counter() - start)
+    return min(times), len(times)
+
+
+def package_module(name):
+    return importlib.import_module("%s.%s" % (PACKAGE, name))
+
+
+def load_plugin():
+    """Import the package under its installed name with plugin.py loaded
+    as the editor would"""
+    directory = tempfile.mkdtemp()
+    os.mkdir(os.path.join(directory, PACKAGE))
+    sublime.PACKAGES_PATH = directory
+    sublime.load_settings("TextTransmute.sublime-settings").update(
+        {"warm_up": False})
+    spec = importlib.util.spec_from_file_location(
+        PACKAGE, os.path.join(ROOT, "__init__.py"),
+        submodule_search_locations=[ROOT])
+    package = importlib.util.module_from_spec(spec)
+    sys.modules[PACKAGE] = package
+    spec.loader.exec_module(package)
+    plugin = importlib.import_module(PACKAGE + ".plugin")
+    plugin.plugin_loaded()
+    return plugin, directory
+
+
+class Suite(object):
+
+    def __init__(self, plugin, sizes, region_counts, names=None):
+        self.plugin = plugin
+        self.sizes = sizes
+        self.region_counts = region_counts
+        self.names = names
+        self.results = {}
+        self.texts = {}
+        self.resolve = package_module("commands").REGISTRY.resolve
+        self.compile_pipeline = package_module("pipeline").compile_pipeline
+
+    def selected(self, name):
+        return not self.names or any(x in name for x in self.names)
+
+    def text(self, line, size):
+        key = (line, size)
+        if key not in self.texts:
+            self.texts.clear()
+            self.texts[key] = sample(line, size)
+        return self.texts[key]
+
+    def record(self, name, chars, regions, run, setup=None):
+        try:
+            seconds, repeat = measure(run, setup)
+        except BenchmarkError as e:
+            print("%-40s failed: %s" % (name, e))
+            return
+        result = {"seconds": seconds, "repeat": repeat, "chars": chars,
+                  "regions": regions,
+                  "mb_per_s": chars / seconds / (1 << 20) if seconds else 0}
+        self.results[name] = result
+        print("%-40s %10.3fms %10.1f MB/s" % (name, seconds * 1000,
+                                              result["mb_per_s"]))
+
+    def transmutations(self):
+        for name, user_input, line, limit in TRANSMUTATIONS:
+            for size in self.sizes:
+                case = "transmute/%s/%s" % (name, format_size(size))
+                if (limit and size > parse_size(limit)
+                        or not self.selected(case)):
+                    continue
+                text = self.text(line, size) if line else ""
+                errors = ErrorRecorder()
+                pipeline = self.compile_pipeline(
+                    user_input.replace("{count}", str(size // 8)),
+                    self.resolve, errors)
+
+                def run(state, pipeline=pipeline, text=text, errors=errors):
+                    for chunk in pipeline.run_chunks(text, META):
+                        pass
+                    if errors.errors:
+                        raise BenchmarkError(errors.errors[0])
+
+                self.record(case, size, 1, run,
+                            self.plugin.MARKDOWN_CACHE.clear)
+
+    def commands(self):
+        for name, user_input, line in COMMANDS:
+            for size in self.sizes:
+                for count in self.region_counts:
+                    case = "command/%s/%s/x%d" % (name, format_size(size),
+                                                  count)
+                    if (size // count < MIN_REGION_CHARS
+                            or not self.selected(case)):
+                        continue
+                    text = self.text(line, size)
+                    regions = selections(text, count)
+                    self.record(case, size, len(regions),
+                                *self.command_case(user_input, text,
+                                                   regions))
+
+    def command_case(self, user_input, text, regions):
+
+        def setup():
+            view = sublime.View(text, regions, META)
+            sublime.active_window().set_view(view)
+            del sublime.ERRORS[:]
+            return view
+
+        def run(view):
+            view.run_command("text_transmute_parse",
+                             {"user_input": user_input})
+            sublime.run_until_idle()
+            view.flush()
+            if sublime.ERRORS:
+                raise BenchmarkError(sublime.ERRORS[0])
+
+        return run, setup
+
+    def http(self):
+        server, url = package_module("transport").serve_locally()
+        try:
+            errors = ErrorRecorder()
+            pipeline = self.compile_pipeline("http get", self.resolve, errors)
+            body = urls(0).replace("{url}", url)
+
+            def run(state):
+                pipeline.run(body, META)
+                if errors.errors:
+                    raise BenchmarkError(errors.errors[0])
+
+            if self.selected("transmute/http"):
+                self.record("transmute/http", len(body), 1, run)
+            for count in self.region_counts:
+                case = "command/http/x%d" % count
+                if count > HTTP_MAX_REGIONS or not self.selected(case):
+                    continue
+                text = "\n".join(urls(i).replace("{url}", url)
+                                 for i in range(count))
+                regions = selections(text, count)
+                self.record(case, len(text), len(regions),
+                            *self.command_case("http get", text, regions))
+        finally:
+            server.shutdown()
+            server.server_close()
+
+
+def compare(results, baseline, threshold):
+    """Return the cases of results slower than in baseline by more than
+    threshold, as (name, baseline seconds, seconds)"""
+    regressions = []
+    for name, result in sorted(results.items()):
+        before = baseline.get(name)
+        if before is None or before["seconds"] < MIN_COMPARED:
+            continue
+        if result["seconds"] > before["seconds"] * (1 + threshold):
+            regressions.append((name, before["seconds"], result["seconds"]))
+    return regressions
+
+
+def environment():
+    return {"python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpus": multiprocessing.cpu_count(),
+            "date": time.strftime("%Y-%m-%dT%H:%M:%S")}
+
+
+def write_json(path, data):
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(data, f, indent=2, sort_keys=True)
+        f.write("\n")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Benchmark TextTransmute transmutations and commands")
+    parser.add_argument("names", nargs="*",
+                        help="only run cases whose name contains any of "
+                             "these, e.g. swap or command/")
+    parser.add_argument("--sizes", default=None,
+                        help="selection sizes, default %s" % SIZES)
+    parser.add_argument("--regions", default=None,
+                        help="selection counts, default %s" % REGION_COUNTS)
+    parser.add_argument("--quick", action="store_true",
+                        help="only sizes %s and counts %s" %
+                             (QUICK_SIZES, QUICK_REGION_COUNTS))
+    parser.add_argument("--output", default=RESULTS,
+                        help="where to write results, default %(default)s")
+    parser.add_argument("--baseline", default=BASELINE,
+                        help="results to compare against, "
+                             "default %(default)s")
+    parser.add_argument("--save-baseline", action="store_true",
+                        help="save results as the baseline")
+    parser.add_argument("--threshold", type=float, default=THRESHOLD,
+                        help="fraction a case may be slower than in the "
+                             "baseline, default %(default)s")
+    args = parser.parse_args(argv)
+
+    sizes = args.sizes or (QUICK_SIZES if args.quick else SIZES)
+    counts = args.regions or (QUICK_REGION_COUNTS if args.quick
+                              else REGION_COUNTS)
+    plugin, directory = load_plugin()
+    try:
+        suite = Suite(plugin,
+                      [parse_size(x) for x in sizes.split(",")],
+                      [int(x) for x in counts.split(",")],
+                      args.names)
+        suite.transmutations()
+        suite.commands()
+        suite.http()
+    finally:
+        plugin.plugin_unloaded()
+        shutil.rmtree(directory, ignore_errors=True)
+
+    data = {"environment": environment(), "results": suite.results}
+    write_json(args.output, data)
+    print("results written to %s" % args.output)
+    if args.save_baseline:
+        write_json(args.baseline, data)
+        print("baseline saved to %s" % args.baseline)
+        return 0
+    if not os.path.exists(args.baseline):
+        return 0
+
+    with open(args.baseline, encoding="utf-8") as f:
+        baseline = json.load(f)["results"]
+    regressions = compare(suite.results, baseline, args.threshold)
+    for name, before, after in regressions:
+        print("REGRESSION %-40s %10.3fms -> %10.3fms (%+.0f%%)" %
+              (name, before * 1000, after * 1000,
+               (after / before - 1) * 100))
+    if regressions:
+        return 1
+    print("no regressions beyond %.0f%% against %s" %
+          (args.threshold * 100, args.baseline))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
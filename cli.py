@@ -0,0 +1,301 @@
+import io
+import os
+import sys
+import shutil
+import tempfile
+import unittest
+import multiprocessing
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from itertools import islice
+
+try:
+    from .commands import REGISTRY
+    from .pipeline import compile_pipeline, batches, InvalidTransmutation
+    from .executor import execution_mode, process_pool
+    from . import custom
+except (ImportError, ValueError, SystemError):
+    from commands import REGISTRY
+    from pipeline import compile_pipeline, batches, InvalidTransmutation
+    from executor import execution_mode, process_pool
+    import custom
+
+PROG = "python -m TextTransmute"
+PENDING_PER_WORKER = 2
+
+
+def main(argv=None, stdin=None, stdout=None):
+    """Run a pipeline over files or standard input, return the exit status
+
+    Pipelines are written as in the editor, with every command of
+    commands.py and custom.py available, and run over each file as a
+    whole selection. The newline ending a file is kept out of the
+    selection and put back after the result.
+    """
+    # imported on first use since the editor loads this module too
+    import argparse
+
+    parser = argparse.ArgumentParser(
+        prog=PROG,
+        description="Run a TextTransmute pipeline over files or standard "
+                    "input, e.g. %s 'swap a b | filter x' notes.txt" % PROG)
+    parser.add_argument("pipeline", help="transmutation to run")
+    parser.add_argument("files", nargs="*",
+                        help="files to transmute, standard input if none")
+    parser.add_argument("-i", "--in-place", action="store_true",
+                        help="write results back to the files")
+    parser.add_argument("-j", "--jobs", type=int, default=0,
+                        help="files transmuted at once, 0 for one per cpu")
+    args = parser.parse_args(argv)
+    stdin = stdin or sys.stdin
+    stdout = stdout or sys.stdout
+
+    errors = ErrorCounter()
+    try:
+        pipeline = compile_pipeline(args.pipeline, REGISTRY.resolve, errors)
+    except InvalidTransmutation as e:
+        print("%s: %s is not a command" % (PROG, e), file=sys.stderr)
+        return 2
+    except Exception as e:
+        print("%s: %s" % (PROG, str(e) or type(e).__name__),
+              file=sys.stderr)
+        return 2
+
+    if not args.files:
+        if args.in_place:
+            parser.error("--in-place needs files to write to")
+        try:
+            transmute_file(pipeline, stdin, stdout, stream_meta())
+        except Exception as e:
+            print("%s: %s" % (PROG, str(e) or type(e).__name__),
+                  file=sys.stderr)
+            return 1
+        return 1 if errors.count else 0
+
+    failed = 0
+    for path, output, error in run_files(args.pipeline, args.files,
+                                         args.in_place, args.jobs, stdout):
+        if error is not None:
+            failed += 1
+            print("%s: %s: %s" % (PROG, path, error), file=sys.stderr)
+        elif output is not None:
+            stdout.write(output)
+    return 1 if failed else 0
+
+
+def run_files(user_input, paths, in_place=False, jobs=0, out=None):
+    """Transmute every file, yielding (path, output, error) in order
+
+    Files are spread over a pool of workers as the executor would spread
+    selections, with no more than a couple of files per worker pending
+    at any time so memory stays bounded however many files there are.
+    Files run inline are streamed to out if given. Output is None when
+    written in place or to out, error None on success.
+    """
+    pipeline = compile_pipeline(user_input, REGISTRY.resolve)
+    mode = execution_mode(pipeline)
+    workers = jobs or multiprocessing.cpu_count()
+    if workers < 2 or len(paths) < 2 or mode == "inline":
+        for path in paths:
+            yield run_file(user_input, path, in_place, out)
+        return
+
+    if mode == "process":
+        pool = process_pool(workers)
+    else:
+        pool = ThreadPoolExecutor(workers)
+    with pool:
+        pending = deque()
+        paths = iter(paths)
+        for path in islice(paths, workers * PENDING_PER_WORKER):
+            pending.append(pool.submit(run_file, user_input, path, in_place))
+        while pending:
+            result = pending.popleft().result()
+            for path in islice(paths, 1):
+                pending.append(pool.submit(run_file, user_input, path,
+                                           in_place))
+            yield result
+
+
+def run_file(user_input, path, in_place=False, out=None):
+    """Transmute a single file, catching whatever goes wrong
+
+    The result is written to out as it is generated if given, so what
+    was written before an error stays written.
+    """
+    try:
+        # every file gets its own transmutation instances, as it may
+        # run in a thread alongside others
+        pipeline = compile_pipeline(user_input, REGISTRY.resolve,
+                                    ErrorCounter(path))
+        meta = file_meta(path)
+        with open(path, "r", encoding="utf-8") as f:
+            if in_place:
+                replace_file(path, lambda out: transmute_file(pipeline, f,
+                                                              out, meta))
+                return path, None, None
+            if out is not None:
+                transmute_file(pipeline, f, out, meta)
+                return path, None, None
+            buffer = io.StringIO()
+            transmute_file(pipeline, f, buffer, meta)
+            return path, buffer.getvalue(), None
+    except Exception as e:
+        return path, None, str(e) or type(e).__name__
+
+
+def transmute_file(pipeline, f, out, meta=None):
+    """Run pipeline over the contents of f, writing the result to out
+
+    Pipelines made of line local stages read and write a batch of lines
+    at a time, anything else reads the whole file and writes the result
+    as it is generated.
+    """
+    if pipeline.line_local:
+        reader = LineReader(f)
+        chunks = batches(pipeline.run_lines(iter(reader), meta))
+    else:
+        body = f.read()
+        reader = LineReader(None)
+        if body.endswith("\n"):
+            reader.terminated = True
+            body = body[:-1]
+        chunks = pipeline.run_chunks(body, meta)
+    written = False
+    for chunk in chunks:
+        if chunk:
+            out.write(chunk)
+            written = True
+    if written and reader.terminated:
+        out.write("\n")
+
+
+class LineReader(object):
+    """Lines of a file as the lines of a selection holding all of it
+
+    The newline ending the file, if any, is not part of the selection,
+    terminated tells whether there was one once the file has been read.
+    """
+
+    def __init__(self, f):
+        self.f = f
+        self.terminated = False
+
+    def __iter__(self):
+        empty = True
+        for line in self.f:
+            empty = False
+            self.terminated = line.endswith("\n")
+            yield line[:-1] if self.terminated else line
+        if empty:
+            yield ""
+
+
+class ErrorCounter(object):
+    """Error module printing transmutation errors to standard error"""
+
+    def __init__(self, path=None):
+        self.path = path
+        self.count = 0
+
+    def display_err(self, message):
+        self.count += 1
+        if self.path:
+            message = "%s: %s" % (self.path, message)
+        print("%s: %s" % (PROG, message), file=sys.stderr)
+
+
+def replace_file(path, write):
+    """Replace path with what write(out) writes, without ever leaving it
+    half written"""
+    directory = os.path.dirname(os.path.abspath(path))
+    fd, temp_path = tempfile.mkstemp(dir=directory, suffix=".tmp")
+    try:
+        with os.fdopen(fd, "w", encoding="utf-8") as out:
+            write(out)
+        shutil.copymode(path, temp_path)
+        os.replace(temp_path, path)
+    except Exception:
+        os.remove(temp_path)
+        raise
+
+
+def file_meta(path):
+    """Variables describing path, as the editor provides for a view"""
+    path = os.path.abspath(path)
+    file_name = os.path.basename(path)
+    base_name, extension = os.path.splitext(file_name)
+    return {"file": path,
+            "file_path": os.path.dirname(path),
+            "file_name": file_name,
+            "file_base_name": base_name,
+            "file_extension": extension[1:],
+            "folder": os.getcwd()}
+
+
+def stream_meta():
+    return {"folder": os.getcwd()}
+
+
+class TestCli(unittest.TestCase):
+    """Unit test for the command line runner"""
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.stderr = sys.stderr
+        sys.stderr = io.StringIO()
+
+    def tearDown(self):
+        sys.stderr = self.stderr
+        shutil.rmtree(self.directory)
+
+    def write(self, name, text):
+        path = os.path.join(self.directory, name)
+        with open(path, "w", encoding="utf-8") as f:
+            f.write(text)
+        return path
+
+    def read(self, path):
+        with open(path, encoding="utf-8") as f:
+            return f.read()
+
+    def run_main(self, argv, text=""):
+        out = io.StringIO()
+        status = main(argv, io.StringIO(text), out)
+        return status, out.getvalue()
+
+    def test_stdin(self):
+        self.assertEqual(self.run_main(["swap a x | filter x"],
+                                       "ab\ncd\naa\n"),
+                         (0, "xb\nxx\n"))
+        self.assertEqual(self.run_main(["filter z"], "ab\n"), (0, ""))
+        self.assertEqual(self.run_main(["compress"], "a\nb"), (0, "a b"))
+        self.assertEqual(self.run_main(["mklist 1 4"]), (0, "1\n2\n3\n4"))
+        self.assertEqual(self.run_main(["swap a"], "a"), (1, "a"))
+        self.assertEqual(self.run_main(["nope"], "a"), (2, ""))
+        self.assertEqual(self.run_main(["swap `1/0` b"], "a"), (2, ""))
+        self.assertEqual(self.run_main(["expand x"], "a\n"), (1, ""))
+        self.assertIn("%s: invalid literal" % PROG, sys.stderr.getvalue())
+
+    def test_files(self):
+        paths = [self.write("%d.txt" % i, "a%d\nb\n" % i) for i in range(5)]
+        expected = "".join("x%d\nb\n" % i for i in range(5))
+        self.assertEqual(self.run_main(["swap a x"] + paths), (0, expected))
+        self.assertEqual(self.run_main(["-j", "2", "swap a x"] + paths),
+                         (0, expected))
+        status, output = self.run_main(["-j", "2", "rev"] + paths[:2] +
+                                       [os.path.join(self.directory, "no")])
+        self.assertEqual((status, output), (1, "b\n0a\nb\n1a\n"))
+        out = io.StringIO()
+        self.assertEqual(list(run_files("swap a x", paths[:2], out=out)),
+                         [(path, None, None) for path in paths[:2]])
+        self.assertEqual(out.getvalue(), "x0\nb\nx1\nb\n")
+
+    def test_in_place(self):
+        paths = [self.write("%d.py" % i, "a b\n") for i in range(3)]
+        self.assertEqual(self.run_main(["-i", "-j", "2", "map"] + paths),
+                         (0, ""))
+        for path in paths:
+            self.assertEqual(self.read(path), 'a = {\n    "b": ""\n}\n')
+        self.assertEqual(sorted(os.listdir(self.directory)),
+                         ["0.py", "1.py", "2.py"])
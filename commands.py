@@ -1,21 +1,153 @@
+import os
+import time
+import math
 import getopt
 import unittest
 import ast
 import operator as op
 import textwrap
 import re
-import string
-import requests
-import markdown
-from bs4 import BeautifulSoup
+import shutil
+import tempfile
+import inspect
+from json.encoder import encode_basestring
+from functools import lru_cache
+from collections import OrderedDict, namedtuple
+
+try:
+    from .loadtime import load_timer
+except (ImportError, ValueError, SystemError):
+    from loadtime import load_timer
+
+_loaded = load_timer("commands")
+
+try:
+    from .transport import TRANSPORT, serve_locally
+    from .httpcache import HTTP_CACHE
+    from .mdcache import MARKDOWN_CACHE
+    from .tokenizer import tokenize, strip_quotes
+except (ImportError, ValueError, SystemError):
+    from transport import TRANSPORT, serve_locally
+    from httpcache import HTTP_CACHE
+    from mdcache import MARKDOWN_CACHE
+    from tokenizer import tokenize, strip_quotes
+
+
+# Command Registry
+
+CommandInfo = namedtuple("CommandInfo", ["name", "aliases", "doc",
+                                         "shortopts", "longopts", "pure",
+                                         "line_local", "io_bound", "chunked",
+                                         "transmutation"])
+
+
+class Registry(object):
+    """Index of transmutation commands by name and alias
+
+    Every Transmutation subclass is registered once it is defined, a
+    later class registered under the same name, such as a reloaded custom
+    command, replaces the earlier one in place. Listeners are called with
+    the new CommandInfo on every registration.
+    """
 
-class Transmutation(object):
+    def __init__(self):
+        self.commands = OrderedDict()
+        self.names = {}
+        self.listeners = []
+        self.items = None
+
+    def register(self, transmutation):
+        info = CommandInfo(transmutation.command,
+                           tuple(a.lower() for a in
+                                 getattr(transmutation, "aliases", ())),
+                           inspect.getdoc(transmutation) or "",
+                           getattr(transmutation, "shortopts", ""),
+                           list(getattr(transmutation, "longopts", [])),
+                           getattr(transmutation, "pure", False),
+                           getattr(transmutation, "line_local", False),
+                           getattr(transmutation, "io_bound", False),
+                           getattr(transmutation, "chunked", False),
+                           transmutation)
+        previous = self.commands.get(info.name)
+        if previous is not None:
+            for alias in previous.aliases:
+                self.names.pop(alias, None)
+        self.commands[info.name] = info
+        self.names[info.name] = info
+        for alias in info.aliases:
+            self.names[alias] = info
+        self.items = None
+        for listener in list(self.listeners):
+            listener(info)
+        return transmutation
+
+    def lookup(self, command_name):
+        """Return CommandInfo registered under name or alias, or None"""
+        return self.names.get(command_name.lower())
+
+    def resolve(self, command_name):
+        """Return transmutation class invoked by command name, or None"""
+        info = self.names.get(command_name.lower())
+        return info.transmutation if info is not None else None
+
+    def quick_panel_items(self):
+        """Return [name, description] pairs listing every command"""
+        if self.items is None:
+            self.items = ([["...", "New Blank Transmutation"]] +
+                          [[info.name, info.doc]
+                           for info in self.commands.values()])
+        return self.items
+
+    def add_listener(self, listener):
+        self.listeners.append(listener)
+
+    def remove_listener(self, listener):
+        if listener in self.listeners:
+            self.listeners.remove(listener)
+
+
+REGISTRY = Registry()
+
+
+class Registered(type):
+    """Metaclass registering every transmutation as a command"""
+
+    def __init__(cls, name, bases, namespace):
+        super(Registered, cls).__init__(name, bases, namespace)
+        if "command" not in namespace:
+            cls.command = name.lower()
+        if "aliases" not in namespace:
+            cls.aliases = ()
+        REGISTRY.register(cls)
+
+
+class Transmutation(object, metaclass=Registered):
     """Transmutation example and help"""
 
+    # Name invoking the command, the lowercase class name by default,
+    # and other names it can be invoked by
+    command = "transmutation"
+    aliases = ()
+
+    # Option spec handed to getopt
+    shortopts = 'hv'
+    longopts = ["help", "version"]
+
+    # Transmutes each line independently, see transmute_lines
+    line_local = False
+    # Depends on nothing but its input, so it can run in another process
+    pure = False
+    # Waits on the network, so it can run in another thread
+    io_bound = False
+    # Produces its output a chunk at a time, see transmute_chunks
+    chunked = False
+
+    _opts_key = None
+    _opts = None
+
     def __init__(self, error_module=None):
         self.body = None
         self.error_module = error_module
-        self.command = self.__class__.__name__.lower()
 
     def display_err(self, message):
         if self.error_module:
@@ -23,6 +155,21 @@ class Transmutation(object):
         else:
             print(message)
 
+    def getopt(self, params):
+        """Parse params against the option spec, reusing the last result"""
+        key = tuple(params or ())
+        if key != self._opts_key:
+            self._opts = getopt.getopt(list(key), self.shortopts, self.longopts)
+            self._opts_key = key
+        return self._opts
+
+    def __getstate__(self):
+        # error modules report to the editor and are left behind when a
+        # transmutation is sent to a worker process
+        state = self.__dict__.copy()
+        state["error_module"] = None
+        return state
+
     def transmute(self, body=None, params=None, meta=None):
         self.body = body
 
@@ -41,9 +188,7 @@ class Transmutation(object):
 
         # Option Parsing
         try:
-            opts, args = getopt.getopt(params,
-                                       'hv',
-                                       ["help", "version"])
+            opts, args = self.getopt(params)
         except getopt.GetoptError as err:
             # will print something like "option -a not recognized"
             self.display_err("%s: %s for %s" % ("Transmutation Error:",
@@ -65,6 +210,39 @@ class Transmutation(object):
         # default
         return default()
 
+    def transmute_lines(self, lines, params=None, meta=None):
+        """Transmute an iterator of lines, yielding the resulting lines
+
+        Only used for transmutations flagged as 'line_local', which by
+        default are applied to every line on its own. Built-in commands
+        override this to stream large selections without building an
+        intermediate copy of the body between piped stages.
+        """
+        for line in lines:
+            yield from iter_lines(str(self.transmute(body=line,
+                                                     params=params,
+                                                     meta=meta)))
+
+    def transmute_chunks(self, body=None, params=None, meta=None):
+        """Yield the output of transmute in chunks adding up to it
+
+        Transmutations with large outputs override this, and set chunked,
+        to hand their output over a chunk at a time so it can be inserted
+        while the rest is still being generated.
+        """
+        yield str(self.transmute(body=body, params=params, meta=meta))
+
+    def estimate(self, size, lines, params=None):
+        """Return the (size, lines) of the output for an input of that
+        many characters and lines, without transmuting anything
+
+        Only has to be roughly right, it is checked against the output
+        budget before transmuting. By default the output is assumed to be
+        about as large as the input, transmutations which can produce far
+        more than they are given override this.
+        """
+        return size, lines
+
 
 class TestTransmutation(unittest.TestCase):
     """Unit test for Transmutation command"""
@@ -78,15 +256,133 @@ class TestTransmutation(unittest.TestCase):
         self.assertEqual(self.t.transmute(''), "\n\n" + desc)
 
 
+class TestRegistry(unittest.TestCase):
+    """Unit test for command registry"""
+
+    def setUp(self):
+        self.registry = Registry()
+        self.registered = []
+        self.registry.add_listener(self.registered.append)
+
+    def test_default(self):
+        self.assertIs(REGISTRY.resolve("Swap"), Swap)
+        self.assertIsNone(REGISTRY.resolve("TestSwap"))
+        self.assertIsNone(REGISTRY.resolve("unittest"))
+        info = REGISTRY.lookup("mklist")
+        self.assertEqual((info.shortopts, info.pure, info.line_local),
+                         ('cp:', True, False))
+        self.assertEqual(REGISTRY.quick_panel_items()[0],
+                         ["...", "New Blank Transmutation"])
+
+    def test_register(self):
+        first = type("First", (object,), {"command": "git blame",
+                                          "aliases": ("Blame",)})
+        second = type("Second", (object,), {"command": "git blame",
+                                            "__doc__": "Blame lines"})
+        self.registry.register(first)
+        self.assertIs(self.registry.resolve("blame"), first)
+        self.registry.register(second)
+        self.assertIs(self.registry.resolve("git blame"), second)
+        self.assertIsNone(self.registry.resolve("blame"))
+        self.assertEqual(self.registry.quick_panel_items()[1:],
+                         [["git blame", "Blame lines"]])
+        self.assertEqual([info.transmutation for info in self.registered],
+                         [first, second])
+
+
 class Expr(Transmutation):
     """Evaluate simple expressions"""
 
+    shortopts = 'l'
+    longopts = ["lines"]
+    pure = True
+
     def transmute(self, body=None, params=None, meta=None):
+
+        # Mutation Case Algorithms
+        def default():
+            try:
+                return eval_expr(body)
+            except UnsafeExpression as err:
+                self.display_err("'%s' %s" % (self.command, str(err)))
+            except Exception:
+                pass
+            return body
+
+        def lines(function=None):
+            # every distinct line is evaluated once, lines that cannot be
+            # an expression are not even parsed
+            split_body = body.split("\n")
+            results = {}
+            for line in split_body:
+                expr = line.strip()
+                if expr in results:
+                    continue
+                results[expr] = None
+                if expr and not NOT_EXPRESSION.search(expr):
+                    try:
+                        result = eval_expr(expr)
+                        if function is not None:
+                            result = function(result)
+                        results[expr] = result
+                    except Exception:
+                        pass
+            return "\n".join(line if results[line.strip()] is None
+                             else str(results[line.strip()])
+                             for line in split_body)
+
+        def template(function):
+            # numbers are every odd part, evaluated as one column
+            split_body = NUMBER_PATTERN.split(body)
+            numbers = split_body[1::2]
+            results = eval_batch(function, [parse_number(x) for x in numbers])
+            split_body[1::2] = [x if result is None else str(result)
+                                for x, result in zip(numbers, results)]
+            return "".join(split_body)
+
+        # Option Parsing
         try:
-            return eval_expr(body)
-        except Exception:
-            pass
-        return body
+            opts, args = self.getopt(params)
+        except getopt.GetoptError as err:
+            # will print something like "option -a not recognized"
+            self.display_err("%s: %s for %s" % ("Transmutation Error:",
+                                                str(err),
+                                                self.command))
+            return body
+
+        # Option Handling
+        by_line = False
+        for o, a in opts:
+            if o in ("-l", "--lines"):
+                by_line = True
+
+        # Arg Handling
+        if args:
+            expr = " ".join(args)
+            if PLACEHOLDER not in expr:
+                self.display_err("'%s' %s: %s" % (self.command,
+                                                  "expression requires "
+                                                  + PLACEHOLDER, expr))
+                return body
+            try:
+                function = compile_expr(expr)
+            except UnsafeExpression as err:
+                self.display_err("'%s' %s" % (self.command, str(err)))
+                return body
+            except Exception:
+                self.display_err("'%s' %s: %s" % (self.command,
+                                                  "invalid expression",
+                                                  expr))
+                return body
+            if by_line:
+                return lines(function)
+            return template(function)
+
+        if by_line:
+            return lines()
+
+        # default
+        return default()
 
 
 class TestExpr(unittest.TestCase):
@@ -101,42 +397,170 @@ class TestExpr(unittest.TestCase):
         self.assertEqual(self.t.transmute("2 * 2"), 4)
         self.assertEqual(self.t.transmute("2 + (2 * 2)"), 6)
 
+    def test_lines(self):
+        self.assertEqual(self.t.transmute("1 + 1\n\nx\n2 ** 3", ["-l"]),
+                         "2\n\nx\n8")
+        self.assertEqual(self.t.transmute("1+1\n 1+1 \n0x10\n1 +", ["-l"]),
+                         "2\n2\n16\n1 +")
+        self.assertEqual(self.t.transmute("x = 1 + 1\n2 * 3\n4",
+                                          ["-l", "{$}", "+", "1"]),
+                         "x = 1 + 1\n7\n5")
+        # lines are evaluated without taking over the expression cache
+        compile_limited.cache_clear()
+        self.t.transmute("\n".join(str(i) for i in range(300)), ["-l"])
+        self.assertEqual(compile_limited.cache_info().currsize, 0)
+
+    def test_template(self):
+        self.assertEqual(self.t.transmute("a 2, b 1.5\nc -1", ["{$}", "*", "2"]),
+                         "a 4, b 3.0\nc -2")
+        self.assertEqual(self.t.transmute("1 0", ["1", "/", "{$}"]), "1.0 0")
+        self.assertEqual(self.t.transmute("1", ["{$}", "+"]), "1")
+        # without {$} the arguments are not a template
+        self.assertEqual(self.t.transmute("a 1\nb 2", ["3"]), "a 1\nb 2")
+
+    def test_compiled(self):
+        compile_limited.cache_clear()
+        for i in range(3):
+            self.assertEqual(compile_expr("{$} * 2")(i), i * 2)
+        self.assertEqual(compile_limited.cache_info().hits, 2)
+        self.assertRaises(TypeError, compile_expr, "x + 1")
+
+    def test_guarded(self):
+        for expr in ("9**9**9", "2**99999999", "(10**3000)*(10**3000)",
+                     "1" + " + 1" * 1000, "-" * 100 + "1"):
+            self.assertRaises(UnsafeExpression, eval_expr, expr)
+        self.assertEqual(self.t.transmute("9**9**9"), "9**9**9")
+        self.assertEqual(eval_expr("2**100"), 1267650600228229401496703205376)
+        limits = ExprLimits(digits=2, depth=None, nodes=None, seconds=None)
+        self.assertRaises(UnsafeExpression, compile_expr("{$} ** 3", limits),
+                          10)
+        limits = limits._replace(digits=None, seconds=-1)
+        self.assertRaises(UnsafeExpression, compile_expr, "2 ** 300", limits)
+        self.assertRaises(UnsafeExpression, compile_expr("{$} * {$}", limits),
+                          2 ** 300)
+        self.assertEqual(compile_expr("{$} * {$}", limits)(3), 9)
+
+    def test_small_values(self):
+        # small numbers skip the guards, larger ints still go through them
+        self.assertEqual(value_bits(ast.parse("x ** x", mode="eval").body,
+                                    EXPR_LIMITS), 5)
+        power = compile_expr("{$} ** {$}")
+        self.assertEqual(power(3), 27)
+        self.assertEqual(power(40), 40 ** 40)
+        self.assertEqual(power(2.5), 2.5 ** 2.5)
+        self.assertEqual(compile_expr("{$} * {$}")(1j), -1)
+        limits = ExprLimits(digits=10, depth=None, nodes=None, seconds=None)
+        self.assertEqual(compile_expr("{$} * {$}", limits)(99999), 99999 ** 2)
+        self.assertRaises(UnsafeExpression, compile_expr("{$} * {$}", limits),
+                          10 ** 6)
+
+    def test_vectorized(self):
+        if not numpy_available():
+            self.skipTest("requires numpy")
+        values = [float(i) for i in range(VECTORIZE_MIN)]
+        self.assertEqual(eval_batch(compile_expr("{$} * 1.08 - 1"), values),
+                         [x * 1.08 - 1 for x in values])
+
 
 class Swap(Transmutation):
     """Replace matched substrings inside a selection"""
 
+    shortopts = 'f:wi'
+    longopts = ["file=", "words", "ignore-case"]
+    line_local = True
+    pure = True
+
     def transmute(self, body=None, params=None, meta=None):
 
         # Mutation Case Algorithms
         def default():
             return body.replace(old_string, new_string)
 
+        def simultaneous():
+            if not words and not ignore_case:
+                return compile_replace(pairs)(body)
+            return compile_swap(pairs, words, ignore_case)(body)
+
         # Option Parsing
         try:
-            opts, args = getopt.getopt(params, '')
-        except getopt.GetoptError as err:
-            # will print something like "option -a not recognized"
+            pairs, words, ignore_case = self.parse_pairs(params, meta)
+        except (getopt.GetoptError, ValueError, OSError) as err:
             self.display_err("%s: %s for %s" % ("Transmutation Error:",
                                                 str(err),
                                                 self.command))
             return body
 
-        # Arg Handling
-        if len(args) > 1:
-            old_string = args[0]
-            new_string = args[1]
+        if len(pairs) == 1 and not words and not ignore_case:
+            old_string, new_string = pairs[0]
+            return default()
+        return simultaneous()
+
+    def transmute_lines(self, lines, params=None, meta=None):
+
+        # Mutation Case Algorithms
+        def default():
+            for line in lines:
+                yield replace(line)
+
+        def multiline():
+            return iter_lines(replace("\n".join(lines)))
+
+        # Option Parsing
+        try:
+            pairs, words, ignore_case = self.parse_pairs(params, meta)
+        except (getopt.GetoptError, ValueError, OSError) as err:
+            self.display_err("%s: %s for %s" % ("Transmutation Error:",
+                                                str(err),
+                                                self.command))
+            return lines
+
+        if len(pairs) == 1 and not words and not ignore_case:
+            old_string, new_string = pairs[0]
+            replace = lambda text: text.replace(old_string, new_string)
+        elif not words and not ignore_case:
+            replace = compile_replace(pairs)
         else:
-            self.display_err("'%s' %s: %s" % (self.command,
-                                              "requires arguments",
-                                              "[old string] [new string]"))
+            replace = compile_swap(pairs, words, ignore_case)
 
+        if any("\n" in old or "\n" in new or not old for old, new in pairs):
+            return multiline()
         return default()
 
+    def parse_pairs(self, params, meta=None):
+        """Return the (old, new) pairs to swap and the matching options
+
+        Pairs are given inline as [old] [new] [old] [new]... and read from
+        a mapping file given with -f, one tab separated pair per line.
+        Only a single inline pair may swap out an empty string.
+        """
+        opts, args = self.getopt(params)
+        pairs = []
+        words = False
+        ignore_case = False
+
+        # Option Handling
+        for o, a in opts:
+            if o in ("-f", "--file"):
+                pairs.extend(read_pairs(swap_path(a, meta)))
+            elif o in ("-w", "--words"):
+                words = True
+            elif o in ("-i", "--ignore-case"):
+                ignore_case = True
+
+        # Arg Handling
+        if len(args) % 2 or not (args or pairs):
+            raise ValueError("requires arguments [old string] [new string]"
+                             " [old string] [new string]...")
+        pairs.extend(zip(args[::2], args[1::2]))
+        if (len(pairs) > 1 or words or ignore_case) and not all(
+                old for old, new in pairs):
+            raise ValueError("can't swap out an empty string")
+        return tuple(pairs), words, ignore_case
+
 
 class TestSwap(unittest.TestCase):
     """Unit test for Swap command"""
 
-    # TODO: Improve tests...
     def setUp(self):
         self.t = Swap()
 
@@ -144,45 +568,124 @@ class TestSwap(unittest.TestCase):
         self.assertEqual(self.t.transmute("a", ["a", "x"]), "x")
         self.assertEqual(self.t.transmute("abc", ["b", "d"]), "adc")
 
+    def test_lines(self):
+        self.assertEqual(list(self.t.transmute_lines(iter(["ab", "b"]),
+                                                     ["b", "c"])),
+                         ["ac", "c"])
+        self.assertEqual(list(self.t.transmute_lines(iter(["a", "b"]),
+                                                     ["a\nb", "c"])),
+                         ["c"])
+        self.assertEqual(list(self.t.transmute_lines(iter(["ab", "ba"]),
+                                                     ["a", "b", "b", "a"])),
+                         ["ba", "ab"])
+
+    def test_pairs(self):
+        # every pair is replaced in the same pass, never in its own output
+        self.assertEqual(self.t.transmute("a b c", ["a", "b", "b", "a"]),
+                         "b a c")
+        self.assertEqual(self.t.transmute("foobar foo",
+                                          ["foo", "1", "foobar", "2"]),
+                         "2 1")
+        self.assertEqual(self.t.transmute("x", ["x", "y", "z"]), "x")
+
+    def test_options(self):
+        self.assertEqual(self.t.transmute("cat catalog Cat",
+                                          ["-w", "cat", "dog"]),
+                         "dog catalog Cat")
+        self.assertEqual(self.t.transmute("cat catalog Cat",
+                                          ["-wi", "cat", "dog"]),
+                         "dog catalog dog")
+        self.assertEqual(self.t.transmute("ab", ["-i", "A", "", "b", "c"]),
+                         "c")
+        self.assertEqual(self.t.transmute("ab", ["-i", "", "c"]), "ab")
+
+    def test_file(self):
+        fd, path = tempfile.mkstemp()
+        with os.fdopen(fd, "w") as f:
+            f.write("# old\tnew\nred\tblue\nblue\tred\n\ngreen\n")
+        try:
+            self.assertEqual(self.t.transmute("red blue green",
+                                              ["-f", path]),
+                             "blue red ")
+            meta = {"file_path": os.path.dirname(path)}
+            self.assertEqual(self.t.transmute("red", ["--file",
+                                                      os.path.basename(path),
+                                                      "red", "pink"], meta),
+                             "pink")
+        finally:
+            os.remove(path)
+
+    def test_compiled(self):
+        pairs = tuple(("name%d" % i, "id%d" % i) for i in range(500))
+        swap = compile_swap(pairs, True, False)
+        self.assertIs(compile_swap(pairs, True, False), swap)
+        self.assertEqual(swap("name1 name10 name499 name500"),
+                         "id1 id10 id499 name500")
+
+    def test_replaced(self):
+        # independent pairs are replaced one by one, others in one scan
+        for pairs in ((("a", "x"), ("b", "y")), (("a", "b"), ("b", "a")),
+                      (("foo", "1"), ("foobar", "2")),
+                      (("ab", ""), ("c", "d")), (("a", ""), ("bc", "d")),
+                      (("x", "y"), ("x", "z"))):
+            for text in ("abc", "bac foobar foo", "abcbc xx", ""):
+                self.assertEqual(compile_replace(pairs)(text),
+                                 compile_swap(pairs)(text))
+        self.assertIsNot(compile_replace((("a", "x"), ("b", "y"))),
+                         compile_swap((("a", "x"), ("b", "y"))))
+        self.assertIs(compile_replace((("a", "b"), ("b", "a"))),
+                      compile_swap((("a", "b"), ("b", "a"))))
+
 class Mklist(Transmutation):
     """Generate alphabetized or numeric lists"""
 
+    shortopts = 'cp:'
+    longopts = ["close", "place="]
+    pure = True
+    chunked = True
+
     def transmute(self, body=None, params=None, meta=None):
+        return "".join(self.transmute_chunks(body, params, meta))
+
+    def transmute_chunks(self, body=None, params=None, meta=None):
 
         self.body = body
         self.params = params
 
-        # Helpers
-        def place(s, placement):
-            return str(placement.replace('{$}', str(s)))
-
         # Option status
         placement = '{$}'
-        range_start = 0
-        range_end = 0
-        range_increment = 1
+        items = range(0)
         seperator = '\n'
         alphabet = False
 
         # Mutation Case Algorithms
         def default():
-            if alphabet:
-                return seperator.join(place(chr(i), placement)
-                       for i in range(range_start, range_end, range_increment))
-            return seperator.join(place(i, placement)
-                   for i in range(range_start, range_end, range_increment))
+            convert = chr if alphabet else str
+            # placement is split once, a single {$} is filled in by
+            # joining every item of a chunk at once
+            parts = placement.split('{$}')
+            if len(parts) == 2:
+                prefix, suffix = parts
+                joiner = suffix + seperator + prefix
+            for i in range(0, len(items), MKLIST_CHUNK):
+                chunk = map(convert, items[i:i + MKLIST_CHUNK])
+                if len(parts) == 2:
+                    output = prefix + joiner.join(chunk) + suffix
+                else:
+                    output = seperator.join(x.join(parts) for x in chunk)
+                yield seperator + output if i else output
 
         # Option Parsing
         try:
-            opts, args = getopt.getopt(self.params,
-                                       'cp:',
-                                       ["close", "place="])
+            opts, args = self.getopt(self.params)
         except getopt.GetoptError as err:
             # will print something like "option -a not recognized"
             self.display_err("%s: %s for %s" % ("Transmutation Error:",
                                                 str(err),
                                                 self.command))
-            return self.body
+            if self.body:
+                yield self.body
+            return
 
         # Option Handling
         for o, a in opts:
@@ -195,27 +698,58 @@ class Mklist(Transmutation):
 
         # Arg Handling
         if len(args) >= 2:
-            try:
-                range_start = int(args[0])
-                range_end = int(args[1]) + 1
-            except ValueError:
-                range_start = ord(args[0])
-                range_end = ord(args[1]) + 1
-                alphabet = True
-            try:
-                range_increment = int(args[2])
-            except IndexError:
-                pass
-            if range_start > range_end:
-                range_increment *= -1
-                range_end -= 2
+            items, alphabet = self.parse_range(args)
         else:
             self.display_err("'%s' %s: %s" % (self.command,
                                               "requires arguments",
                                               "[start] [end]"))
 
         # default
-        return default()
+        yield from default()
+
+    def parse_range(self, args):
+        """Return the range of items from [start] [end] [increment] and
+        whether they are letters"""
+        try:
+            range_start = int(args[0])
+            range_end = int(args[1]) + 1
+            alphabet = False
+        except ValueError:
+            range_start = ord(args[0])
+            range_end = ord(args[1]) + 1
+            alphabet = True
+        try:
+            range_increment = int(args[2])
+        except IndexError:
+            range_increment = 1
+        if range_start > range_end:
+            range_increment *= -1
+            range_end -= 2
+        return range(range_start, range_end, range_increment), alphabet
+
+    def estimate(self, size, lines, params=None):
+        try:
+            opts, args = self.getopt(params)
+            items, alphabet = self.parse_range(args)
+        except (getopt.GetoptError, IndexError, TypeError, ValueError):
+            return size, lines
+        if not items:
+            return 0, 1
+        placement = '{$}'
+        seperator = 1
+        for o, a in opts:
+            if o in ("-c", "--close"):
+                seperator = 0
+            elif o in ("-p", "--place"):
+                placement = a if '{$}' in a else a + '{$}'
+        # every item as wide as the widest of the first and last
+        width = 1 if alphabet else max(len(str(items[0])),
+                                       len(str(items[-1])))
+        slots = placement.count('{$}')
+        item = len(placement) - 3 * slots + width * slots
+        count = len(items)
+        return (count * (item + seperator) - seperator,
+                count if seperator else 1)
 
 
 class TestMklist(unittest.TestCase):
@@ -231,12 +765,42 @@ class TestMklist(unittest.TestCase):
         self.assertEqual(self.t.transmute("", ["-c", "1", "5"]), "12345")
         self.assertEqual(self.t.transmute("", ["-p", "{$}.", "1", "3"]),
                                           "1.\n2.\n3.")
+        self.assertEqual(self.t.transmute("", ["-p", "{$}{$}", "3", "1"]),
+                         "33\n22\n11")
+
+    def test_chunks(self):
+        end = MKLIST_CHUNK * 2 + 5
+        chunks = list(self.t.transmute_chunks("", ["-p", "<{$}>", "1",
+                                                   str(end)]))
+        self.assertEqual(len(chunks), 3)
+        self.assertEqual("".join(chunks),
+                         "\n".join("<%d>" % i for i in range(1, end + 1)))
+
+    def test_estimate(self):
+        for params in (["1", "5"], ["a", "d"], ["-c", "1", "5"],
+                       ["-p", "{$}.", "1", "3"], ["-p", "<{$}{$}>", "3", "1"],
+                       ["1", "9", "2"], ["7", "7"]):
+            output = self.t.transmute("", params)
+            self.assertEqual(self.t.estimate(0, 1, params),
+                             (len(output), output.count("\n") + 1))
+        size, lines = self.t.estimate(0, 1, ["1", "100000000"])
+        self.assertEqual(lines, 100000000)
+        self.assertGreater(size, 800000000)
+        self.assertEqual(self.t.estimate(3, 1, ["1"]), (3, 1))
 
 
 class Dupl(Transmutation):
     """Duplicate selection n times"""
 
+    shortopts = 'c'
+    longopts = ["close"]
+    pure = True
+    chunked = True
+
     def transmute(self, body=None, params=None, meta=None):
+        return "".join(self.transmute_chunks(body, params, meta))
+
+    def transmute_chunks(self, body=None, params=None, meta=None):
 
         # Option status
         newline = '\n'
@@ -244,19 +808,25 @@ class Dupl(Transmutation):
 
         # Mutation Case Algorithms
         def default():
-            return ((body + newline) * int(multiplier))
+            copy = body + newline
+            remaining = int(multiplier)
+            # as many copies per chunk as fit in about DUPL_CHUNK
+            step = max(1, DUPL_CHUNK // max(1, len(copy)))
+            while remaining > 0:
+                yield copy * min(step, remaining)
+                remaining -= step
 
         # Option Parsing
         try:
-            opts, args = getopt.getopt(params,
-                                       'c',
-                                       ["close"])
+            opts, args = self.getopt(params)
         except getopt.GetoptError as err:
             # will print something like "option -a not recognized"
             self.display_err("%s: %s for %s" % ("Transmutation Error:",
                                                 str(err),
                                                 self.command))
-            return self.body
+            if body:
+                yield body
+            return
 
         # Option Handling
         for o, a in opts:
@@ -268,7 +838,17 @@ class Dupl(Transmutation):
             multiplier = args[0]
 
         # default
-        return default()
+        yield from default()
+
+    def estimate(self, size, lines, params=None):
+        try:
+            opts, args = self.getopt(params)
+            multiplier = max(0, int(args[0])) if args else 2
+        except (getopt.GetoptError, ValueError):
+            return size, lines
+        if opts:
+            return size * multiplier, (lines - 1) * multiplier + 1
+        return (size + 1) * multiplier, lines * multiplier + 1
 
 
 class TestDupl(unittest.TestCase):
@@ -282,22 +862,44 @@ class TestDupl(unittest.TestCase):
         self.assertEqual(self.t.transmute("a"), "a\na\n")
         self.assertEqual(self.t.transmute("a", ["-c"]), "aa")
 
+    def test_chunks(self):
+        body = "x" * (DUPL_CHUNK // 3)
+        chunks = list(self.t.transmute_chunks(body, ["7"]))
+        self.assertEqual(len(chunks), 4)
+        self.assertEqual("".join(chunks), (body + "\n") * 7)
+        self.assertEqual(list(self.t.transmute_chunks("a", ["0"])), [])
+
+    def test_estimate(self):
+        for params in ([], ["-c"], ["5"], ["-c", "3"]):
+            output = self.t.transmute("ab\nc", params)
+            self.assertEqual(self.t.estimate(4, 2, params),
+                             (len(output), output.count("\n") + 1))
+        self.assertEqual(self.t.estimate(4, 2, ["x"]), (4, 2))
+
 
 class Strip(Transmutation):
     """Strip a matched pattern out of selection"""
 
+    shortopts = ''
+    longopts = []
+    line_local = True
+    pure = True
+
     def transmute(self, body=None, params=None, meta=None):
+        return "\n".join(self.transmute_lines(iter_lines(body), params, meta))
+
+    def transmute_lines(self, lines, params=None, meta=None):
 
         pattern = ''
 
         try:
-            opts, args = getopt.getopt(params, '')
+            opts, args = self.getopt(params)
         except getopt.GetoptError as err:
             # will print something like "option -a not recognized"
             self.display_err("%s: %s for %s" % ("Transmutation Error:",
                                                 str(err),
                                                 self.command))
-            return body
+            return lines
 
         # Arg Handling
         if args:
@@ -305,11 +907,7 @@ class Strip(Transmutation):
 
         # Mutation Case Algorithms
         def default():
-            output = ''
-            for line in body.split("\n"):
-                output += (line.replace(pattern, "") + "\n")
-            return output.rstrip("\n")
-
+            return trim_trailing(line.replace(pattern, "") for line in lines)
 
         # default
         return default()
@@ -324,23 +922,32 @@ class TestStrip(unittest.TestCase):
 
     def test_default(self):
         self.assertEqual(self.t.transmute("abc", ["b"]), "ac")
+        self.assertEqual(self.t.transmute("ab\nb\nb", ["b"]), "a")
 
 
 class Expand(Transmutation):
     """Expand newline whitespace between lines"""
 
+    shortopts = ''
+    longopts = []
+    line_local = True
+    pure = True
+
     def transmute(self, body=None, params=None, meta=None):
+        return "\n".join(self.transmute_lines(iter_lines(body), params, meta))
+
+    def transmute_lines(self, lines, params=None, meta=None):
 
         multiplier = 1
 
         try:
-            opts, args = getopt.getopt(params, '')
+            opts, args = self.getopt(params)
         except getopt.GetoptError as err:
             # will print something like "option -a not recognized"
             self.display_err("%s: %s for %s" % ("Transmutation Error:",
                                                 str(err),
                                                 self.command))
-            return body
+            return lines
 
         # Arg Handling
         if args:
@@ -348,13 +955,22 @@ class Expand(Transmutation):
 
         # Mutation Case Algorithms
         def default():
-            output = ''
-            for i in body.split("\n"):
-                output += (i+"\n" + (multiplier * "\n"))
-            return output.rstrip("\n")
+            for line in lines:
+                yield line
+                for i in range(multiplier):
+                    yield ""
 
         # default
-        return default()
+        return trim_trailing(default())
+
+    def estimate(self, size, lines, params=None):
+        try:
+            opts, args = self.getopt(params)
+            multiplier = int(args[0]) if args else 1
+        except (getopt.GetoptError, ValueError):
+            return size, lines
+        added = (lines - 1) * max(0, multiplier)
+        return size + added, lines + added
 
 
 class TestExpand(unittest.TestCase):
@@ -367,23 +983,30 @@ class TestExpand(unittest.TestCase):
     def test_default(self):
         self.assertEqual(self.t.transmute("a\na"), "a\n\na")
         self.assertEqual(self.t.transmute("a\na", ["2"]), "a\n\n\na")
+        self.assertEqual(self.t.estimate(3, 2, ["2"]), (5, 4))
 
 
 class Compress(Transmutation):
     """Remove whitespace lines between lines"""
 
+    line_local = True
+    pure = True
+
     def transmute(self, body=None, params=None, meta=None):
+        return "\n".join(self.transmute_lines(iter_lines(body), params, meta))
+
+    def transmute_lines(self, lines, params=None, meta=None):
 
         # Mutation Case Algorithms
         def default():
-            output = ''
-            for line in body.split("\n"):
-                output += (line.rstrip()+" ")
-            return output.rstrip()
+            yield " ".join(line.rstrip() for line in lines).rstrip()
 
         # default
         return default()
 
+    def estimate(self, size, lines, params=None):
+        return size, 1
+
 
 class TestCompress(unittest.TestCase):
     """Unit test for Compress command"""
@@ -399,83 +1022,178 @@ class TestCompress(unittest.TestCase):
 class Filter(Transmutation):
     """Filter for lines that contain a specific string"""
 
+    shortopts = 'eaivn'
+    longopts = ["regex", "all", "ignore-case", "invert", "line-numbers"]
+    line_local = True
+    pure = True
+
     def transmute(self, body=None, params=None, meta=None):
 
+        # Mutation Case Algorithms
+        def default():
+            return "\n".join(self.filter_lines(iter_lines(body), matcher,
+                                               invert, numbered))
+
+        def scan():
+            # search the whole body at once and only split out the
+            # lines holding a match, instead of testing every line
+            spans = matcher.scan(body)
+            if invert:
+                output = []
+                start = 0
+                for begin, end in spans:
+                    if begin > start:
+                        output.append(body[start:begin-1])
+                    start = end + 1
+                if start <= len(body):
+                    output.append(body[start:])
+                return "\n".join(output).rstrip("\n")
+            if numbered:
+                output = []
+                number = 1
+                counted = 0
+                for begin, end in spans:
+                    number += body.count("\n", counted, begin)
+                    counted = begin
+                    output.append("%d:%s" % (number, body[begin:end]))
+                return "\n".join(output)
+            return "\n".join([body[begin:end] for begin, end in spans])
+
         # Option Parsing
         try:
-            opts, args = getopt.getopt(params, '')
-        except getopt.GetoptError as err:
-            # will print something like "option -a not recognized"
+            matcher, invert, numbered = self.parse_matcher(params)
+        except (getopt.GetoptError, ValueError, re.error) as err:
             self.display_err("%s: %s for %s" % ("Transmutation Error:",
                                                 str(err),
                                                 self.command))
             return body
 
-        # Arg Handling
-        if len(args) > 0:
-            pattern = args[0]
-        else:
-            self.display_err("'%s' %s: %s" % (self.command,
-                                              "requires arguments",
-                                              "[pattern]"))
+        if matcher.scannable and not (invert and numbered):
+            return scan()
+        return default()
 
-        # Mutation Case Algorithms
-        def default():
-            output = ''
-            for line in body.split("\n"):
-                if pattern in line:
-                    output += (line + "\n")
-            return output.rstrip("\n")
+    def transmute_lines(self, lines, params=None, meta=None):
 
-        # default
-        return default()
+        # Option Parsing
+        try:
+            matcher, invert, numbered = self.parse_matcher(params)
+        except (getopt.GetoptError, ValueError, re.error) as err:
+            self.display_err("%s: %s for %s" % ("Transmutation Error:",
+                                                str(err),
+                                                self.command))
+            return lines
+
+        return self.filter_lines(lines, matcher, invert, numbered)
+
+    def filter_lines(self, lines, matcher, invert=False, numbered=False):
+        match = matcher.match
+
+        def number_lines():
+            # an empty line when nothing matched, as trim_trailing gives
+            empty = True
+            for number, line in enumerate(trim_trailing(lines), 1):
+                if bool(match(line)) is not invert:
+                    empty = False
+                    yield "%d:%s" % (number, line)
+            if empty:
+                yield ""
+
+        if numbered:
+            return number_lines()
+        if invert:
+            return trim_trailing(line for line in lines if not match(line))
+        return trim_trailing(line for line in lines if match(line))
+
+    def parse_matcher(self, params):
+        """Return the compiled line matcher and output options of params
+
+        Lines are kept if they contain any of the patterns given, or all
+        of them with -a. Patterns are literal unless -e is given.
+        """
+        opts, args = self.getopt(params)
+        regex = False
+        every = False
+        ignore_case = False
+        invert = False
+        numbered = False
+
+        # Option Handling
+        for o, a in opts:
+            if o in ("-e", "--regex"):
+                regex = True
+            elif o in ("-a", "--all"):
+                every = True
+            elif o in ("-i", "--ignore-case"):
+                ignore_case = True
+            elif o in ("-v", "--invert"):
+                invert = True
+            elif o in ("-n", "--line-numbers"):
+                numbered = True
+
+        # Arg Handling
+        if not args:
+            raise ValueError("requires arguments [pattern] (pattern)...")
+        return (compile_filter(tuple(args), regex, every, ignore_case),
+                invert, numbered)
 
 
 class TestFilter(unittest.TestCase):
     """Unit test for Filter command"""
 
-    # TODO: Improve tests...
     def setUp(self):
         self.t = Filter()
 
     def test_default(self):
         self.assertEqual(self.t.transmute("abc\ndef\nc\n", ["de"]), "def")
+        self.assertEqual(self.t.transmute("abc\ndef\nc\n", ["x"]), "")
+
+    def test_lines(self):
+        self.assertEqual(list(self.t.transmute_lines(iter(["ab", "b", "c"]),
+                                                     ["b"])),
+                         ["ab", "b"])
+        self.assertEqual(list(self.t.transmute_lines(iter(["ab", "b", "c"]),
+                                                     ["-vn", "a"])),
+                         ["2:b", "3:c"])
+
+    def test_options(self):
+        body = "GET /a 200\nPOST /b 500\nget /c 404\n\nGET /d 500\n"
+        for params, expected in [
+                (["500", "404"], "POST /b 500\nget /c 404\nGET /d 500"),
+                (["-a", "GET", "500"], "GET /d 500"),
+                (["-i", "get"], "GET /a 200\nget /c 404\nGET /d 500"),
+                (["-e", r"\s[45]\d\d$"],
+                 "POST /b 500\nget /c 404\nGET /d 500"),
+                (["-v", "GET"], "POST /b 500\nget /c 404"),
+                (["-n", "500"], "2:POST /b 500\n5:GET /d 500"),
+                (["-vn", "/"], "4:"),
+                (["-v", ""], "")]:
+            self.assertEqual(self.t.transmute(body, params), expected)
+            self.assertEqual("\n".join(self.t.transmute_lines(
+                iter_lines(body), params)), expected)
+        self.assertEqual(self.t.transmute("a", ["-e", "("]), "a")
+
+    def test_scan(self):
+        matcher = compile_filter(("b", "c"), False, True, False)
+        self.assertIs(compile_filter(("b", "c"), False, True, False), matcher)
+        self.assertTrue(matcher.scannable)
+        self.assertEqual(list(matcher.scan("ab\nbc\ncb\n")), [(3, 5), (6, 8)])
+        self.assertFalse(compile_filter(("a",), True, False, False).scannable)
 
 
 class Map(Transmutation):
     """Generate a language specific map"""
 
+    shortopts = ''
+    longopts = []
+    pure = True
+
     def transmute(self, body=None, params=None, meta=None):
 
-        ws_pattern = re.compile(r'''((?:[^\s"'`]|"[^"]*"|'[^']*'|`[^`]*`)+)''')
         extension = ""
 
-        # Mutation Case Algorithms
-        def format_py(indent):
-            split_body = [x for x in ws_pattern.split(body)[1::2]]
-            leading_ws = " " * (len(body) - len(body.lstrip(' ')))
-            output = leading_ws + split_body[0] + " = {\n";
-            for i in range(1,len(split_body)):
-                if (i % 2 != 0):
-                    output += (leading_ws +
-                               indent +
-                               "\"" +
-                               split_body[i].replace("\"", "\\\"") +
-                               "\": ")
-                else:
-                    output += split_body[i] + "\n"
-            if (len(split_body) % 2 == 0):
-                output += "\"\"\n"
-            output += leading_ws + "}"
-            return output
-
-        def format_js(indent):
-            return "var " + format_py(indent)
-
-
         # Option Parsing
         try:
-            opts, args = getopt.getopt(params, '')
+            opts, args = self.getopt(params)
         except getopt.GetoptError as err:
             # will print something like "option -a not recognized"
             self.display_err("%s: %s for %s" % ("Transmutation Error:",
@@ -486,7 +1204,7 @@ class Map(Transmutation):
         # Arg Handling
         if len(args) > 0:
             extension = args[0]
-        elif "file_extension" in meta:
+        elif meta and "file_extension" in meta:
             extension = meta["file_extension"]
         else:
             self.display_err("'%s' %s: %s" % (self.command,
@@ -494,20 +1212,20 @@ class Map(Transmutation):
                                               "[extension]"))
             return body
 
-        if extension == "py":
-            return format_py("    ")
-        elif extension == "js":
-            return format_js("  ")
-        elif extension == "clj":
-            return format_clj()
-        elif extension == "cljs":
-            return format_clj()
-        else:
+        formatter = MAP_FORMATS.get(extension)
+        if formatter is None:
             self.display_err("%s: '%s' %s" % ("extension",
                                               extension,
                                               "is not supported"))
             return body
 
+        # the name followed by keys and values, tokenized once
+        tokens = tokenize(body)
+        if not tokens:
+            return body
+        leading_ws = body[:LEADING_SPACES.match(body).end()]
+        return formatter(tokens[0], map_pairs(tokens), leading_ws)
+
 
 class TestMap(unittest.TestCase):
     """Unit test for Map class"""
@@ -527,31 +1245,135 @@ class TestMap(unittest.TestCase):
                          "a = {\n    \"b\": 1\n}")
         self.assertEqual(self.t.transmute("a b", ["py"]),
                          "a = {\n    \"b\": \"\"\n}")
+        self.assertEqual(self.t.transmute("a b 1\n'c d' 2 e", ["py"]),
+                         "a = {\n    \"b\": 1,\n    \"c d\": 2,\n"
+                         "    \"e\": \"\"\n}")
+        self.assertEqual(self.t.transmute("a", ["py"]), "a = {}")
+        self.assertEqual(self.t.transmute(" ", ["py"]), " ")
 
     def test_js(self):
         self.assertEqual(self.t.transmute("a b \"c\"", ["js"]),
                          "var a = {\n  \"b\": \"c\"\n}")
+        self.assertEqual(self.t.transmute("a b \"c\"", [],
+                                          {"file_extension": "js"}),
+                         "var a = {\n  \"b\": \"c\"\n}")
+
+    def test_json(self):
+        import json
+        output = self.t.transmute("a b 'c' \"d e\" 1.5 f true g x\\y "
+                                  "'i\"\\' 0 h", ["json"])
+        self.assertEqual(json.loads(output),
+                         {"a": {"b": "c", "d e": 1.5, "f": True,
+                                "g": "x\\y", "i\"\\": 0, "h": ""}})
+        self.assertEqual(self.t.transmute("  a b 1", ["json"]),
+                         '  {\n    "a": {\n      "b": 1\n    }\n  }')
+        self.assertEqual(self.t.transmute("a", ["json"]), '{\n  "a": {}\n}')
+
+    def test_clj(self):
+        self.assertEqual(self.t.transmute("a b \"c\" d 1", ["clj"]),
+                         "(def a\n  {\"b\" \"c\"\n   \"d\" 1})")
+        self.assertEqual(self.t.transmute("a", ["cljs"]), "(def a {})")
+
+    def test_other(self):
+        self.assertEqual(self.t.transmute("a b 1 c 2", ["rb"]),
+                         "a = {\n  \"b\" => 1,\n  \"c\" => 2\n}")
+        self.assertEqual(self.t.transmute("a b 1", ["php"]),
+                         "$a = [\n    \"b\" => 1,\n];")
+        self.assertEqual(self.t.transmute("a b", ["txt"]), "a b")
+
+    def test_large(self):
+        body = "a " + " ".join("k%d %d" % (i, i) for i in range(100000))
+        output = self.t.transmute(body, ["py"])
+        self.assertEqual(output.count("\n"), 100001)
+        self.assertTrue(output.endswith('    "k99999": 99999\n}'))
+
+
+def map_pairs(tokens):
+    """Return the unquoted keys and the value tokens following the name,
+    a missing last value being an empty string"""
+    # strip_quotes inlined, it runs once for every key
+    keys = [key[1:-1] if len(key) > 1 and key[0] == key[-1] and
+            key[0] in ('"', "'") else key for key in tokens[1::2]]
+    values = list(tokens[2::2])
+    if len(values) < len(keys):
+        values.append('""')
+    return keys, values
+
+
+def format_dict(head, tail, indent, separator, trailing=""):
+    """Return a formatter writing the pairs one per line between head and
+    tail, separated by commas"""
+    def formatter(name, pairs, leading_ws):
+        prefix = leading_ws + indent + '"'
+        separator_ = '"' + separator
+        entries = ",\n".join([prefix + key.replace('"', '\\"') +
+                              separator_ + value
+                              for key, value in zip(*pairs)])
+        opening = leading_ws + head % name
+        if not entries:
+            return opening + tail
+        return "%s\n%s%s\n%s%s" % (opening, entries, trailing, leading_ws,
+                                   tail)
+    return formatter
+
+
+def format_clj(name, pairs, leading_ws):
+    entries = ("\n" + leading_ws + "   ").join(
+        ['"' + key.replace('"', '\\"') + '" ' + value
+         for key, value in zip(*pairs)])
+    if not entries:
+        return "%s(def %s {})" % (leading_ws, name)
+    return "%s(def %s\n%s  {%s})" % (leading_ws, name, leading_ws, entries)
+
+
+def format_json(name, pairs, leading_ws):
+    # strings are escaped by the json encoder, numbers and literals kept
+    prefix = leading_ws + "    "
+    entries = ",\n".join([prefix + encode_basestring(key) + ": " +
+                          json_value(value) for key, value in zip(*pairs)])
+    name = encode_basestring(strip_quotes(name))
+    if not entries:
+        return '%s{\n%s  %s: {}\n%s}' % (leading_ws, leading_ws, name,
+                                         leading_ws)
+    return '%s{\n%s  %s: {\n%s\n%s  }\n%s}' % (leading_ws, leading_ws, name,
+                                               entries, leading_ws,
+                                               leading_ws)
+
+
+def json_value(token):
+    if token[:1] in ('"', "'", '`') and token[-1:] == token[:1]:
+        return encode_basestring(token[1:-1])
+    if JSON_LITERAL.match(token):
+        return token
+    return encode_basestring(token)
+
+
+MAP_FORMATS = {
+    "py": format_dict("%s = {", "}", "    ", ": "),
+    "js": format_dict("var %s = {", "}", "  ", ": "),
+    "rb": format_dict("%s = {", "}", "  ", " => "),
+    "php": format_dict("$%s = [", "];", "    ", " => ", trailing=","),
+    "json": format_json,
+    "clj": format_clj,
+    "cljs": format_clj,
+}
 
 
 class Http(Transmutation):
-    """Execute an http request with requests library"""
+    """Execute an http request over a pooled keep-alive session"""
+
+    shortopts = 'cr'
+    longopts = ["cache", "refresh"]
+    io_bound = True
 
     def transmute(self, body=None, params=None, meta=None):
 
         self.body = body
-        ws_pattern = re.compile(r'''((?:[^\s"'`]|"[^"]*"|'[^']*'|`[^`]*`)+)''')
         payload = {}
 
-        # Helpers
-        def strip_quotes(input_string):
-            if ((input_string[0] == input_string[len(input_string)-1])
-                and (input_string[0] in ('"', "'"))):
-                return input_string[1:-1]
-            return input_string
-
         # Option Parsing
         try:
-            opts, args = getopt.getopt(params, '')
+            opts, args = self.getopt(params)
         except getopt.GetoptError as err:
             # will print something like "option -a not recognized"
             self.display_err("%s: %s for %s" % ("Transmutation Error:",
@@ -559,6 +1381,16 @@ class Http(Transmutation):
                                                 self.command))
             return body
 
+        # Option Handling
+        cache = HTTP_CACHE.enabled
+        refresh = False
+        for o, a in opts:
+            if o in ("-c", "--cache"):
+                cache = True
+            elif o in ("-r", "--refresh"):
+                refresh = True
+        cache = cache and HTTP_CACHE.directory is not None
+
         # Arg Handling
         if len(args) > 0:
             method = args[0]
@@ -566,6 +1398,7 @@ class Http(Transmutation):
             self.display_err("'%s' %s: %s" % (self.command,
                                               "requires http verb",
                                               "[method]"))
+            return body
 
         if len(args) > 2:
             url = args[1];
@@ -574,37 +1407,36 @@ class Http(Transmutation):
                     payload[args[i]] = args[i + 1]
         else:
             self.body = self.body.replace("\n", " ")
-            split_body = [strip_quotes(x)
-                          for x in ws_pattern.split(self.body)[1::2]]
+            split_body = [strip_quotes(x) for x in tokenize(self.body)]
             url = split_body[0];
             for i in range(1,len(split_body)):
                 if (i % 2 != 0) and (i < len(split_body) - 1):
                     payload[split_body[i]] = split_body[i + 1]
 
         # Mutation Case Algorithms
+        def send(verb):
+            if cache:
+                return HTTP_CACHE.fetch(TRANSPORT, verb, url, payload,
+                                        refresh)
+            return TRANSPORT.request(verb, url, params=payload).text
+
         def get():
-            r = requests.get(url, params=payload)
-            return r.text
+            return send("GET")
 
         def post():
-            r = requests.post(url, params=payload)
-            return r.text
+            return send("POST")
 
         def put():
-            r = requests.put(url, params=payload)
-            return r.text
+            return send("PUT")
 
         def delete():
-            r = requests.delete(url, params=payload)
-            return r.text
+            return send("DELETE")
 
         def head():
-            r = requests.head(url, params=payload)
-            return r.text
+            return send("HEAD")
 
         def options():
-            r = requests.options(url, params=payload)
-            return r.text
+            return send("OPTIONS")
 
             return body
 
@@ -627,17 +1459,55 @@ class Http(Transmutation):
             return body
 
 
+class TestHttp(unittest.TestCase):
+    """Unit test for Http command"""
+
+    def setUp(self):
+        self.server, self.url = serve_locally()
+        self.t = Http()
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def test_default(self):
+        self.assertEqual(self.t.transmute(self.url + "/a b c", ["get"]),
+                         '{"method": "GET", "path": "/a?b=c"}')
+        self.assertEqual(self.t.transmute("", ["post", self.url, "b", "c"]),
+                         '{"method": "POST", "path": "/?b=c"}')
+
+    def test_cache(self):
+        directory = tempfile.mkdtemp()
+        HTTP_CACHE.configure(directory)
+        HTTP_CACHE.hits = HTTP_CACHE.misses = 0
+        try:
+            self.t.transmute(self.url, ["get"])
+            self.assertEqual(os.listdir(directory), [])
+            for i in range(2):
+                self.assertEqual(self.t.transmute(self.url, ["-c", "get"]),
+                                 '{"method": "GET", "path": "/"}')
+            self.t.transmute(self.url, ["-r", "-c", "get"])
+            self.assertEqual(len(os.listdir(directory)), 1)
+            self.assertEqual((HTTP_CACHE.hits, HTTP_CACHE.misses), (1, 2))
+        finally:
+            HTTP_CACHE.configure(None)
+            shutil.rmtree(directory)
+
+
 class Markdown(Transmutation):
     """Parse markdown into html"""
 
+    shortopts = ''
+    longopts = []
+    pure = True
+
     def transmute(self, body=None, params=None, meta=None):
 
-        r = re.compile(r'^(\s*)', re.MULTILINE)
         indentation = r'\1\1'
 
         # Option Parsing
         try:
-            opts, args = getopt.getopt(params, '')
+            opts, args = self.getopt(params)
         except getopt.GetoptError as err:
             # will print something like "option -a not recognized"
             self.display_err("%s: %s for %s" % ("Transmutation Error:",
@@ -655,19 +1525,8 @@ class Markdown(Transmutation):
                                                   "indent must be number",
                                                   "[indentation]"))
 
-        def default():
-            md = markdown.markdown(body,
-                                   extensions=['markdown.extensions.extra'],
-                                   output_format="xhtml5")
-            soup = BeautifulSoup(md, 'html.parser')
-            punctuation = re.sub('[<>]','',string.punctuation)
-            output = r.sub(indentation, soup.prettify())
-            output = re.sub('(<\w+>)\n\s*([\w\s\n'+punctuation+']*)\n\s*(</\w+>)',
-                            '\\1\\2\\3',
-                            output)
-            return output
-
-        return default()
+        # default, only blocks changed since the last render are rendered
+        return MARKDOWN_CACHE.render(body, indentation)
 
 
 class TestMarkdown(unittest.TestCase):
@@ -683,12 +1542,333 @@ class TestMarkdown(unittest.TestCase):
         self.assertEqual(self.t.transmute("- a b c"),
                          "<ul>\n  <li>a b c</li>\n</ul>")
 
+    def test_cache(self):
+        body = "# Hello World\n\nUnchanged paragraph"
+        self.t.transmute(body)
+        hits = MARKDOWN_CACHE.hits
+        self.assertEqual(self.t.transmute(body + "\n\n- a b c", ["4"]),
+                         "<h1>Hello World</h1>\n<p>Unchanged paragraph</p>\n"
+                         "<ul>\n    <li>a b c</li>\n</ul>")
+        self.assertEqual(MARKDOWN_CACHE.hits, hits)
+        self.t.transmute(body + "\n\nChanged paragraph")
+        self.assertEqual(MARKDOWN_CACHE.hits, hits + 2)
+
 # Helpers
 
+LINE_CHUNK = 1 << 16
+LEADING_SPACES = re.compile(r' *')
+JSON_LITERAL = re.compile(r'(?:-?(?:0|[1-9]\d*)(?:\.\d+)?(?:[eE][+-]?\d+)?'
+                          r'|true|false|null)$')
+MKLIST_CHUNK = 1 << 16
+DUPL_CHUNK = 1 << 20
+EXPR_CACHE_LIMIT = 128
+PATTERN_CACHE_LIMIT = 32
+# pairs swapped from this many on are matched as one pattern
+MULTI_REPLACE_MIN = 64
+SCAN_LITERALS_MAX = 16
+VECTORIZE_MIN = 1024
+PLACEHOLDER = "{$}"
+PLACEHOLDER_NAME = "_value_"
+LOG10_2 = math.log10(2)
+SMALL_BITS = 256
+
+# Most digits of any number computed, deepest nesting and most terms of
+# an expression, and seconds it may take to evaluate
+ExprLimits = namedtuple("ExprLimits", ["digits", "depth", "nodes",
+                                       "seconds"])
+EXPR_LIMITS = ExprLimits(digits=4000, depth=64, nodes=512, seconds=0.5)
+UNLIMITED = ExprLimits(None, None, None, None)
+# anything but digits, operators, parentheses and the letters of hex,
+# octal, binary, exponent and complex literals
+NOT_EXPRESSION = re.compile(r"[^\d\s.+\-*/^()a-fA-FjJoOxX_]")
+NUMBER_PATTERN = re.compile(r'''((?<![\w.])-?\d+(?:\.\d+)?
+                                (?:[eE][-+]?\d+)?(?![\w.]))''', re.VERBOSE)
+
 OPERATORS = {ast.Add: op.add, ast.Sub: op.sub, ast.Mult: op.mul,
              ast.Div: op.truediv, ast.Pow: op.pow, ast.BitXor: op.xor,
              ast.USub: op.neg}
 
+def iter_lines(body, chunk_size=LINE_CHUNK):
+    """Lazily yield the lines of body, as body.split("\\n") would"""
+    start = 0
+    length = len(body)
+    while length - start > chunk_size:
+        end = body.rfind("\n", start, start + chunk_size)
+        if end == -1:
+            end = body.find("\n", start + chunk_size)
+            if end == -1:
+                break
+        yield from body[start:end].split("\n")
+        start = end + 1
+    yield from body[start:].split("\n")
+
+
+def trim_trailing(lines):
+    """Yield lines without trailing empty ones, as rstrip("\\n") would"""
+    pending = 0
+    empty = True
+    for line in lines:
+        if line:
+            for i in range(pending):
+                yield ""
+            pending = 0
+            empty = False
+            yield line
+        else:
+            pending += 1
+    if empty:
+        yield ""
+
+
+@lru_cache(maxsize=PATTERN_CACHE_LIMIT)
+def compile_swap(pairs, words=False, ignore_case=False):
+    """Compile (old, new) pairs into a function replacing all of them at once
+
+    Every match is replaced in a single scan so no pair ever sees the
+    output of another, the longest old string wins where several start
+    at the same place and the last pair wins for duplicate ones. The old
+    strings are matched as a trie, each position only walks as far down
+    it as the text agrees, so the scan stays linear in the text however
+    many pairs there are.
+    """
+    flags = 0
+    if ignore_case:
+        flags = re.IGNORECASE
+        table = dict((old.lower(), new) for old, new in pairs)
+    else:
+        table = dict(pairs)
+    pattern = "(?:%s)" % trie_pattern(table)
+    if words:
+        pattern = r"(?<!\w)%s(?!\w)" % pattern
+    pattern = re.compile(pattern, flags)
+    if ignore_case:
+        lookup = lambda match: table.get(match.group(0).lower(),
+                                         match.group(0))
+    else:
+        lookup = lambda match: table[match.group(0)]
+    return lambda text: pattern.sub(lookup, text)
+
+
+@lru_cache(maxsize=PATTERN_CACHE_LIMIT)
+def compile_replace(pairs):
+    """Compile (old, new) pairs into a function swapping them as
+    compile_swap does, replacing them one by one where that is the same
+
+    A few independent pairs are faster to replace with one str.replace
+    each than by matching an alternation, pairs that overlap one another
+    need the single scan of compile_swap.
+    """
+    if len(pairs) < MULTI_REPLACE_MIN and all(
+            independent(pairs[:i], [pair]) for i, pair in enumerate(pairs)):
+        def replace(text):
+            for old, new in pairs:
+                text = text.replace(old, new)
+            return text
+        return replace
+    return compile_swap(pairs)
+
+
+def overlaps(a, b):
+    """Tell whether occurrences of a and b could share characters"""
+    if not a or not b:
+        return False
+    if a in b or b in a:
+        return True
+    for i in range(1, min(len(a), len(b))):
+        if a.endswith(b[:i]) or b.endswith(a[:i]):
+            return True
+    return False
+
+
+def independent(first, second):
+    """Tell whether two lists of pairs replaced in a row equal a single
+    pass of both"""
+    for old, new in first:
+        for later_old, later_new in second:
+            if overlaps(old, later_old) or overlaps(new, later_old):
+                return False
+            # removing old could join later_old together
+            if not new and len(later_old) > 1:
+                return False
+    return True
+
+
+@lru_cache(maxsize=PATTERN_CACHE_LIMIT)
+def compile_filter(patterns, regex=False, every=False, ignore_case=False):
+    """Compile patterns into a LineMatcher keeping lines that contain any,
+    or every one of them"""
+    if regex:
+        flags = re.IGNORECASE if ignore_case else 0
+        tests = [re.compile(p, flags).search for p in patterns]
+        if len(tests) == 1:
+            match = tests[0]
+        elif every:
+            match = lambda line: all(test(line) for test in tests)
+        else:
+            match = lambda line: any(test(line) for test in tests)
+        return LineMatcher(match)
+
+    literals = tuple(p.lower() for p in patterns) if ignore_case else patterns
+    if every:
+        match = lambda line: all(p in line for p in literals)
+    elif len(literals) == 1:
+        match = lambda line, p=literals[0]: p in line
+    else:
+        match = re.compile(trie_pattern(literals)).search
+    if ignore_case:
+        match = lambda line, match=match: match(line.lower())
+
+    # a literal found anywhere in the body lies within a single line, a
+    # regex could look across lines so only literals are searched for
+    anchor = literals[:1] if every else literals
+    if (len(anchor) > SCAN_LITERALS_MAX
+            or not all(p and "\n" not in p for p in literals)):
+        return LineMatcher(match)
+    return LineMatcher(match, anchor, every and len(literals) > 1,
+                       ignore_case)
+
+
+class LineMatcher(object):
+    """Predicate over lines, able to find matching lines in a whole body
+    when it looks for literals"""
+
+    def __init__(self, match, literals=None, verify=False,
+                 ignore_case=False):
+        self.match = match
+        self.literals = literals
+        self.verify = verify
+        self.ignore_case = ignore_case
+
+    @property
+    def scannable(self):
+        return self.literals is not None
+
+    def scan(self, body):
+        """Yield start and end of every line of body that matches
+
+        Each literal is searched for with str.find, remembering where it
+        next occurs, so only lines holding one are ever looked at.
+        """
+        text = body.lower() if self.ignore_case else body
+        if len(text) != len(body):
+            # lowercasing moved characters, positions would not line up
+            yield from self.scan_lines(body)
+            return
+        literals = self.literals
+        match = self.match
+        verify = self.verify
+        length = len(body)
+        if len(literals) == 1 and not verify:
+            yield from self.scan_literal(body, text, literals[0])
+            return
+        upcoming = [text.find(p) for p in literals]
+        pos = 0
+        while pos <= length:
+            found = length
+            for i, at in enumerate(upcoming):
+                if at != -1 and at < pos:
+                    upcoming[i] = at = text.find(literals[i], pos)
+                if at != -1 and at < found:
+                    found = at
+            if found == length:
+                break
+            begin = body.rfind("\n", pos, found) + 1 or pos
+            end = body.find("\n", found)
+            if end == -1:
+                end = length
+            if not verify or match(body[begin:end]):
+                yield begin, end
+            pos = end + 1
+
+    def scan_literal(self, body, text, literal):
+        find = text.find
+        rfind = body.rfind
+        find_end = body.find
+        length = len(body)
+        pos = 0
+        while True:
+            found = find(literal, pos)
+            if found == -1:
+                return
+            begin = rfind("\n", pos, found) + 1 or pos
+            end = find_end("\n", found)
+            if end == -1:
+                yield begin, length
+                return
+            yield begin, end
+            pos = end + 1
+
+    def scan_lines(self, body):
+        match = self.match
+        length = len(body)
+        pos = 0
+        while pos <= length:
+            end = body.find("\n", pos)
+            if end == -1:
+                end = length
+            if match(body[pos:end]):
+                yield pos, end
+            pos = end + 1
+
+
+def trie_pattern(strings):
+    """Return a regex matching the longest of the non-empty strings
+
+    >>> trie_pattern(["foo", "foobar", "fab"])
+    'f(?:ab|oo(?:bar)?)'
+    """
+    trie = {}
+    for string in strings:
+        node = trie
+        for char in string:
+            node = node.setdefault(char, {})
+        node[""] = {}
+
+    def build(node):
+        prefix = []
+        while len(node) == 1 and "" not in node:
+            (char, node), = node.items()
+            prefix.append(re.escape(char))
+        branches = [re.escape(char) + build(child)
+                    for char, child in sorted(node.items()) if char]
+        if len(branches) > 1:
+            prefix.append("(?:%s)" % "|".join(branches))
+            if "" in node:
+                prefix[-1] += "?"
+        elif branches:
+            prefix.append("(?:%s)?" % branches[0])
+        return "".join(prefix)
+
+    return build(trie)
+
+
+def swap_path(path, meta=None):
+    """Resolve a mapping file path against the directory of the view"""
+    path = os.path.expanduser(path)
+    if not os.path.isabs(path) and meta and meta.get("file_path"):
+        path = os.path.join(meta["file_path"], path)
+    return path
+
+
+def read_pairs(path):
+    """Read (old, new) pairs from a mapping file, once per modification"""
+    status = os.stat(path)
+    return read_pairs_cached(path, status.st_mtime, status.st_size)
+
+
+@lru_cache(maxsize=PATTERN_CACHE_LIMIT)
+def read_pairs_cached(path, mtime, size):
+    pairs = []
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            line = line.rstrip("\r\n")
+            if not line.strip() or line.startswith("#"):
+                continue
+            old, _, new = line.partition("\t")
+            pairs.append((old, new))
+    return tuple(pairs)
+
+
 def eval_expr(expr):
     """
     >>> eval_expr('2^6')
@@ -698,14 +1878,265 @@ def eval_expr(expr):
     >>> eval_expr('1 + 2*3**(4^5) / (6 + -7)')
     -5.0
     """
-    return eval_(ast.parse(expr, mode='eval').body)
+    # evaluated once, kept out of the cache of compiled expressions
+    return build_expr(expr, EXPR_LIMITS)(None)
+
+def compile_expr(expr, limits=None):
+    """Parse expr once into a function of the number standing in for {$}
 
-def eval_(node):
+    The function raises UnsafeExpression rather than computing a number
+    with more digits than limits allow or running past its time limit,
+    expressions too large or deeply nested are refused up front.
+    """
+    return compile_limited(expr, limits or EXPR_LIMITS)
+
+@lru_cache(maxsize=EXPR_CACHE_LIMIT)
+def compile_limited(expr, limits):
+    return build_expr(expr, limits)
+
+def build_expr(expr, limits):
+    tree = ast.parse(expr.replace(PLACEHOLDER, PLACEHOLDER_NAME), mode='eval')
+    nodes = sum(1 for n in ast.walk(tree))
+    if limits.nodes is not None and nodes > limits.nodes:
+        raise UnsafeExpression("has more than %d terms" % limits.nodes)
+    seconds = limits.seconds
+    clock = None if seconds is None else [time.perf_counter() + seconds]
+    guarded = []
+    folded, term = compile_(tree.body, limits, 1, clock, guarded)
+    if folded:
+        return lambda value: term
+    if not guarded:
+        return lambda value: term(value, None)
+    # numbers below bound never compute an int past SMALL_BITS and are
+    # computed without any guards
+    bound = 2 ** value_bits(tree.body, limits)
+    fast = compile_(tree.body, UNLIMITED, 1, None, [])[1]
+
+    def evaluate(value):
+        try:
+            small = -bound < value < bound
+        except (TypeError, ValueError):
+            # complex numbers and numpy columns, which never hold ints
+            small = True
+        if small:
+            return fast(value, None)
+        # the clock only starts once an operation needs it, see
+        # check_deadline
+        return term(value, None if seconds is None else [])
+
+    return evaluate
+
+def value_bits(node, limits):
+    """Return the most bits an int {$} may have for node to compute no
+    int of more than SMALL_BITS bits"""
+    small_bits = min(SMALL_BITS, max_int_bits(limits))
+    low, high = 0, int(small_bits)
+    while low < high:
+        middle = (low + high + 1) // 2
+        if most_bits(node, limits, middle)[1] <= small_bits:
+            low = middle
+        else:
+            high = middle - 1
+    return low
+
+def most_bits(node, limits, bits):
+    """Return the most bits of the int node computes for an int {$} of
+    bits bits, None for a float, and the most bits of any int computed
+    along the way"""
+    if not any(isinstance(n, ast.Name) for n in ast.walk(node)):
+        # folded by compile_, which already computed it within limits
+        value = compile_(node, limits, 1, None, [])[1]
+        size = value.bit_length() if type(value) is int else None
+        return size, size or 0
+    if isinstance(node, ast.Name):
+        return bits, bits
+    if isinstance(node, ast.UnaryOp):
+        return most_bits(node.operand, limits, bits)
+    left, left_peak = most_bits(node.left, limits, bits)
+    right, right_peak = most_bits(node.right, limits, bits)
+    peak = max(left_peak, right_peak)
+    if left is None or right is None or type(node.op) is ast.Div:
+        return None, peak
+    if type(node.op) in (ast.Add, ast.Sub):
+        size = max(left, right) + 1
+    elif type(node.op) is ast.Mult:
+        size = left + right
+    elif type(node.op) is ast.Pow:
+        size = left * 2 ** right if right < 64 else float("inf")
+    else:
+        size = max(left, right)
+    return size, max(peak, size)
+
+def compile_(node, limits, depth, clock, guarded):
+    """Return whether node folded into a number, and the number or function
+
+    Terms not depending on {$} are computed once here, within limits and
+    the deadline on clock, the function computes the rest for a value and
+    a clock of its own. Operations that need guarding at that point are
+    added to guarded.
+    """
+    if limits.depth is not None and depth > limits.depth:
+        raise UnsafeExpression("is nested deeper than %d levels" %
+                               limits.depth)
     if isinstance(node, ast.Num): # <number>
-        return node.n
+        check_digits(node.n, limits)
+        return True, node.n
+    elif isinstance(node, ast.Name) and node.id == PLACEHOLDER_NAME: # {$}
+        return False, lambda value, clock: value
     elif isinstance(node, ast.BinOp): # <left> <operator> <right>
-        return OPERATORS[type(node.op)](eval_(node.left), eval_(node.right))
+        operator = OPERATORS[type(node.op)]
+        left_folded, left = compile_(node.left, limits, depth + 1,
+                                     clock, guarded)
+        right_folded, right = compile_(node.right, limits, depth + 1,
+                                       clock, guarded)
+        # nothing multiplied with or raised to a float grows without bound
+        floating = ((left_folded and type(left) is not int) or
+                    (right_folded and type(right) is not int))
+        if (type(node.op) in GUARDS and limits != UNLIMITED
+                and not floating):
+            operator = GUARDS[type(node.op)](operator, limits)
+            if not (left_folded and right_folded):
+                guarded.append(node)
+        else:
+            operator = unguarded(operator)
+        if left_folded and right_folded:
+            return True, operator(left, right, clock)
+        elif left_folded:
+            return False, lambda value, clock: operator(
+                left, right(value, clock), clock)
+        elif right_folded:
+            return False, lambda value, clock: operator(
+                left(value, clock), right, clock)
+        return False, lambda value, clock: operator(
+            left(value, clock), right(value, clock), clock)
     elif isinstance(node, ast.UnaryOp): # <operator> <operand> e.g., -1
-        return OPERATORS[type(node.op)](eval_(node.operand))
+        operator = OPERATORS[type(node.op)]
+        folded, operand = compile_(node.operand, limits, depth + 1,
+                                   clock, guarded)
+        if folded:
+            return True, operator(operand)
+        return False, lambda value, clock: operator(operand(value, clock))
     else:
-        raise TypeError(node)
\ No newline at end of file
+        raise TypeError(node)
+
+def unguarded(operator):
+    return lambda left, right, clock: operator(left, right)
+
+# floats overflow on their own, only ints can grow without bound, and
+# only ints past SMALL_BITS take long enough to check the clock for
+
+def guard_pow(operator, limits):
+    max_bits = max_int_bits(limits)
+    small_bits = min(SMALL_BITS, max_bits)
+
+    def pow_(left, right, clock):
+        if (type(left) is int and type(right) is int and right > 1
+                and (left > 1 or left < -1)):
+            if left.bit_length() * right > small_bits:
+                check_deadline(clock, limits)
+                if math.log2(abs(left)) * right >= max_bits:
+                    raise UnsafeExpression("would compute a power of more "
+                                           "than %d digits" % limits.digits)
+        return operator(left, right)
+
+    return pow_
+
+def guard_mult(operator, limits):
+    max_bits = max_int_bits(limits)
+    small_bits = min(SMALL_BITS, max_bits)
+
+    def mult(left, right, clock):
+        if type(left) is int and type(right) is int:
+            bits = left.bit_length() + right.bit_length()
+            if bits > small_bits:
+                check_deadline(clock, limits)
+                if bits - 1 >= max_bits:
+                    raise UnsafeExpression("would compute a number of more "
+                                           "than %d digits" % limits.digits)
+        return operator(left, right)
+
+    return mult
+
+def max_int_bits(limits):
+    if limits.digits is None:
+        return float("inf")
+    # ints from 2 ** max_bits on have more than the allowed digits
+    return limits.digits / LOG10_2
+
+def check_digits(n, limits):
+    """Refuse ints with more digits than limits allow"""
+    if type(n) is int and n.bit_length() - 1 >= max_int_bits(limits):
+        raise UnsafeExpression("has a number of more than %d digits" %
+                               limits.digits)
+
+def check_deadline(clock, limits):
+    """Raise once the deadline on clock passed
+
+    An evaluation's clock starts empty and its deadline is set by the
+    first operation on large ints, everything before is on small numbers
+    and takes next to no time.
+    """
+    if clock is None:
+        return
+    if not clock:
+        clock.append(time.perf_counter() + limits.seconds)
+    if time.perf_counter() > clock[0]:
+        raise UnsafeExpression("took longer than %s seconds" %
+                               limits.seconds)
+
+GUARDS = {ast.Pow: guard_pow, ast.Mult: guard_mult}
+
+def configure_expr_limits(**limits):
+    """Replace some of the limits expressions are evaluated within"""
+    global EXPR_LIMITS
+    EXPR_LIMITS = EXPR_LIMITS._replace(**limits)
+
+
+class UnsafeExpression(Exception):
+    """Exception describing an expression too costly to evaluate"""
+
+    def __str__(self):
+        return "Expression %s" % self.args[0]
+
+
+def parse_number(string):
+    try:
+        return int(string)
+    except ValueError:
+        return float(string)
+
+def eval_batch(function, values):
+    """Apply a compiled expression to every value, None where it fails
+
+    Long columns of floats are evaluated at once with numpy when it is
+    installed, anything numpy would compute differently from plain python
+    falls back to evaluating value by value.
+    """
+    if (len(values) >= VECTORIZE_MIN and numpy_available()
+            and all(type(x) is float for x in values)):
+        import numpy
+        try:
+            with numpy.errstate(all="raise"):
+                column = numpy.array(values, dtype=float)
+                return numpy.broadcast_to(function(column),
+                                          column.shape).tolist()
+        except Exception:
+            pass
+    results = []
+    for x in values:
+        try:
+            results.append(function(x))
+        except Exception:
+            results.append(None)
+    return results
+
+@lru_cache(maxsize=1)
+def numpy_available():
+    try:
+        import numpy
+    except ImportError:
+        return False
+    return True
+
+
+_loaded()
@@ -1,16 +1,10 @@
 import unittest
 
-# Import Transmutation for Sublime Plugin
-try:
-    from commands import Transmutation
-except ImportError:
-    pass
-
-# Import Transmutation for test runner
+# Import Transmutation for Sublime Plugin, or for the test runner
 try:
     from .commands import Transmutation
-except (ValueError, SystemError):
-    pass
+except (ImportError, ValueError, SystemError):
+    from commands import Transmutation
 
 '''
    ___  _   _  ___  _____  ___   __  __
@@ -34,8 +28,10 @@ except (ValueError, SystemError):
     class Foo(Transmutation):
         ...
 
-  2. 'Foo' or 'foo' is how your command will be invoked, it must
-      be ONE WORD for the plugin to add it to the command library
+  2. 'Foo' or 'foo' is how your command will be invoked, it is added
+      to the command library as soon as the class is defined. Set
+      command = "foo bar" on the class to invoke it by another name
+      and aliases = ("fb",) to add shorter ones
 
   3. Add the 'transmute' method to your class like so
 
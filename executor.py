@@ -0,0 +1,240 @@
+import os
+import sys
+import unittest
+import threading
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+try:
+    from .commands import Swap, Expand
+    from .pipeline import compile_pipeline
+except (ImportError, ValueError, SystemError):
+    from commands import Swap, Expand
+    from pipeline import compile_pipeline
+
+PARALLEL_MIN_REGIONS = 8
+PARALLEL_MIN_CHARS = 1 << 20
+
+
+def run_regions(pipeline, bodies, meta=None, workers=0,
+                min_regions=PARALLEL_MIN_REGIONS,
+                min_chars=PARALLEL_MIN_CHARS, timer=None, error_module=None):
+    """Run pipeline over every body, returning (success, output, errors)
+
+    Pure pipelines fan out across the worker processes of WORKER_POOL
+    and pipelines waiting on the network across worker threads, results
+    come back in the order of bodies. Anything too small to make up for
+    the overhead of a pool, or any pool that cannot be used, runs inline
+    instead, which is reported to error_module. Failed bodies get the
+    error message as output, errors holds whatever the transmutations
+    reported along the way. The time each body spent in every step is
+    added to timer if given, wherever the body ran.
+    """
+    mode = execution_mode(pipeline)
+    workers = workers or multiprocessing.cpu_count()
+    if mode == "process" and (workers < 2
+                              or len(bodies) < max(min_regions, 2)
+                              or sum(map(len, bodies)) < min_chars):
+        mode = "inline"
+    if mode == "thread" and len(bodies) < 2:
+        mode = "inline"
+    timed = [timer is not None] * len(bodies)
+
+    outcomes = None
+    if mode == "process":
+        options = {}
+        # Executor.map only takes a chunksize from Python 3.5 on
+        if sys.version_info >= (3, 5):
+            options["chunksize"] = max(1, len(bodies) // (workers * 4))
+        try:
+            outcomes = list(WORKER_POOL.get(workers).map(
+                run_region,
+                [pipeline] * len(bodies),
+                bodies,
+                [meta] * len(bodies),
+                timed,
+                **options))
+        except Exception as e:
+            WORKER_POOL.close()
+            message = "TextTransmute: running inline, %s" % (
+                str(e) or type(e).__name__)
+            if error_module:
+                error_module.display_err(message)
+            else:
+                print(message)
+    elif mode == "thread":
+        # every thread gets its own transmutation instances
+        with ThreadPoolExecutor(min(workers, len(bodies))) as pool:
+            outcomes = list(pool.map(run_region,
+                                     [pipeline.copy() for body in bodies],
+                                     bodies,
+                                     [meta] * len(bodies),
+                                     timed))
+    if outcomes is None:
+        outcomes = [run_region(pipeline, body, meta, timer is not None)
+                    for body in bodies]
+
+    if timer is None:
+        return outcomes
+    for success, output, errors, timings in outcomes:
+        timer.add_region(timings)
+    return [outcome[:3] for outcome in outcomes]
+
+
+def run_region(pipeline, body, meta=None, timed=False):
+    """Run pipeline over a single body, catching whatever it raises
+
+    Errors the transmutations report are kept and returned rather than
+    shown, as the body may run in a worker process with no editor to
+    show them in. Timed runs also return the (label, seconds) of every
+    step run.
+    """
+    errors = RegionErrors()
+    transmutations = [stage.transmutation for stage in pipeline.stages]
+    error_modules = [t.error_module for t in transmutations]
+    for transmutation in transmutations:
+        transmutation.error_module = errors
+    timings = [] if timed else None
+    try:
+        outcome = True, pipeline.run(body, meta, timings)
+    except Exception as e:
+        outcome = False, str(e)
+    finally:
+        for transmutation, error_module in zip(transmutations,
+                                               error_modules):
+            transmutation.error_module = error_module
+    outcome += (errors.messages,)
+    return outcome + (timings,) if timed else outcome
+
+
+class RegionErrors(object):
+    """Error module keeping the errors reported while running a region"""
+
+    def __init__(self):
+        self.messages = []
+
+    def display_err(self, message):
+        self.messages.append(message)
+
+
+def execution_mode(pipeline):
+    """Tell whether pipeline runs in processes, threads or inline"""
+    transmutations = [stage.transmutation for stage in pipeline.stages]
+    if not transmutations:
+        return "inline"
+    if any(t.io_bound for t in transmutations):
+        return "thread"
+    if all(t.pure for t in transmutations) and hasattr(os, "fork"):
+        return "process"
+    return "inline"
+
+
+def process_pool(workers):
+    """Create a pool of forked worker processes
+
+    Workers are forked so they share the transmutations already loaded
+    by the editor instead of starting a fresh interpreter.
+    """
+    try:
+        context = multiprocessing.get_context("fork")
+        return ProcessPoolExecutor(workers, mp_context=context)
+    except (AttributeError, TypeError):
+        # Python 3.3 has no start method contexts and forks by default
+        return ProcessPoolExecutor(workers)
+
+
+class WorkerPool(object):
+    """Pool of worker processes kept alive from one run to the next
+
+    The editor runs plugins alongside threads of its own, so workers are
+    forked once when first needed rather than on every run. The pool is
+    forked again after it was closed, when it broke or when a different
+    number of workers is asked for. Close it whenever commands are
+    (re)registered, as workers only know the commands they were forked
+    with.
+    """
+
+    def __init__(self):
+        self.pool = None
+        self.workers = 0
+        self.lock = threading.Lock()
+
+    def get(self, workers):
+        with self.lock:
+            if self.pool is not None and self.workers != workers:
+                self.pool.shutdown(wait=False)
+                self.pool = None
+            if self.pool is None:
+                self.pool = process_pool(workers)
+                self.workers = workers
+            return self.pool
+
+    def close(self):
+        with self.lock:
+            if self.pool is not None:
+                self.pool.shutdown(wait=False)
+                self.pool = None
+
+
+WORKER_POOL = WorkerPool()
+
+
+class TestExecutor(unittest.TestCase):
+    """Unit test for running a pipeline over many regions"""
+
+    def setUp(self):
+        self.resolve = {"swap": Swap, "expand": Expand}.get
+        self.bodies = ["a%d" % i for i in range(20)]
+
+    def test_modes(self):
+        pipeline = compile_pipeline("swap a b", self.resolve)
+        self.assertEqual(execution_mode(pipeline), "process")
+        pipeline.stages[0].transmutation.io_bound = True
+        self.assertEqual(execution_mode(pipeline), "thread")
+
+    def test_inline(self):
+        pipeline = compile_pipeline("swap a b", self.resolve)
+        self.assertEqual(run_regions(pipeline, self.bodies),
+                         [(True, "b%d" % i, []) for i in range(20)])
+
+    def test_process(self):
+        pipeline = compile_pipeline("swap a b", self.resolve)
+        self.assertEqual(run_regions(pipeline, self.bodies, workers=2,
+                                     min_regions=0, min_chars=0),
+                         [(True, "b%d" % i, []) for i in range(20)])
+
+    def test_thread(self):
+        pipeline = compile_pipeline("swap a b", self.resolve)
+        pipeline.stages[0].transmutation.io_bound = True
+        self.assertEqual(run_regions(pipeline, self.bodies, workers=4),
+                         [(True, "b%d" % i, []) for i in range(20)])
+
+    def test_errors(self):
+        pipeline = compile_pipeline("expand x", self.resolve)
+        outcomes = run_regions(pipeline, ["a", "b"], workers=2,
+                               min_regions=0, min_chars=0)
+        self.assertEqual([success for success, output, errors in outcomes],
+                         [False, False])
+
+    def test_reported_errors(self):
+        # reported from the worker processes rather than printed there
+        pipeline = compile_pipeline("swap -x a b", self.resolve)
+        outcomes = run_regions(pipeline, self.bodies, workers=2,
+                               min_regions=0, min_chars=0)
+        self.assertEqual(outcomes[0][:2], (True, "a0"))
+        self.assertIn("option -x not recognized", outcomes[0][2][0])
+        self.assertTrue(all(errors for success, output, errors in outcomes))
+        self.assertIsNone(pipeline.stages[0].transmutation.error_module)
+
+    def test_worker_pool(self):
+        pipeline = compile_pipeline("swap a b", self.resolve)
+        pool = WorkerPool()
+        self.assertIs(pool.get(2), pool.get(2))
+        first = pool.get(2)
+        self.assertIsNot(pool.get(3), first)
+        pool.close()
+        self.assertIsNone(pool.pool)
+        self.assertEqual(list(pool.get(2).map(run_region, [pipeline],
+                                              ["a"])),
+                         [(True, "b", [])])
+        pool.close()
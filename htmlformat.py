@@ -0,0 +1,279 @@
+import re
+import string
+import unittest
+
+try:
+    from html import unescape as unescape_attribute
+except ImportError:
+    # Python 3.3, where html.parser unescaped attributes itself
+    from html.parser import HTMLParser
+    unescape_attribute = HTMLParser().unescape
+
+INDENTATION = r'\1\1'
+INDENT_PATTERN = re.compile(r'^(\s*)', re.MULTILINE)
+PUNCTUATION = re.sub('[<>]', '', string.punctuation)
+INLINE_PATTERN = re.compile(r'(<\w+>)\n\s*([\w\s\n' + PUNCTUATION +
+                            r']*)\n\s*(</\w+>)')
+INLINE_TEXT = re.compile(r'[\w\s' + PUNCTUATION + r']*\Z')
+
+# Tags as html.parser reads them into BeautifulSoup, anything else such
+# as comments or declarations is left to BeautifulSoup itself
+ATTRIBUTE = r'''\s+([a-zA-Z_:][-\w:.]*)
+                (?:\s*=\s*("[^"]*"|'[^']*'|[^\s"'=<>`]+))?'''
+TAG_PATTERN = re.compile(r'''<(?P<closing>/?)(?P<name>[a-zA-Z][a-zA-Z0-9]*)
+                             (?P<attributes>(?:%s)*)\s*(?P<empty>/?)>''' %
+                         ATTRIBUTE, re.VERBOSE)
+ATTRIBUTE_PATTERN = re.compile(ATTRIBUTE, re.VERBOSE)
+REFERENCE_PATTERN = re.compile(r'&(?:#([0-9]+)|#[xX]([0-9a-fA-F]+)|(\w+));|&')
+ESCAPE_PATTERN = re.compile(r'[&<>]')
+ESCAPES = {"&": "&amp;", "<": "&lt;", ">": "&gt;"}
+ENTITIES = {"amp": "&", "lt": "<", "gt": ">", "quot": '"', "apos": "'",
+            "nbsp": "\xa0"}
+
+# Tag sets of BeautifulSoup's html tree builder
+VOID_TAGS = frozenset(['area', 'base', 'basefont', 'bgsound', 'br', 'col',
+                       'command', 'embed', 'frame', 'hr', 'image', 'img',
+                       'input', 'isindex', 'keygen', 'link', 'menuitem',
+                       'meta', 'nextid', 'param', 'source', 'spacer',
+                       'track', 'wbr'])
+PRESERVE_TAGS = frozenset(['pre', 'textarea'])
+UNSUPPORTED_TAGS = frozenset(['script', 'style', 'textarea', 'template',
+                              'rt', 'rp'])
+LIST_ATTRIBUTES = {'*': ('class', 'accesskey', 'dropzone'),
+                   'a': ('rel', 'rev'), 'link': ('rel', 'rev'),
+                   'td': ('headers',), 'th': ('headers',),
+                   'form': ('accept-charset',), 'object': ('archive',),
+                   'area': ('rel',), 'icon': ('sizes',),
+                   'iframe': ('sandbox',), 'output': ('for',)}
+
+
+class UnsupportedHtml(ValueError):
+    pass
+
+
+def format_html(text, indentation=INDENTATION):
+    """Prettify html, indenting and keeping short elements on one line
+
+    Gives the same output as BeautifulSoup's prettify followed by the
+    indentation and inlining passes of prettify_html, without building
+    a soup. Markup it doesn't read the way BeautifulSoup would, such as
+    comments or unbalanced tags, is left to prettify_html.
+    """
+    try:
+        return indent_html(parse_html(text), indentation)
+    except UnsupportedHtml:
+        return prettify_html(text, indentation)
+
+
+def prettify_html(text, indentation=INDENTATION):
+    """Prettify html with BeautifulSoup, then indent and inline it"""
+    # imported on first use to keep plugin load fast
+    from bs4 import BeautifulSoup
+    soup = BeautifulSoup(text, 'html.parser')
+    output = INDENT_PATTERN.sub(indentation, soup.prettify())
+    return INLINE_PATTERN.sub('\\1\\2\\3', output)
+
+
+def parse_html(text):
+    """Read well formed html into (name, attributes, children) tuples
+
+    Attributes are already serialized the way BeautifulSoup writes them,
+    text is unescaped. Raises UnsupportedHtml for anything else.
+    """
+    root = []
+    stack = [("[document]", root)]
+    children = root
+    pos = 0
+    length = len(text)
+    while pos < length:
+        start = text.find("<", pos)
+        if start == -1:
+            start = length
+        if start > pos:
+            children.append(unescape(text[pos:start]))
+        if start == length:
+            break
+        match = TAG_PATTERN.match(text, start)
+        if not match:
+            raise UnsupportedHtml("unsupported markup at %d" % start)
+        closing, name, attributes, empty = match.group(
+            "closing", "name", "attributes", "empty")
+        name = name.lower()
+        if name in UNSUPPORTED_TAGS:
+            raise UnsupportedHtml("unsupported tag %s" % name)
+        if closing:
+            if attributes or empty or stack[-1][0] != name:
+                raise UnsupportedHtml("unbalanced tag %s" % name)
+            stack.pop()
+            children = stack[-1][1]
+        elif name in VOID_TAGS:
+            children.append((name, serialize_attributes(name, attributes),
+                             None))
+        elif empty:
+            raise UnsupportedHtml("self closing tag %s" % name)
+        else:
+            element = (name, serialize_attributes(name, attributes), [])
+            children.append(element)
+            stack.append((name, element[2]))
+            children = element[2]
+        pos = match.end()
+    if len(stack) > 1:
+        raise UnsupportedHtml("unclosed tag %s" % stack[-1][0])
+    return root
+
+
+def serialize_attributes(name, attributes):
+    if not attributes:
+        return ""
+    values = {}
+    lists = LIST_ATTRIBUTES['*'] + LIST_ATTRIBUTES.get(name, ())
+    for key, value in ATTRIBUTE_PATTERN.findall(attributes):
+        key = key.lower()
+        if value[:1] in ("'", '"'):
+            value = value[1:-1]
+        value = unescape_attribute(value)
+        if key in lists:
+            value = " ".join(value.split())
+        values[key] = value
+    output = []
+    for key, value in sorted(values.items()):
+        value = escape(value)
+        if '"' not in value:
+            output.append('%s="%s"' % (key, value))
+        elif "'" not in value:
+            output.append("%s='%s'" % (key, value))
+        else:
+            output.append('%s="%s"' % (key, value.replace('"', "&quot;")))
+    return " " + " ".join(output)
+
+
+def unescape(text):
+    if "&" not in text:
+        return text
+
+    def reference(match):
+        decimal, hexadecimal, name = match.groups()
+        if name is not None:
+            if name not in ENTITIES:
+                raise UnsupportedHtml("unsupported entity %s" % name)
+            return ENTITIES[name]
+        if decimal is None and hexadecimal is None:
+            raise UnsupportedHtml("bare ampersand")
+        number = int(decimal) if decimal else int(hexadecimal, 16)
+        if 128 <= number < 160 or number > 0x10ffff:
+            raise UnsupportedHtml("unsupported character reference")
+        return chr(number)
+
+    return REFERENCE_PATTERN.sub(reference, text)
+
+
+def escape(text):
+    if "&" in text or "<" in text or ">" in text:
+        return ESCAPE_PATTERN.sub(lambda match: ESCAPES[match.group(0)],
+                                  text)
+    return text
+
+
+def indent_html(tree, indentation=INDENTATION):
+    """Write a parsed html tree the way prettify_html would"""
+    levels = indentation.count(r'\1')
+    if indentation != r'\1' * levels:
+        raise UnsupportedHtml("unsupported indentation %r" % indentation)
+    return Indenter(indentation, " " * levels).contents(tree, 1)
+
+
+class Indenter(object):
+    """Mirror of BeautifulSoup's pretty printer, with whitespace at the
+    start of lines repeated as by the indentation pattern and elements
+    holding nothing but short text written on a single line"""
+
+    def __init__(self, indentation, unit):
+        self.indentation = indentation
+        self.unit = unit
+
+    def contents(self, children, level):
+        output = []
+        space = self.unit * (level - 1)
+        last = len(children) - 1
+        for i, child in enumerate(children):
+            if type(child) is str:
+                text = escape(child).strip()
+                if text:
+                    output.append(space + self.lines(text) + "\n")
+            else:
+                output.append(self.element(child, level, i < last))
+        return "".join(output)
+
+    def element(self, node, level, followed):
+        name, attributes, children = node
+        space = self.unit * (level - 1)
+        if children is None:
+            return "%s<%s%s/>\n" % (space, name, attributes)
+        close = "</%s>" % name
+        after = "\n" if followed else ""
+        if name in PRESERVE_TAGS:
+            output = "<%s%s>%s%s" % (name, attributes, self.raw(children),
+                                     close)
+            output = INDENT_PATTERN.sub(self.indentation, output)
+            return space + INLINE_PATTERN.sub('\\1\\2\\3', output) + after
+        if not attributes and len(children) == 1 and type(children[0]) is str:
+            text = self.lines(escape(children[0]).strip())
+            if text and INLINE_TEXT.match(text):
+                return "%s<%s>%s%s%s" % (space, name, text, close, after)
+        contents = self.contents(children, level + 1)
+        if contents and contents[-1] != "\n":
+            contents += "\n"
+        return "%s<%s%s>\n%s%s%s%s" % (space, name, attributes, contents,
+                                       space, close, after)
+
+    def raw(self, children):
+        output = []
+        for child in children:
+            if type(child) is str:
+                output.append(escape(child))
+            elif child[2] is None:
+                output.append("<%s%s/>" % child[:2])
+            else:
+                output.append("<%s%s>%s</%s>" % (child[0], child[1],
+                                                 self.raw(child[2]),
+                                                 child[0]))
+        return "".join(output)
+
+    def lines(self, text):
+        if "\n" in text:
+            return INDENT_PATTERN.sub(self.indentation, text)
+        return text
+
+
+class TestFormatHtml(unittest.TestCase):
+    """Unit test for the html pretty printer"""
+
+    documents = [
+        "<h1>Hello World</h1>",
+        "<ul>\n<li>a b c</li>\n</ul>",
+        '<p>para <em>a</em> &amp; <a href="x?a=1&amp;b=2" title="t">'
+        'link</a><br />\nnext line</p>\n<hr />\n<p>“quoted”</p>',
+        '<pre><code>def f():\n    return &lt;1&gt;\n\n</code></pre>\n'
+        '<pre><code>\nx\n</code></pre>',
+        '<table>\n<thead>\n<tr>\n<th align="left">a</th>\n</tr>\n</thead>'
+        '\n<tbody>\n<tr>\n<td class=" x  y ">1</td>\n</tr>\n</tbody>\n'
+        '</table>',
+        "<blockquote>\n<p>q2\n  cont</p>\n</blockquote>\n<p></p><p> </p>",
+        "<p>&#60;&#x3e;&quot;</p>",
+        "text only",
+        "",
+    ]
+
+    def test_default(self):
+        for document in self.documents:
+            for indentation in (INDENTATION, r'\1' * 4, ''):
+                self.assertEqual(format_html(document, indentation),
+                                 prettify_html(document, indentation))
+
+    def test_unsupported(self):
+        for document in ["<p>a</b>", "<!-- c --><p>a</p>", "<div/>",
+                         "<p>&copy;</p>", "<p>a & b</p>", "<p>",
+                         "<script>x</script>"]:
+            self.assertRaises(UnsupportedHtml, parse_html, document)
+            self.assertEqual(format_html(document),
+                             prettify_html(document))
@@ -0,0 +1,253 @@
+import os
+import json
+import time
+import shutil
+import hashlib
+import tempfile
+import threading
+import unittest
+
+try:
+    from .transport import Transport, serve_locally
+    from .state import write_atomically
+except (ImportError, ValueError, SystemError):
+    from transport import Transport, serve_locally
+    from state import write_atomically
+
+HTTP_CACHE_SIZE = 16 * 1024 * 1024
+# other methods change things on the server and are always sent
+CACHEABLE_METHODS = ("GET", "HEAD")
+
+
+class ResponseCache(object):
+    """On-disk cache of http responses revalidated with their validators
+
+    Responses to GET and HEAD requests are stored as one json file per
+    method, url and payload.
+    Fresh entries, as of their Cache-Control max-age or Expires headers,
+    are served without a request, stale ones are revalidated with
+    If-None-Match and If-Modified-Since. The least recently used entries
+    are evicted once the cache outgrows its size cap.
+    """
+
+    def __init__(self, directory=None, max_bytes=HTTP_CACHE_SIZE,
+                 enabled=False):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.enabled = enabled
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.revalidated = 0
+
+    def configure(self, directory, max_bytes=HTTP_CACHE_SIZE, enabled=False):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.enabled = enabled
+
+    def fetch(self, transport, method, url, params=None, refresh=False):
+        """Return the text of a response, from the cache when possible"""
+        if method.upper() not in CACHEABLE_METHODS:
+            return transport.request(method, url, params=params).text
+        path = self.path(method, url, params)
+        entry = None if refresh else self.load(path)
+        if entry is not None and entry["expires"] > time.time():
+            self.hits += 1
+            return entry["text"]
+
+        headers = {}
+        if entry is not None:
+            if entry["etag"]:
+                headers["If-None-Match"] = entry["etag"]
+            if entry["last_modified"]:
+                headers["If-Modified-Since"] = entry["last_modified"]
+        r = transport.request(method, url, params=params, headers=headers)
+
+        if r.status_code == 304 and entry is not None:
+            self.revalidated += 1
+            lifetime = freshness(r.headers)
+            entry["expires"] = time.time() + (lifetime or 0)
+            entry["etag"] = r.headers.get("ETag", entry["etag"])
+            self.store(path, entry)
+            return entry["text"]
+
+        self.misses += 1
+        lifetime = freshness(r.headers)
+        validated = r.headers.get("ETag") or r.headers.get("Last-Modified")
+        if r.status_code == 200 and lifetime is not None and (lifetime or
+                                                              validated):
+            self.store(path, {"url": url,
+                              "etag": r.headers.get("ETag"),
+                              "last_modified": r.headers.get("Last-Modified"),
+                              "expires": time.time() + lifetime,
+                              "text": r.text})
+        return r.text
+
+    def path(self, method, url, params=None):
+        key = json.dumps([method.upper(), url, sorted((params or {}).items())])
+        return os.path.join(self.directory,
+                            hashlib.sha1(key.encode("utf-8")).hexdigest() +
+                            ".json")
+
+    def load(self, path):
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                entry = json.load(f)
+        except (OSError, IOError, ValueError):
+            return None
+        # mark as recently used for eviction
+        try:
+            os.utime(path, None)
+        except OSError:
+            pass
+        return entry
+
+    def store(self, path, entry):
+        with self.lock:
+            if not os.path.isdir(self.directory):
+                os.makedirs(self.directory)
+            write_atomically(path, json.dumps(entry))
+            self.evict()
+
+    def evict(self):
+        entries = []
+        for name in os.listdir(self.directory):
+            if name.endswith(".json"):
+                stat = os.stat(os.path.join(self.directory, name))
+                entries.append((stat.st_mtime, stat.st_size, name))
+        total = sum(size for mtime, size, name in entries)
+        for mtime, size, name in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            os.remove(os.path.join(self.directory, name))
+            total -= size
+
+    def clear(self):
+        with self.lock:
+            if self.directory and os.path.isdir(self.directory):
+                shutil.rmtree(self.directory)
+
+
+def freshness(headers):
+    """Return seconds a response stays fresh, None if it must not be stored"""
+    from email.utils import parsedate_tz, mktime_tz
+
+    directives = {}
+    for directive in headers.get("Cache-Control", "").split(","):
+        name, _, value = directive.strip().partition("=")
+        directives[name.lower()] = value.strip('"')
+    if "no-store" in directives or "private" in directives:
+        return None
+    if "no-cache" in directives:
+        return 0
+    if "max-age" in directives:
+        try:
+            return max(0, int(directives["max-age"]))
+        except ValueError:
+            return 0
+    expires = parsedate_tz(headers.get("Expires", ""))
+    if expires:
+        date = parsedate_tz(headers.get("Date", ""))
+        now = mktime_tz(date) if date else time.time()
+        return max(0, mktime_tz(expires) - now)
+    return 0
+
+
+HTTP_CACHE = ResponseCache()
+
+
+def revalidating_handler(counts):
+    """Handler serving a versioned resource and counting full responses"""
+    from http.server import BaseHTTPRequestHandler
+
+    class RevalidatingHandler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def do_GET(self):
+            etag = '"v1"'
+            if self.headers.get("If-None-Match") == etag:
+                self.send_response(304)
+                self.send_header("ETag", etag)
+                self.send_header("Content-Length", "0")
+                self.end_headers()
+                return
+            counts[self.path] = counts.get(self.path, 0) + 1
+            body = ("%s %d" % (self.path, counts[self.path])).encode("utf-8")
+            self.send_response(200)
+            self.send_header("ETag", etag)
+            if self.path.startswith("/fresh"):
+                self.send_header("Cache-Control", "max-age=60")
+            elif self.path.startswith("/secret"):
+                self.send_header("Cache-Control", "no-store")
+            else:
+                self.send_header("Cache-Control", "no-cache")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        do_POST = do_GET
+
+        def log_message(self, format, *args):
+            pass
+
+    return RevalidatingHandler
+
+
+class TestResponseCache(unittest.TestCase):
+    """Unit test for on-disk http response cache"""
+
+    def setUp(self):
+        self.counts = {}
+        self.server, self.url = serve_locally(
+            revalidating_handler(self.counts))
+        self.transport = Transport(timeout=5)
+        self.directory = tempfile.mkdtemp()
+        self.cache = ResponseCache(self.directory, enabled=True)
+
+    def tearDown(self):
+        self.transport.close()
+        self.server.shutdown()
+        self.server.server_close()
+        shutil.rmtree(self.directory)
+
+    def fetch(self, path, **kwargs):
+        return self.cache.fetch(self.transport, "GET", self.url + path,
+                                **kwargs)
+
+    def test_fresh(self):
+        self.assertEqual(self.fetch("/fresh"), "/fresh 1")
+        self.assertEqual(self.fetch("/fresh"), "/fresh 1")
+        self.assertEqual(self.cache.hits, 1)
+        self.assertEqual(self.fetch("/fresh", refresh=True), "/fresh 2")
+
+    def test_revalidate(self):
+        self.assertEqual(self.fetch("/stale"), "/stale 1")
+        self.assertEqual(self.fetch("/stale"), "/stale 1")
+        self.assertEqual(self.cache.revalidated, 1)
+        self.assertEqual(self.counts["/stale"], 1)
+
+    def test_no_store(self):
+        self.fetch("/secret")
+        self.fetch("/secret")
+        self.assertEqual(self.counts["/secret"], 2)
+        self.assertEqual(os.listdir(self.directory), [])
+
+    def test_uncacheable_methods(self):
+        for i in range(2):
+            self.assertEqual(self.cache.fetch(self.transport, "post",
+                                              self.url + "/fresh"),
+                             "/fresh %d" % (i + 1))
+        self.assertEqual(os.listdir(self.directory), [])
+        self.assertEqual((self.cache.hits, self.cache.misses), (0, 0))
+
+    def test_evict(self):
+        self.cache.max_bytes = 200
+        for i in range(5):
+            self.fetch("/fresh%d" % i)
+            time.sleep(0.01)
+        self.fetch("/fresh4")
+        self.assertLessEqual(sum(os.path.getsize(os.path.join(self.directory,
+                                                              name))
+                                 for name in os.listdir(self.directory)),
+                             200)
+        self.assertEqual(self.fetch("/fresh4"), "/fresh4 1")
@@ -0,0 +1,227 @@
+import io
+import os
+import mmap
+import time
+import unittest
+from itertools import chain
+
+try:
+    from .pipeline import batches, fused_texts
+except (ImportError, ValueError, SystemError):
+    from pipeline import batches, fused_texts
+
+FILE_BLOCK = 4 << 20
+PROGRESS_INTERVAL = 0.5
+
+
+class NotLineLocal(ValueError):
+    pass
+
+
+class FileStats(object):
+    """Bytes read and written by a file transmutation and how long it took"""
+
+    def __init__(self, size):
+        self.size = size
+        self.read = 0
+        self.written = 0
+        self.seconds = 0
+
+    def throughput(self):
+        """Megabytes read per second"""
+        return self.read / float(1 << 20) / self.seconds if self.seconds else 0
+
+    def describe(self):
+        return "%s in %.1f s (%.1f MB/s), %s written" % (
+            format_bytes(self.read), self.seconds, self.throughput(),
+            format_bytes(self.written))
+
+
+def transmute_path(pipeline, source, out, meta=None, block=FILE_BLOCK,
+                   progress=None):
+    """Run a line local pipeline over the file at source, writing to out
+
+    The file is mapped into memory and read a block of whole lines at a
+    time, only ever decoding one block, and the result is encoded and
+    written as it is produced. The file is one selection holding all of
+    it, except for its final newline which is put back after the result.
+    Windows line endings are kept. out is a binary file, progress if
+    given is called with the stats every so often. Returns the stats.
+    """
+    if not pipeline.line_local:
+        raise NotLineLocal("'%s' is not line local" % pipeline.user_input)
+    started = time.perf_counter()
+    with open(source, "rb") as f:
+        size = os.fstat(f.fileno()).st_size
+        stats = FileStats(size)
+        if not size:
+            mapped = b""
+        else:
+            mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            reader = MappedLines(mapped, block, stats)
+            ops = pipeline.line_ops()
+            if ops is not None:
+                # whole blocks at a time through the fused loop
+                chunks = joined(fused_texts(reader.blocks(), ops))
+            else:
+                chunks = batches(pipeline.run_lines(iter(reader), meta))
+            newline = reader.newline().encode("ascii")
+            written = False
+            reported = started
+            for chunk in chunks:
+                if not chunk:
+                    continue
+                if newline != b"\n":
+                    chunk = chunk.replace("\n", "\r\n")
+                data = chunk.encode("utf-8")
+                out.write(data)
+                stats.written += len(data)
+                written = True
+                now = time.perf_counter()
+                if progress and now - reported > PROGRESS_INTERVAL:
+                    reported = now
+                    stats.seconds = now - started
+                    progress(stats)
+            if written and reader.terminated:
+                out.write(newline)
+                stats.written += len(newline)
+        finally:
+            if size:
+                mapped.close()
+    stats.seconds = time.perf_counter() - started
+    return stats
+
+
+class MappedLines(object):
+    """Lines of a mapped file as the lines of a selection holding all of it
+
+    Blocks end at a line end so multibyte characters are never split.
+    terminated tells whether the file ended with a newline once read.
+    """
+
+    def __init__(self, mapped, block=FILE_BLOCK, stats=None):
+        self.mapped = mapped
+        self.block = block
+        self.stats = stats
+        self.terminated = False
+
+    def newline(self):
+        end = self.mapped.find(b"\n")
+        if end > 0 and self.mapped[end - 1:end] == b"\r":
+            return "\r\n"
+        return "\n"
+
+    def __iter__(self):
+        return chain.from_iterable(block.split("\n")
+                                   for block in self.blocks())
+
+    def blocks(self):
+        """Yield every block as text without its final newline"""
+        mapped = self.mapped
+        size = len(mapped)
+        crlf = self.newline() == "\r\n"
+        if not size:
+            yield ""
+            return
+        position = 0
+        while position < size:
+            end = min(position + self.block, size)
+            if end < size:
+                line_end = mapped.rfind(b"\n", position, end)
+                if line_end == -1:
+                    line_end = mapped.find(b"\n", end)
+                end = size if line_end == -1 else line_end + 1
+            text = mapped[position:end].decode("utf-8")
+            if self.stats is not None:
+                self.stats.read += end - position
+            position = end
+            if crlf:
+                text = text.replace("\r\n", "\n")
+            if text.endswith("\n"):
+                text = text[:-1]
+                self.terminated = position == size
+            yield text
+
+
+def joined(texts):
+    """Join blocks of lines back together a block at a time"""
+    separator = ""
+    for text in texts:
+        yield separator + text
+        separator = "\n"
+
+
+def output_path(source):
+    """Path of a new file next to source for its transmuted content"""
+    root, extension = os.path.splitext(source)
+    path = "%s.transmuted%s" % (root, extension)
+    number = 1
+    while os.path.exists(path):
+        number += 1
+        path = "%s.transmuted-%d%s" % (root, number, extension)
+    return path
+
+
+def format_bytes(size):
+    for unit, scale in (("GB", 1 << 30), ("MB", 1 << 20), ("KB", 1 << 10)):
+        if size >= scale:
+            return "%.1f %s" % (size / float(scale), unit)
+    return "%d bytes" % size
+
+
+class TestLargeFile(unittest.TestCase):
+    """Unit test for transmuting files on disk"""
+
+    def setUp(self):
+        import tempfile
+        try:
+            from .commands import Swap, Strip, Filter, Expand, Dupl
+            from .pipeline import compile_pipeline
+        except (ImportError, ValueError, SystemError):
+            from commands import Swap, Strip, Filter, Expand, Dupl
+            from pipeline import compile_pipeline
+        resolve = {"swap": Swap, "strip": Strip, "filter": Filter,
+                   "expand": Expand, "dupl": Dupl}.get
+        self.compile = lambda user_input: compile_pipeline(user_input,
+                                                           resolve)
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        import shutil
+        shutil.rmtree(self.directory)
+
+    def transmute(self, user_input, data, block=FILE_BLOCK):
+        path = os.path.join(self.directory, "log.txt")
+        with open(path, "wb") as f:
+            f.write(data)
+        out = io.BytesIO()
+        stats = transmute_path(self.compile(user_input), path, out,
+                               block=block)
+        self.assertEqual(stats.read, len(data))
+        self.assertEqual(stats.written, len(out.getvalue()))
+        return out.getvalue()
+
+    def test_default(self):
+        data = "ERROR a [main]\nok\nERROR é [main]\n\n".encode("utf-8")
+        for block in (FILE_BLOCK, 1, 7):
+            self.assertEqual(self.transmute("filter ERROR | strip [main]",
+                                            data, block),
+                             "ERROR a \nERROR é \n".encode("utf-8"))
+        self.assertEqual(self.transmute("swap a b", b"a\nxa", 3), b"b\nxb")
+        self.assertEqual(self.transmute("swap a b", b""), b"")
+        self.assertEqual(self.transmute("swap a b", b"\n"), b"")
+        self.assertEqual(self.transmute("filter z", b"a\n"), b"")
+        self.assertEqual(self.transmute("expand", b"a\r\nb\r\n", 4),
+                         b"a\r\n\r\nb\r\n")
+
+    def test_errors(self):
+        self.assertRaises(NotLineLocal, self.transmute, "dupl", b"a")
+
+    def test_output_path(self):
+        source = os.path.join(self.directory, "app.log")
+        path = output_path(source)
+        self.assertEqual(os.path.basename(path), "app.transmuted.log")
+        open(path, "w").close()
+        self.assertEqual(os.path.basename(output_path(source)),
+                         "app.transmuted-2.log")
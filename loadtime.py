@@ -0,0 +1,102 @@
+import os
+import sys
+import time
+import importlib
+import unittest
+from collections import OrderedDict
+
+# Heavy third party modules only imported once a command needs them
+LAZY_MODULES = ["requests", "markdown", "bs4"]
+LOAD_TIME_BUDGET = 0.2
+LOAD_TIMES = OrderedDict()
+# seconds spent in nested modules, for every module still loading
+LOADING = []
+
+
+def load_timer(module_name):
+    """Start timing the load of a module, call the result once it's loaded
+
+    Only the module's own time is recorded, modules it imports that are
+    timed themselves are left out so load times add up to the total.
+    """
+    started = time.perf_counter()
+    nested = [0]
+    LOADING.append(nested)
+
+    def loaded():
+        seconds = time.perf_counter() - started
+        LOADING[:] = [spans for spans in LOADING if spans is not nested]
+        if LOADING:
+            LOADING[-1][0] += seconds
+        LOAD_TIMES[module_name] = seconds - nested[0]
+
+    return loaded
+
+
+def warm_up(modules=LAZY_MODULES):
+    """Import lazily loaded modules ahead of their first use"""
+    for module_name in modules:
+        try:
+            importlib.import_module(module_name)
+        except ImportError:
+            pass
+
+
+def over_budget(budget=LOAD_TIME_BUDGET):
+    return sum(LOAD_TIMES.values()) > budget
+
+
+def describe_load_times(budget=LOAD_TIME_BUDGET):
+    lines = ["%s.py: %.1f ms" % (module_name, seconds * 1000)
+             for module_name, seconds in LOAD_TIMES.items()]
+    total = sum(LOAD_TIMES.values())
+    lines.append("total: %.1f ms of a %.1f ms budget%s" %
+                 (total * 1000,
+                  budget * 1000,
+                  " (over budget)" if total > budget else ""))
+    lines.append("loaded: %s" % (", ".join(m for m in LAZY_MODULES
+                                           if m in sys.modules) or "none"))
+    return "\n".join(lines)
+
+
+class TestLoadTime(unittest.TestCase):
+    """Unit test for load time measurement"""
+
+    def setUp(self):
+        self.load_times = LOAD_TIMES.copy()
+        LOAD_TIMES.clear()
+
+    def tearDown(self):
+        LOAD_TIMES.clear()
+        LOAD_TIMES.update(self.load_times)
+
+    def test_default(self):
+        loaded = load_timer("foo")
+        loaded()
+        self.assertLess(LOAD_TIMES["foo"], 1)
+        self.assertFalse(over_budget())
+        LOAD_TIMES["bar"] = 1
+        self.assertTrue(over_budget())
+        self.assertIn("(over budget)", describe_load_times())
+
+    def test_nested(self):
+        started = time.perf_counter()
+        outer = load_timer("outer")
+        inner = load_timer("inner")
+        time.sleep(0.05)
+        inner()
+        outer()
+        total = time.perf_counter() - started
+        self.assertGreaterEqual(LOAD_TIMES["inner"], 0.05)
+        self.assertLess(LOAD_TIMES["outer"], 0.05)
+        self.assertLessEqual(sum(LOAD_TIMES.values()), total)
+        self.assertEqual(LOADING, [])
+
+    def test_lazy(self):
+        import subprocess
+        script = ("import sys, commands, transport; "
+                  "print([m for m in %r if m in sys.modules])" % LAZY_MODULES)
+        output = subprocess.check_output([sys.executable, "-c", script],
+                                         cwd=os.path.dirname(
+                                             os.path.abspath(__file__)))
+        self.assertEqual(output.decode().strip(), "[]")
@@ -0,0 +1,193 @@
+import re
+import threading
+import unittest
+from collections import OrderedDict
+
+try:
+    from .htmlformat import format_html, prettify_html, INDENTATION
+except (ImportError, ValueError, SystemError):
+    from htmlformat import format_html, prettify_html, INDENTATION
+
+MARKDOWN_CACHE_BLOCKS = 2048
+MARKDOWN_EXTENSIONS = ['markdown.extensions.extra']
+
+# Blocks can only be rendered on their own if nothing in them refers to
+# another one, reference links, footnotes, abbreviations and raw html
+# all reach across the document
+GLOBAL_PATTERN = re.compile(r'^[ ]{0,3}(?:\[[^\]]*\]:|\*\[|<)|\[\^',
+                            re.MULTILINE)
+FENCE_PATTERN = re.compile(r'^(~{3,}|`{3,})')
+LIST_PATTERN = re.compile(r'^[ ]{0,3}(?:[*+-]|\d+\.)[ ]+')
+QUOTE_PATTERN = re.compile(r'^[ ]{0,3}>')
+DEFINITION_PATTERN = re.compile(r'^[ ]{0,3}:[ ]{1,3}')
+
+
+class BlockCache(object):
+    """Formatted html of the top-level blocks of markdown documents
+
+    Documents are split into blocks that render the same on their own as
+    within the document, each one is rendered by a single reusable
+    renderer and formatted only the first time it is seen. Editing one
+    paragraph of a long document only renders that paragraph again.
+    The least recently used blocks are dropped past max_blocks.
+    """
+
+    def __init__(self, max_blocks=MARKDOWN_CACHE_BLOCKS):
+        self.max_blocks = max_blocks
+        self.blocks = OrderedDict()
+        self.lock = threading.Lock()
+        self.renderer = None
+        self.hits = 0
+        self.misses = 0
+
+    def configure(self, max_blocks=MARKDOWN_CACHE_BLOCKS):
+        with self.lock:
+            self.max_blocks = max_blocks
+            self.evict()
+
+    def render(self, text, indentation=INDENTATION):
+        """Return text rendered into formatted html"""
+        outputs = []
+        for block in split_blocks(text):
+            key = (block, indentation)
+            with self.lock:
+                output = self.blocks.get(key)
+                if output is not None:
+                    self.blocks.move_to_end(key)
+                    self.hits += 1
+            if output is None:
+                output = format_html(self.convert(block), indentation)
+                with self.lock:
+                    self.misses += 1
+                    self.blocks[key] = output
+                    self.evict()
+            if output:
+                if outputs and not outputs[-1].endswith("\n"):
+                    outputs.append("\n")
+                outputs.append(output)
+        return "".join(outputs)
+
+    def convert(self, block):
+        with self.lock:
+            if self.renderer is None:
+                # imported on first use to keep plugin load fast
+                import markdown
+                self.renderer = markdown.Markdown(
+                    extensions=MARKDOWN_EXTENSIONS,
+                    output_format="xhtml5")
+            self.renderer.reset()
+            return self.renderer.convert(block)
+
+    def evict(self):
+        while len(self.blocks) > self.max_blocks:
+            self.blocks.popitem(last=False)
+
+    def clear(self):
+        with self.lock:
+            self.blocks.clear()
+            self.hits = 0
+            self.misses = 0
+
+    def describe_stats(self):
+        return "\n".join(["blocks cached: %d of %d" % (len(self.blocks),
+                                                       self.max_blocks),
+                          "hits: %d" % self.hits,
+                          "misses: %d" % self.misses])
+
+
+def split_blocks(text):
+    """Split markdown text into blocks that can be rendered on their own
+
+    Blocks are separated by blank lines outside of fenced code. A block
+    is joined to the one before it whenever markdown would have merged
+    them, as for indented continuations, loose lists, blockquotes and
+    definitions, and documents with references stay a single block.
+    """
+    if GLOBAL_PATTERN.search(text):
+        return [text] if text.strip() else []
+    lines = text.split("\n")
+    blocks = []
+    i = 0
+    while i < len(lines):
+        if not lines[i].strip():
+            i += 1
+            continue
+        start = i
+        fence = None
+        while i < len(lines) and (fence or lines[i].strip()):
+            if fence:
+                if lines[i].rstrip(" ") == fence:
+                    fence = None
+            else:
+                match = FENCE_PATTERN.match(lines[i])
+                if match:
+                    fence = match.group(1)
+            i += 1
+        chunk = lines[start:i]
+        first = chunk[0]
+        block = [start, i,
+                 any(map(LIST_PATTERN.match, chunk)),
+                 any(map(QUOTE_PATTERN.match, chunk)),
+                 any(map(DEFINITION_PATTERN.match, chunk))]
+        if blocks and (first[0] in " \t" or block[4]
+                       or (LIST_PATTERN.match(first) and blocks[-1][2])
+                       or (QUOTE_PATTERN.match(first) and blocks[-1][3])):
+            block = join_blocks(blocks.pop(), block)
+            # definitions also join a definition list two blocks back,
+            # the paragraph in between becomes its next term
+            if block[4] and blocks and blocks[-1][4]:
+                block = join_blocks(blocks.pop(), block)
+        blocks.append(block)
+    return ["\n".join(lines[start:end]) for start, end, _, _, _ in blocks]
+
+
+def join_blocks(first, second):
+    """Join the line range and kinds of lines of two blocks"""
+    return [first[0], second[1]] + [a or b for a, b in zip(first[2:],
+                                                            second[2:])]
+
+
+MARKDOWN_CACHE = BlockCache()
+
+
+class TestBlockCache(unittest.TestCase):
+    """Unit test for the markdown block cache"""
+
+    documents = [
+        "# Title\n\nSome *text*\nover lines\n\n- a\n- b\n\n1. c\n\n2. d\n",
+        "para\n\n    code\n\n    more code\n\n> quote\n\n> more\n\nend",
+        "- item\n\n    continued\n\n- next\n\n```\nfenced\n\n```\nafter",
+        "Term\n: definition\n\nOther\n: more\n\n"
+        "| a | b |\n|---|---|\n| 1 | 2 |",
+        "See [this][1]\n\nand that\n\n[1]: http://example.com",
+        "Text\n\n<div>\n\nhtml\n\n</div>\n\n***\n\n* * *",
+        "",
+        "\n\n",
+    ]
+
+    def setUp(self):
+        self.cache = BlockCache()
+
+    def test_split(self):
+        self.assertEqual(split_blocks("a\n\n\nb\n  \nc"), ["a", "b", "c"])
+        self.assertEqual(split_blocks("- a\n\n- b\n\nc"), ["- a\n\n- b", "c"])
+        self.assertEqual(split_blocks("```\na\n\nb\n```\nc\n\nd"),
+                         ["```\na\n\nb\n```\nc", "d"])
+        self.assertEqual(split_blocks("[a]: b\n\nc"), ["[a]: b\n\nc"])
+
+    def test_render(self):
+        import markdown
+        for text in self.documents:
+            html = markdown.markdown(text, extensions=MARKDOWN_EXTENSIONS,
+                                     output_format="xhtml5")
+            self.assertEqual(self.cache.render(text), prettify_html(html))
+
+    def test_cache(self):
+        text = "# Title\n\nfirst\n\nsecond"
+        self.cache.render(text)
+        self.assertEqual((self.cache.hits, self.cache.misses), (0, 3))
+        self.cache.render(text.replace("second", "changed"))
+        self.assertEqual((self.cache.hits, self.cache.misses), (2, 4))
+        self.cache.configure(max_blocks=2)
+        self.assertEqual(len(self.cache.blocks), 2)
+        self.assertIn("hits: 2", self.cache.describe_stats())
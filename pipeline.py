@@ -0,0 +1,771 @@
+import re
+import time
+import getopt
+import unittest
+from collections import OrderedDict
+from itertools import chain, islice, tee
+
+try:
+    from .commands import (eval_expr, iter_lines, compile_replace,
+                           compile_filter, overlaps, independent, Swap, Strip,
+                           Dupl, Filter, Expand, Compress, Mklist)
+    from .tokenizer import tokenize, strip_quotes
+except (ImportError, ValueError, SystemError):
+    from commands import (eval_expr, iter_lines, compile_replace,
+                          compile_filter, overlaps, independent, Swap, Strip,
+                          Dupl, Filter, Expand, Compress, Mklist)
+    from tokenizer import tokenize, strip_quotes
+
+CACHE_LIMIT = 64
+FUSE_BATCH = 4096
+OUTPUT_BUDGET = 64 << 20
+COMMAND_WORDS = 3
+PIPE_PATTERN = re.compile(r'''((?:[^|"'`]|"[^"]*"|'[^']*'|`[^`]*`)+)''')
+
+
+class Stage(object):
+    """Single command of a pipeline bound to its transmutation instance"""
+
+    def __init__(self, command, name, params, transmutation):
+        self.command = command
+        self.name = name
+        self.params = params
+        self.transmutation = transmutation
+        self.line_local = transmutation.line_local
+        self.chunked = transmutation.chunked
+
+    def apply(self, body, meta=None):
+        return str(self.transmutation.transmute(body=body,
+                                                params=self.params,
+                                                meta=meta))
+
+    def apply_chunks(self, body, meta=None):
+        return self.transmutation.transmute_chunks(body=body,
+                                                   params=self.params,
+                                                   meta=meta)
+
+    def apply_lines(self, lines, meta=None):
+        if self.line_local:
+            return self.transmutation.transmute_lines(lines,
+                                                      params=self.params,
+                                                      meta=meta)
+        return iter_lines(self.apply("\n".join(lines), meta))
+
+    def estimate(self, size, lines):
+        return self.transmutation.estimate(size, lines, self.params)
+
+    def copy(self):
+        """Copy stage with its own transmutation instance"""
+        transmutation = self.transmutation
+        return Stage(self.command,
+                     self.name,
+                     self.params,
+                     type(transmutation)(transmutation.error_module))
+
+    @property
+    def label(self):
+        return self.command
+
+    def describe(self):
+        if self.line_local:
+            return "%s (line local)" % self.command
+        return self.command
+
+
+class FusedStage(object):
+    """One-to-one line operations of several stages run in a single loop"""
+
+    line_local = True
+    chunked = False
+
+    def __init__(self, ops):
+        self.ops = ops
+        self.stages = [stage for op in ops for stage in op.stages]
+
+    def apply(self, body, meta=None):
+        return "\n".join(self.apply_lines(iter_lines(body), meta))
+
+    def apply_lines(self, lines, meta=None):
+        return fused_lines(lines, self.ops)
+
+    @property
+    def label(self):
+        return " + ".join(stage.command for stage in self.stages)
+
+    def describe(self):
+        output = "fused loop over %s" % " | ".join(stage.command
+                                                   for stage in self.stages)
+        for op in self.ops:
+            output += "\n     %s" % op.describe()
+        if any(op.trims for op in self.ops):
+            output += "\n     drop trailing empty lines"
+        return output
+
+
+class ReplaceOp(object):
+    """Literal replacements applied to every line, as by swap and strip"""
+
+    filters = False
+
+    def __init__(self, stage, pairs, trims):
+        self.stages = [stage]
+        self.pairs = pairs
+        self.trims = trims
+
+    def merge(self, other):
+        self.stages = self.stages + other.stages
+        self.pairs = self.pairs + other.pairs
+        self.trims = other.trims
+
+    def function(self):
+        return compile_replace(tuple(self.pairs))
+
+    def text_function(self):
+        return self.function()
+
+    def describe(self):
+        output = "replace %s" % ", ".join("%r -> %r" % pair
+                                          for pair in self.pairs)
+        if len(self.pairs) > 1:
+            output += " (single pass)"
+        return output
+
+
+class FilterOp(object):
+    """Predicate keeping lines that contain any of some literals, as by
+    filter"""
+
+    filters = True
+    trims = True
+
+    def __init__(self, stage, patterns):
+        self.stages = [stage]
+        self.patterns = patterns
+        self.moved = False
+
+    def function(self):
+        match = compile_filter(tuple(self.patterns)).match
+        return lambda lines: [line for line in lines if match(line)]
+
+    def text_function(self):
+        """Function keeping the matching lines of a text, None if none"""
+        matcher = compile_filter(tuple(self.patterns))
+        match = matcher.match
+
+        def keep(text):
+            if matcher.scannable:
+                kept = [text[begin:end] for begin, end in matcher.scan(text)]
+            else:
+                kept = [line for line in text.split("\n") if match(line)]
+            return "\n".join(kept) if kept else None
+        return keep
+
+    def describe(self):
+        output = "keep lines containing %s" % " or ".join(
+            repr(pattern) for pattern in self.patterns)
+        if self.moved:
+            output += " (moved ahead)"
+        return output
+
+
+class Pipeline(object):
+    """Parsed and resolved sequence of stages built from user input"""
+
+    def __init__(self, user_input, stages, append_to_sel=False):
+        self.user_input = user_input
+        self.stages = stages
+        self.steps = plan(stages)
+        self.append_to_sel = append_to_sel
+
+    def run(self, body, meta=None, timings=None):
+        """Run every stage over body and return the transmuted result
+
+        Consecutive line local stages are chained lazily over the lines
+        of their input so only the last of them builds a string. Given a
+        timings list, the seconds spent on each group of steps are
+        appended to it as (label, seconds).
+        """
+        output = run_groups(self.groups(), body, meta, timings)
+        if self.append_to_sel:
+            output = body + '\n\n' + output
+        return output
+
+    def run_chunks(self, body, meta=None, timings=None):
+        """Run every stage over body, yielding the result in chunks
+
+        When the last stage is chunked its output is passed on a chunk at
+        a time as it is generated, pipelines of line local stages are run
+        a batch of lines at a time, otherwise the whole result is a chunk.
+        Timings are collected as by run, once every chunk was generated.
+        """
+        if self.line_local:
+            chunks = batches(self.run_lines(iter_lines(body), meta))
+            label = " | ".join(step.label for step in self.steps)
+        elif self.chunked:
+            output = run_groups(self.groups()[:-1], body, meta, timings)
+            if self.append_to_sel:
+                yield body + '\n\n'
+            chunks = self.steps[-1].apply_chunks(output, meta)
+            label = self.steps[-1].label
+        else:
+            yield self.run(body, meta, timings)
+            return
+        if timings is None:
+            yield from chunks
+            return
+        seconds = 0
+        while True:
+            started = time.perf_counter()
+            try:
+                chunk = next(chunks)
+            except StopIteration:
+                break
+            finally:
+                seconds += time.perf_counter() - started
+            yield chunk
+        timings.append((label, seconds))
+
+    @property
+    def chunked(self):
+        return bool(self.steps) and self.steps[-1].chunked
+
+    @property
+    def line_local(self):
+        return bool(self.steps) and all(step.line_local
+                                        for step in self.steps)
+
+    def estimate(self, body):
+        """Estimate the length of the result of running over body
+
+        Each stage estimates its output from the size and line count of
+        the estimate before it, nothing is transmuted.
+        """
+        size, lines = len(body), body.count("\n") + 1
+        for stage in self.stages:
+            size, lines = stage.estimate(size, lines)
+        if self.append_to_sel:
+            size += len(body) + 2
+        return size
+
+    def run_lines(self, lines, meta=None):
+        """Lazily run every stage over an iterator of lines"""
+        if self.append_to_sel:
+            lines, original = tee(lines)
+            return chain(original, [""], stream(lines, self.steps, meta))
+        return stream(lines, self.steps, meta)
+
+    def line_ops(self):
+        """Return the one-to-one line operations the whole pipeline comes
+        down to, or None if it does not"""
+        if len(self.steps) != 1 or self.append_to_sel:
+            return None
+        step = self.steps[0]
+        if isinstance(step, FusedStage):
+            return step.ops
+        op = line_op(step)
+        return [op] if op is not None else None
+
+    def copy(self):
+        """Copy pipeline so it can run alongside this one in another thread"""
+        return Pipeline(self.user_input,
+                        [stage.copy() for stage in self.stages],
+                        self.append_to_sel)
+
+    def groups(self):
+        """Split steps into runs of line local steps and single steps"""
+        groups = []
+        for step in self.steps:
+            if step.line_local and groups and groups[-1][-1].line_local:
+                groups[-1].append(step)
+            else:
+                groups.append([step])
+        return groups
+
+    def explain(self):
+        """Describe the steps chosen to run this pipeline"""
+        output = self.user_input
+        number = 0
+        for group in self.groups():
+            for step in group:
+                number += 1
+                head, newline, details = step.describe().partition("\n")
+                if len(group) > 1:
+                    head += " [streamed]"
+                output += "\n  %d. %s%s%s" % (number, head, newline, details)
+        if self.append_to_sel:
+            output += "\n  append result to selection"
+        return output
+
+
+class PipelineCache(object):
+    """Bounded LRU of compiled pipelines keyed by raw user input"""
+
+    def __init__(self, limit=CACHE_LIMIT):
+        self.limit = limit
+        self.pipelines = OrderedDict()
+
+    def get(self, user_input, resolve, error_module=None):
+        try:
+            pipeline = self.pipelines.pop(user_input)
+        except KeyError:
+            pipeline = compile_pipeline(user_input, resolve, error_module)
+        self.pipelines[user_input] = pipeline
+        while len(self.pipelines) > self.limit:
+            self.pipelines.popitem(last=False)
+        return pipeline
+
+    def clear(self):
+        self.pipelines.clear()
+
+
+def compile_pipeline(user_input, resolve, error_module=None):
+    """Parse user input into a Pipeline of instantiated transmutations
+
+    'resolve' maps a command name onto its transmutation class or None,
+    options are parsed once here so that running the pipeline over many
+    regions only performs the transmutations themselves.
+    """
+    append_to_sel = False
+    to_parse = user_input
+    if user_input[:1] == "+":
+        to_parse = user_input[1:]
+        append_to_sel = True
+
+    stages = []
+    for command in [c.strip() for c in PIPE_PATTERN.split(to_parse)[1::2]]:
+        # split incoming input into a list by delimiter whitespace
+        input_split = [clean_param(x) for x in tokenize(command)]
+        if not input_split:
+            raise InvalidTransmutation(command)
+        # commands can be named by several words, the longest match wins
+        for words in range(min(COMMAND_WORDS, len(input_split)), 0, -1):
+            command_name = " ".join(input_split[:words])
+            transmutation_class = resolve(command_name)
+            if transmutation_class is not None:
+                break
+        else:
+            raise InvalidTransmutation(command)
+        params = input_split[words:]
+        transmutation = transmutation_class(error_module)
+        try:
+            transmutation.getopt(params)
+        except getopt.GetoptError:
+            # reported by the transmutation itself once it runs
+            pass
+        stages.append(Stage(command, command_name, params, transmutation))
+
+    return Pipeline(user_input, stages, append_to_sel)
+
+
+def run_groups(groups, body, meta=None, timings=None):
+    """Run groups of steps over body one after the other, appending the
+    seconds each group took to timings if given"""
+    output = body
+    for group in groups:
+        started = time.perf_counter()
+        if len(group) > 1:
+            output = "\n".join(stream(iter_lines(output), group, meta))
+        else:
+            output = group[0].apply(output, meta)
+        if timings is not None:
+            timings.append((" | ".join(step.label for step in group),
+                            time.perf_counter() - started))
+    return output
+
+
+def plan(stages):
+    """Reorder, merge and fuse stages into the steps a pipeline runs
+
+    Only built-in swap, strip and filter stages, which map each line onto
+    at most one line, are planned. Runs of two or more of them are fused
+    into a single loop where filters are moved ahead of replacements they
+    commute with and independent replacements are merged into one pass.
+    Any other stage is kept as is and acts as a barrier.
+    """
+    steps = []
+    block = []
+    for stage in stages:
+        op = line_op(stage)
+        if op is not None:
+            block.append(op)
+            continue
+        steps.extend(fuse(block))
+        block = []
+        steps.append(stage)
+    steps.extend(fuse(block))
+    return steps
+
+
+def fuse(ops):
+    """Plan a run of line operations, fusing it if there is more than one"""
+    if len(ops) < 2:
+        return [op.stages[0] for op in ops]
+
+    # push filters ahead of the replacements they commute with
+    ops = list(ops)
+    for i in range(1, len(ops)):
+        j = i
+        while (j > 0 and ops[j].filters and not ops[j-1].filters
+               and commutes(ops[j], ops[j-1])):
+            ops[j-1], ops[j] = ops[j], ops[j-1]
+            ops[j-1].moved = True
+            j -= 1
+
+    # merge neighbouring independent replacements into single passes,
+    # never past the last trimming operation since that is where the
+    # fused loop decides which trailing lines are dropped
+    trims = [i for i, op in enumerate(ops) if op.trims]
+    last_trim = trims[-1] if trims else -1
+    merged = [ops[0]]
+    for i in range(1, len(ops)):
+        op = ops[i]
+        previous = merged[-1]
+        if (not op.filters and not previous.filters
+                and i - 1 != last_trim
+                and independent(previous.pairs, op.pairs)):
+            previous.merge(op)
+        else:
+            merged.append(op)
+
+    return [FusedStage(merged)]
+
+
+def line_op(stage):
+    """Return the one-to-one line operation of a built-in stage if any"""
+    t = stage.transmutation
+    try:
+        opts, args = t.getopt(stage.params)
+    except getopt.GetoptError:
+        return None
+    if opts or any("\n" in arg for arg in args):
+        return None
+    if type(t) is Swap and args and not len(args) % 2 and all(args[::2]):
+        pairs = list(zip(args[::2], args[1::2]))
+        # pairs of one swap are replaced at once, which only equals
+        # replacing them one by one if they are independent
+        if all(independent(pairs[:i], [pair])
+               for i, pair in enumerate(pairs)):
+            return ReplaceOp(stage, pairs, False)
+        return None
+    elif type(t) is Strip and args and args[0]:
+        return ReplaceOp(stage, [(args[0], "")], True)
+    elif type(t) is Filter and args:
+        return FilterOp(stage, args)
+    return None
+
+
+def commutes(filter_op, replace_op):
+    """Tell whether filtering before replacing keeps the same lines"""
+    for pattern in filter_op.patterns:
+        if not pattern:
+            return False
+        for old, new in replace_op.pairs:
+            if overlaps(pattern, old) or overlaps(pattern, new):
+                return False
+            # removing old could join the pattern together
+            if not new and len(pattern) > 1:
+                return False
+    return True
+
+
+def fused_lines(lines, ops):
+    """Run one-to-one line operations over batches of lines
+
+    Replacements never span lines so they run over a whole batch joined
+    together, filters run over the batch as a list. Trailing empty lines
+    are dropped as of the last trimming operation, which covers every
+    earlier one since empty lines stay empty.
+    """
+    lines = iter(lines)
+    trims = [i for i, op in enumerate(ops) if op.trims]
+    split = trims[-1] + 1 if trims else len(ops)
+    head = [(op.filters, op.function()) for op in ops[:split]]
+    tail = [(op.filters, op.function()) for op in ops[split:]]
+    pending = 0
+    empty = True
+    while True:
+        batch = list(islice(lines, FUSE_BATCH))
+        if not batch:
+            break
+        batch = run_ops(batch, head)
+        if not trims:
+            yield from run_ops(batch, tail)
+            continue
+        end = len(batch)
+        while end and not batch[end-1]:
+            end -= 1
+        if end:
+            for i in range(pending):
+                yield ""
+            pending = 0
+            empty = False
+            yield from run_ops(batch[:end], tail)
+        pending += len(batch) - end
+    if trims and empty:
+        yield ""
+
+
+def fused_texts(texts, ops):
+    """Run one-to-one line operations over blocks of whole lines as text
+
+    Gives what fused_lines gives for the lines of every block, as blocks
+    of text to be joined by newlines, without splitting blocks into lines
+    unless a filter needs it: replacements run over a block as it is and
+    filters looking for literals only pick out the lines they keep.
+    """
+    trims = [i for i, op in enumerate(ops) if op.trims]
+    split = trims[-1] + 1 if trims else len(ops)
+    head = [op.text_function() for op in ops[:split]]
+    tail = [op.text_function() for op in ops[split:]]
+    pending = 0
+    empty = True
+    for text in texts:
+        for function in head:
+            text = function(text)
+            if text is None:
+                break
+        if text is None:
+            continue
+        if not trims:
+            for function in tail:
+                text = function(text)
+            yield text
+            continue
+        body = text.rstrip("\n")
+        if not body:
+            pending += len(text) + 1
+            continue
+        if pending:
+            yield "\n" * (pending - 1)
+        pending = len(text) - len(body)
+        empty = False
+        for function in tail:
+            body = function(body)
+        yield body
+    if trims and empty:
+        yield ""
+
+
+def batches(lines, size=FUSE_BATCH):
+    """Join lines back together a batch at a time"""
+    lines = iter(lines)
+    separator = ""
+    while True:
+        batch = list(islice(lines, size))
+        if not batch:
+            return
+        yield separator + "\n".join(batch)
+        separator = "\n"
+
+
+def run_ops(lines, steps):
+    """Apply planned line operations to a non-empty list of lines"""
+    text = None
+    for filters, function in steps:
+        if filters:
+            if text is not None:
+                lines = text.split("\n")
+                text = None
+            lines = function(lines)
+            if not lines:
+                return lines
+        else:
+            if text is None:
+                text = "\n".join(lines)
+            text = function(text)
+    if text is not None:
+        return text.split("\n")
+    return lines
+
+
+def stream(lines, stages, meta=None):
+    """Chain stages over an iterator of lines without joining between them"""
+    for stage in stages:
+        lines = stage.apply_lines(lines, meta)
+    return lines
+
+
+def eval_simple_expr(input_string):
+    """Evaluate simple expression in input string"""
+    if ((len(input_string) > 1)
+            and (input_string[0] == input_string[len(input_string)-1])
+            and (input_string[0] in '`')):
+        return eval_expr(input_string[1:-1])
+    return input_string
+
+
+def clean_param(param):
+    """Strip quotes and evaluate any embedded expressions in param"""
+    return str(eval_simple_expr(strip_quotes(param)))
+
+
+class InvalidTransmutation(Exception):
+    """Exception describing invalid transmutation"""
+
+    def __init__(self, value):
+        self.value = value
+
+    def __str__(self):
+        return repr(self.value)
+
+
+class TestPipeline(unittest.TestCase):
+    """Unit test for compiled pipelines"""
+
+    def setUp(self):
+        self.resolve = {"swap": Swap, "strip": Strip, "dupl": Dupl,
+                        "filter": Filter, "expand": Expand,
+                        "compress": Compress}.get
+
+    def test_compile(self):
+        p = compile_pipeline("swap a 'b c' | strip `2*3`", self.resolve)
+        self.assertEqual([s.name for s in p.stages], ["swap", "strip"])
+        self.assertEqual(p.stages[0].params, ["a", "b c"])
+        self.assertEqual(p.stages[1].params, ["6"])
+        self.assertIsInstance(p.stages[0].transmutation, Swap)
+        resolve = {"swap": Swap, "swap lines": Dupl}.get
+        p = compile_pipeline("swap lines 2 | swap a b", resolve)
+        self.assertEqual([s.name for s in p.stages], ["swap lines", "swap"])
+        self.assertEqual(p.stages[0].params, ["2"])
+
+    def test_run(self):
+        p = compile_pipeline("swap a b | dupl -c", self.resolve)
+        self.assertEqual(p.run("a"), "bb")
+        self.assertEqual(p.run("xa"), "xbxb")
+        p = compile_pipeline("+swap a b", self.resolve)
+        self.assertEqual(p.run("a"), "a\n\nb")
+
+    def test_chunks(self):
+        resolve = {"swap": Swap, "mklist": Mklist}.get
+        for user_input in ("swap a b", "mklist 1 3 | swap 2 x",
+                           "swap a b | mklist 1 3", "+mklist 1 3"):
+            p = compile_pipeline(user_input, resolve)
+            self.assertEqual("".join(p.run_chunks("a")), p.run("a"))
+        self.assertTrue(p.chunked)
+        for user_input in ("+filter -n zz", "+filter -n a", "+filter -nv a"):
+            p = compile_pipeline(user_input, {"filter": Filter}.get)
+            self.assertEqual("".join(p.run_chunks("ab\ncd")),
+                             p.run("ab\ncd"))
+        body = "\n".join("a%d" % i for i in range(FUSE_BATCH * 2 + 5))
+        for user_input in ("swap a b | expand", "+swap a b"):
+            p = compile_pipeline(user_input, resolve={"swap": Swap,
+                                                      "expand": Expand}.get)
+            chunks = list(p.run_chunks(body))
+            self.assertGreater(len(chunks), 2)
+            self.assertEqual("".join(chunks), p.run(body))
+
+    def test_timings(self):
+        p = compile_pipeline("dupl | swap a b | filter b | expand",
+                             self.resolve)
+        timings = []
+        self.assertEqual(p.run("a", timings=timings), "b\n\nb")
+        self.assertEqual([label for label, seconds in timings],
+                         ["dupl", "swap a b + filter b | expand"])
+        resolve = {"swap": Swap, "mklist": Mklist}.get
+        p = compile_pipeline("swap a b | mklist 1 3", resolve)
+        timings = []
+        self.assertEqual("".join(p.run_chunks("a", timings=timings)),
+                         "1\n2\n3")
+        self.assertEqual([label for label, seconds in timings],
+                         ["swap a b", "mklist 1 3"])
+
+    def test_estimate(self):
+        resolve = {"swap": Swap, "dupl": Dupl, "expand": Expand,
+                   "mklist": Mklist, "compress": Compress}.get
+        body = "ab\ncd\n"
+        for user_input in ("swap a b", "dupl 3 | expand 2", "expand | dupl",
+                           "mklist 1 20 | dupl -c 2", "+dupl 4",
+                           "dupl | compress"):
+            p = compile_pipeline(user_input, resolve)
+            # rough, but never below the actual length here
+            output = p.run(body)
+            self.assertGreaterEqual(p.estimate(body), len(output))
+            self.assertLessEqual(p.estimate(body), len(output) * 1.5)
+        p = compile_pipeline("dupl 1000000 | expand 500", resolve)
+        self.assertGreater(p.estimate("a" * 1000), 1 << 30)
+
+    def test_stream(self):
+        body = "a1 x\nb2\na3 y\n\nc4 a\n"
+        for user_input in ("filter a | strip 3 | swap x z",
+                           "strip a | expand | filter 4 | compress",
+                           "swap 1 '' | dupl -c | filter a | strip x",
+                           "filter -n zz | swap a b", "filter -n a | dupl"):
+            p = compile_pipeline(user_input, self.resolve)
+            expected = body
+            for stage in p.stages:
+                expected = stage.apply(expected)
+            self.assertEqual(p.run(body), expected)
+            self.assertEqual("\n".join(p.run_lines(iter_lines(body))),
+                             expected)
+
+    def test_plan(self):
+        p = compile_pipeline("swap a b | swap c d | filter x | strip y",
+                             self.resolve)
+        self.assertEqual(len(p.steps), 1)
+        ops = p.steps[0].ops
+        self.assertTrue(ops[0].filters)
+        self.assertEqual(ops[1].pairs, [("a", "b"), ("c", "d"), ("y", "")])
+        self.assertIn("(moved ahead)", p.explain())
+        self.assertIn("(single pass)", p.explain())
+        self.assertEqual(len(p.line_ops()), 2)
+        p = compile_pipeline("swap a b", self.resolve)
+        self.assertEqual(p.line_ops()[0].pairs, [("a", "b")])
+        for user_input in ("swap a b | dupl", "+swap a b", "expand"):
+            p = compile_pipeline(user_input, self.resolve)
+            self.assertIsNone(p.line_ops())
+
+    def test_texts(self):
+        body = "a1 x\n\nb2\na3 y\n\n\nc4\nb5\n\n"
+        lines = body.split("\n")
+        for user_input in ("filter a | strip 3 | swap x z",
+                           "swap a b | swap 1 2", "strip b | filter 4",
+                           "filter a b"):
+            ops = compile_pipeline(user_input, self.resolve).line_ops()
+            expected = "\n".join(fused_lines(iter(lines), ops))
+            for size in (1, 2, 5):
+                blocks = ["\n".join(lines[i:i + size])
+                          for i in range(0, len(lines), size)]
+                self.assertEqual("\n".join(fused_texts(blocks, ops)),
+                                 expected)
+        p = compile_pipeline("swap a b | swap b c | filter ab", self.resolve)
+        self.assertEqual(len(p.steps[0].ops), 3)
+        self.assertFalse(p.steps[0].ops[0].filters)
+        p = compile_pipeline("swap a b | expand | swap c d", self.resolve)
+        self.assertEqual([s.name for s in p.steps], ["swap", "expand", "swap"])
+        p = compile_pipeline("swap a b c d | swap x y | swap b a a b",
+                             self.resolve)
+        self.assertEqual(p.steps[0].ops[0].pairs,
+                         [("a", "b"), ("c", "d"), ("x", "y")])
+        self.assertEqual(p.steps[0].ops[0].stages, p.stages[:2])
+        self.assertEqual(p.steps[1], p.stages[2])
+
+    def test_fused(self):
+        bodies = ["", "\n", "ab\nba\n\nxa\n", "b\nxy\nay\nyy\n\n",
+                  "cab\nabc\nxbx\nb"]
+        for user_input in ("swap a b | swap c d | filter x | strip y",
+                           "swap a b | swap b c | filter ab | strip c",
+                           "strip a | swap b '' | swap x y",
+                           "filter a | filter b | strip ab | swap c x",
+                           "strip y | swap x '' | filter a | swap b c",
+                           "swap a b c d | filter b | swap x y",
+                           "swap a b b a | strip y | swap -w x z",
+                           "filter a x | swap b c | filter -v y"):
+            p = compile_pipeline(user_input, self.resolve)
+            for body in bodies:
+                expected = body
+                for stage in p.stages:
+                    expected = stage.apply(expected)
+                self.assertEqual(p.run(body), expected)
+
+    def test_invalid(self):
+        self.assertRaises(InvalidTransmutation,
+                          compile_pipeline, "swap a b | nope", self.resolve)
+
+    def test_cache(self):
+        cache = PipelineCache(limit=2)
+        p = cache.get("swap a b", self.resolve)
+        self.assertIs(cache.get("swap a b", self.resolve), p)
+        cache.get("strip a", self.resolve)
+        cache.get("dupl", self.resolve)
+        self.assertEqual(list(cache.pipelines), ["strip a", "dupl"])
+        self.assertIsNot(cache.get("swap a b", self.resolve), p)
@@ -22,21 +22,66 @@
 
 '''
 
+import io
+import os
 import sublime
 import sublime_plugin
-import re
-import inspect
+import itertools
+from .loadtime import (load_timer, warm_up, over_budget,
+                       describe_load_times, LOAD_TIME_BUDGET)
+
+_loaded = load_timer("plugin")
+
 from .commands import *
+# custom commands are timed here, custom.py is left for users to edit
+_custom_loaded = load_timer("custom")
 from .custom import *
+_custom_loaded()
 from .alias import *
+from .pipeline import PipelineCache, InvalidTransmutation, OUTPUT_BUDGET
+from .executor import (run_regions, execution_mode, WORKER_POOL,
+                       PARALLEL_MIN_REGIONS, PARALLEL_MIN_CHARS)
+from .transport import TRANSPORT, HTTP_TIMEOUT, HTTP_POOL_SIZE
+from .httpcache import HTTP_CACHE, HTTP_CACHE_SIZE
+from .mdcache import MARKDOWN_CACHE, MARKDOWN_CACHE_BLOCKS
+from .state import SessionState
+from .timing import RunTimer, PROFILE_DIRECTORY
+from .largefile import transmute_path, output_path, format_bytes
+from .preview import Preview, PREVIEW_LIMITS, preview_html
+from .cli import file_meta
+
+SETTINGS_FILE = "TextTransmute.sublime-settings"
+PIPELINES = PipelineCache()
+PENDING_RUNS = itertools.count()
+WARM_UP_DELAY = 2000
+# transmuted files are only opened in the editor up to this many bytes
+FILE_OPEN_LIMIT = 16 << 20
+STATE = SessionState()
+
+
+def plugin_loaded():
+    settings = sublime.load_settings(SETTINGS_FILE)
+    settings.add_on_change("text_transmute", apply_settings)
+    apply_settings()
+    # (re)defined custom commands invalidate compiled pipelines
+    REGISTRY.add_listener(forget_pipelines)
+    STATE.load('%s/%s' % (sublime.packages_path(), "TextTransmute"))
+
+    budget = load_time_budget(settings)
+    if over_budget(budget):
+        print("TextTransmute: loading took longer than budgeted\n%s" %
+              describe_load_times(budget))
+    # import http and markdown dependencies once the editor settled down
+    if settings.get("warm_up", True):
+        sublime.set_timeout_async(warm_up, WARM_UP_DELAY)
+
+
+def plugin_unloaded():
+    REGISTRY.remove_listener(forget_pipelines)
+    TRANSPORT.close()
+    WORKER_POOL.close()
+    STATE.flush()
 
-HISTORY_LIMIT = 24
-AVAILABLE_COMMANDS = [["...", "New Blank Transmutation"]] + \
-                      [[t.__name__.lower(), inspect.getdoc(t)]
-                      for t in globals().values()
-                      if (('TextTransmute.commands' in str(t)
-                      or 'TextTransmute.custom' in str(t))
-                      and 'test' not in str(t).lower())]
 
 # Sublime Text Plugin Commands
 
@@ -45,91 +90,204 @@ class TextTransmuteParseCommand(sublime_plugin.TextCommand):
 
     def run(self, edit, user_input):
 
-        generate_data_files()
-
-        success = True
-        append_to_sel = False
         active_view = sublime.active_window().active_view()
         meta = sublime.active_window().extract_variables()
-        region_set = active_view.sel()
+        region_set = list(active_view.sel())
+        settings = sublime.load_settings(SETTINGS_FILE)
         err_log = WindowErrorLogger()
-        ws_pattern = re.compile(r'''((?:[^\s"'`]|"[^"]*"|'[^']*'|`[^`]*`)+)''')
-        pipe_pattern = re.compile(r'''((?:[^|"'`]|"[^"]*"|'[^']*'|`[^`]*`)+)''')
-
-        def strip_quotes(input_string):
-            """Strip quotes from input string"""
-            if ((input_string[0] == input_string[len(input_string)-1])
-                    and (input_string[0] in ('"', "'"))):
-                return input_string[1:-1]
-            return input_string
-
-        def eval_simple_expr(input_string):
-            """Evaluate simple expression in input string"""
-            if ((input_string[0] == input_string[len(input_string)-1])
-                    and (input_string[0] in '`')):
-                return eval_expr(input_string[1:-1])
-            return input_string
-
-        def clean_param(param):
-            """Strip quotes and evaluate any embedded expressions in param"""
-            return str(eval_simple_expr(strip_quotes(param)))
-
-        if user_input[0] == "+":
-            to_parse = user_input[1:]
-            append_to_sel = True
-        else:
-            to_parse = user_input
-
-        command_list = [c.strip() for c in pipe_pattern.split(to_parse)[1::2]]
-
-        for region in region_set:
-
-            body = active_view.substr(region)
-
-            for command in command_list:
-
-                params = None
-                # split incoming input into a list by delimiter whitespace
-                input_split = [clean_param(x)
-                               for x in ws_pattern.split(command)[1::2]]
-                command_name = input_split[0]
-                if input_split:
-                    params = input_split[1:]
-                if command_name.capitalize() in globals():
-                    try:
-                        t = globals()[command_name.capitalize()](err_log)
-                        body = str(t.transmute(body=body, params=params, meta=meta))
-                    except Exception as e:
-                        success = False
-                        err_log.display_err("Transmute Error: '%s'" % (str(e)))
-                        break
-                else:
-                    success = False
-                    err_log.display_err("%s: '%s' %s" % ("Transmute Error",
-                                                         command,
-                                                         "is not a command."))
-                    raise InvalidTransmutation(command)
-                if append_to_sel:
-                    body = active_view.substr(region)+'\n\n'+body
+        timer = RunTimer(user_input, settings.get("profile", False))
+
+        with timer.measure("parse"):
+            pipeline = get_pipeline(user_input, err_log)
+        if pipeline is None:
+            return
+
+        bodies = [active_view.substr(region) for region in region_set]
+
+        def transmute():
+            with timer.measure("transmute"):
+                return run_regions(pipeline,
+                                   bodies,
+                                   meta,
+                                   settings.get("workers", 0),
+                                   settings.get("parallel_min_regions",
+                                                PARALLEL_MIN_REGIONS),
+                                   settings.get("parallel_min_chars",
+                                                PARALLEL_MIN_CHARS),
+                                   timer,
+                                   err_log)
+
+        # replaced in a single edit and undo step unless too large for it
+        streamed = False
+
+        budget = settings.get("output_budget", OUTPUT_BUDGET)
+        if budget:
+            with timer.measure("parse"):
+                projected = sum(pipeline.estimate(body) for body in bodies)
+            if projected > budget:
+                if not sublime.ok_cancel_dialog(
+                        "'%s' would produce about %s of text, over the "
+                        "output budget of %s.\n\nTransmute anyway?" %
+                        (user_input, format_bytes(projected),
+                         format_bytes(budget)), "Transmute"):
+                    sublime.status_message("Transmutation cancelled")
+                    return
+                # insert a chunk at a time rather than building it all
+                streamed = len(region_set) == 1 and (pipeline.chunked or
+                                                     pipeline.line_local)
+
+        if streamed:
+            timings = []
+            self.stream(active_view,
+                        user_input,
+                        region_set[0],
+                        bodies[0],
+                        pipeline.run_chunks(bodies[0], meta, timings),
+                        timer,
+                        timings)
+            return
+
+        if execution_mode(pipeline) != "thread":
+            self.apply(active_view, user_input, region_set, transmute(),
+                       timer)
+            return
+
+        # wait on the network off the ui thread, the view keeps track of
+        # where the regions move to in the meantime
+        key = "text_transmute_pending_%d" % next(PENDING_RUNS)
+        active_view.add_regions(key, region_set, "", "", sublime.HIDDEN)
+        sublime.status_message("Transmuting %d selection(s)..." %
+                               len(region_set))
+
+        def on_transmuted(outcomes):
+            regions = active_view.get_regions(key)
+            active_view.erase_regions(key)
+            if len(regions) != len(region_set):
+                # selections merged or were deleted, there is no telling
+                # which output belongs where anymore
+                err_log.display_err("Transmute Error: the selections "
+                                    "changed while '%s' was running, "
+                                    "nothing was replaced" % user_input)
+                return
+            self.apply(active_view, user_input, regions, outcomes, timer)
+
+        def run_async():
+            outcomes = transmute()
+            sublime.set_timeout(lambda: on_transmuted(outcomes), 0)
+
+        sublime.set_timeout_async(run_async, 0)
+
+    def apply(self, active_view, user_input, regions, outcomes, timer):
+
+        success = True
+        err_log = WindowErrorLogger()
+        results = []
+        messages = []
 
-            transmutation_inputs = {"region_begin" : region.begin(),
-                                    "region_end" : region.end(),
-                                    "string" : body}
+        for region, (transmuted, body, errors) in zip(regions, outcomes):
 
-            active_view.run_command("text_transmute_exec",
-                                    transmutation_inputs)
+            # the same error is shown once however many regions hit it
+            for message in errors:
+                if message not in messages:
+                    messages.append(message)
+
+            if not transmuted:
+                success = False
+                message = "Transmute Error: '%s'" % (body)
+                if message not in messages:
+                    messages.append(message)
+                continue
+
+            results.append([region.begin(), region.end(), body])
+
+        for message in messages:
+            err_log.display_err(message)
+
+        # every region is replaced in a single edit and undo step
+        with timer.measure("apply"):
+            if results:
+                active_view.run_command("text_transmute_exec",
+                                        {"results": results})
 
         if success:
-            append_to_history(user_input)
-            reset_current_input()
+            STATE.append_to_history(user_input)
+            STATE.reset_current_input()
+        report_timings(timer)
+
+    def stream(self, active_view, user_input, region, original, chunks,
+               timer, timings):
+        """Replace region with chunks, inserting one chunk at a time
+
+        Only used for output over the budget. The editor gets to redraw
+        and handle input between chunks, the view keeps track of where
+        the inserted text moves to meanwhile. Every chunk is its own
+        undo step, on an error the inserted text is replaced with the
+        original text of region again.
+        """
+
+        key = "text_transmute_pending_%d" % next(PENDING_RUNS)
+        err_log = WindowErrorLogger()
+
+        def insert(target, done):
+            try:
+                with timer.measure("transmute"):
+                    chunk = next(chunks)
+            except StopIteration:
+                if done is None:
+                    # no output at all still replaces the selection
+                    with timer.measure("apply"):
+                        active_view.run_command(
+                            "text_transmute_exec",
+                            {"results": [[target.begin(), target.end(),
+                                          ""]]})
+                active_view.erase_regions(key)
+                timer.add_region(timings)
+                STATE.append_to_history(user_input)
+                STATE.reset_current_input()
+                report_timings(timer)
+                return
+            except Exception as e:
+                if done is not None:
+                    active_view.run_command("text_transmute_exec",
+                                            {"results": [[done.begin(),
+                                                          done.end(),
+                                                          original]]})
+                active_view.erase_regions(key)
+                err_log.display_err("Transmute Error: '%s'" % (str(e)))
+                return
+
+            with timer.measure("apply"):
+                active_view.run_command("text_transmute_exec",
+                                        {"results": [[target.begin(),
+                                                      target.end(),
+                                                      chunk]]})
+            done = sublime.Region(done.begin() if done else target.begin(),
+                                  target.begin() + len(chunk))
+            active_view.add_regions(key, [done], "", "", sublime.HIDDEN)
+            sublime.status_message("Transmuting... %d characters" %
+                                   done.size())
+
+            def insert_next():
+                regions = active_view.get_regions(key)
+                if regions:
+                    end = regions[0].end()
+                    insert(sublime.Region(end, end), regions[0])
+
+            sublime.set_timeout(insert_next, 0)
+
+        insert(region, None)
+
 
 class TextTransmuteExecCommand(sublime_plugin.TextCommand):
-    """ST3 plugin class for replacing selected area with its mutation"""
+    """ST3 plugin class for replacing selected areas with their mutations"""
 
-    def run(self, edit, region_begin, region_end, string):
-        self.view.replace(edit,
-                          sublime.Region(region_begin, region_end),
-                          string)
+    def run(self, edit, results):
+        # replace from the last region back so earlier offsets stay valid
+        for region_begin, region_end, string in sorted(results,
+                                                       reverse=True):
+            self.view.replace(edit,
+                              sublime.Region(region_begin, region_end),
+                              string)
 
 
 class TextTransmuteInitCommand(sublime_plugin.TextCommand):
@@ -137,19 +295,25 @@ class TextTransmuteInitCommand(sublime_plugin.TextCommand):
 
     def run(self, edit):
 
+        available_commands = REGISTRY.quick_panel_items()
+        preview = ViewPreview(self.view)
+
         def on_done(text):
+            preview.close()
             self.view.run_command("text_transmute_parse", {"user_input": text})
-            reset_current_input()
+            STATE.reset_current_input()
 
         def on_change(text):
-            set_current_input(text)
+            STATE.set_current_input(text)
+            preview.update(text)
 
         def on_cancel():
-            reset_current_input()
+            preview.close()
+            STATE.reset_current_input()
 
         def on_select(selected_index):
 
-            current_input = get_current_input()
+            current_input = STATE.get_current_input()
             pipe = ""
             ws = " "
 
@@ -159,25 +323,28 @@ class TextTransmuteInitCommand(sublime_plugin.TextCommand):
                                                          on_done,
                                                          on_change,
                                                          on_cancel)
+                preview.update(current_input)
 
             elif selected_index > 0:
                 if len(current_input) > 1:
                     pipe = " | "
                 updated_input = (current_input +
                                  pipe +
-                                 AVAILABLE_COMMANDS[selected_index][0] +
+                                 available_commands[selected_index][0] +
                                  ws)
                 sublime.active_window().show_input_panel("Transmute Selection",
                                                          updated_input,
                                                          on_done,
                                                          on_change,
                                                          on_cancel)
-                set_current_input(updated_input)
+                STATE.set_current_input(updated_input)
+                preview.update(updated_input)
 
             else:
                 pass
 
-        sublime.active_window().show_quick_panel(AVAILABLE_COMMANDS, on_select)
+        sublime.active_window().show_quick_panel(available_commands,
+                                                 on_select)
 
 
 class TextTransmuteEditKeyBinds(sublime_plugin.TextCommand):
@@ -202,6 +369,16 @@ class TextTransmuteAddCustomCommands(sublime_plugin.TextCommand):
         sublime.active_window().open_file(custom_commands_path)
 
 
+class TextTransmuteEditSettings(sublime_plugin.TextCommand):
+    """ST3 plugin class for editing settings"""
+
+    def run(self, edit):
+        settings_path = '%s/%s/%s' % (sublime.packages_path(),
+                                      "TextTransmute",
+                                      SETTINGS_FILE)
+        sublime.active_window().open_file(settings_path)
+
+
 class TextTransmuteEditAlias(sublime_plugin.TextCommand):
     """ST3 plugin class for adding and editing aliases"""
 
@@ -231,16 +408,20 @@ class TextTransmuteHistory(sublime_plugin.TextCommand):
 
     def run(self, edit):
 
-        history = get_history()
+        history = STATE.get_history()
+        preview = ViewPreview(self.view)
 
         def on_done(text):
+            preview.close()
             self.view.run_command("text_transmute_parse", {"user_input": text})
 
         def on_change(text):
-            set_current_input(text)
+            STATE.set_current_input(text)
+            preview.update(text)
 
         def on_cancel():
-            reset_current_input()
+            preview.close()
+            STATE.reset_current_input()
 
         def on_select(selected_index):
             sublime.active_window().show_input_panel("Transmute Selection",
@@ -248,85 +429,272 @@ class TextTransmuteHistory(sublime_plugin.TextCommand):
                                                    on_done,
                                                    on_change,
                                                    on_cancel)
+            preview.update(history[selected_index])
 
         sublime.active_window().show_quick_panel(history, on_select)
 
 
-# Helpers
+class TextTransmuteExplain(sublime_plugin.TextCommand):
+    """ST3 plugin class for explaining how a transmutation is planned"""
 
-def get_current_input():
-    """Get current input value from Data.sublime-project"""
+    def run(self, edit):
 
-    try:
-        f = open('%s/%s/%s' % (sublime.packages_path(),
-                               "TextTransmute",
-                               "Data.sublime-project"), 'r')
-        return f.read()
-    except FileNotFoundError:
-        f = open('%s/%s/%s' % (sublime.packages_path(),
-                               "TextTransmute",
-                               "Data.sublime-project"), 'w')
-        f.write("")
-        f.close()
-        return ""
+        def on_done(text):
+            pipeline = get_pipeline(text, WindowErrorLogger())
+            if pipeline is None:
+                return
+            show_output("transmute_explain", pipeline.explain())
 
+        sublime.active_window().show_input_panel("Explain Transmutation",
+                                                 STATE.get_current_input(),
+                                                 on_done,
+                                                 None,
+                                                 None)
 
-def set_current_input(text):
-    """Set current input value in Data.sublime-project"""
 
-    f = open('%s/%s/%s' % (sublime.packages_path(),
-                           "TextTransmute",
-                           "Data.sublime-project"), 'w')
-    f.write(text)
-    f.close()
+class TextTransmuteFile(sublime_plugin.TextCommand):
+    """ST3 plugin class for transmuting a file on disk without opening it"""
 
+    def run(self, edit, path=None, user_input=None):
 
-def reset_current_input():
-    """Reset current input value in Data.sublime-project"""
+        window = sublime.active_window()
 
-    file_name = '%s/%s/%s' % (sublime.packages_path(),
-                              "TextTransmute",
-                              "Data.sublime-project")
-    with open(file_name, "w"):
-        pass
+        def ask(caption, initial, key):
+            def on_done(text):
+                args = {"path": path, "user_input": user_input}
+                args[key] = text
+                self.view.run_command("text_transmute_file", args)
+            window.show_input_panel(caption, initial, on_done, None, None)
 
+        if path is None:
+            ask("Transmute File", self.view.file_name() or "", "path")
+            return
+        if user_input is None:
+            ask("Transmute File With", STATE.get_current_input(),
+                "user_input")
+            return
 
-def get_history():
-    """Get command usage history from History.sublime-project"""
+        err_log = WindowErrorLogger()
+        pipeline = get_pipeline(user_input, err_log)
+        if pipeline is None:
+            return
+        if not all(step.line_local for step in pipeline.steps):
+            err_log.display_err("Transmute Error: '%s' %s" %
+                                (user_input,
+                                 "is not line local, only pipelines of "
+                                 "line local commands transmute files."))
+            return
+
+        path = os.path.abspath(os.path.expanduser(path.strip()))
+        settings = sublime.load_settings(SETTINGS_FILE)
+        to_view = settings.get("large_file_output", "file") == "view"
+        target = None if to_view else output_path(path)
+        # the cached pipeline may be used on the ui thread meanwhile
+        pipeline = pipeline.copy()
+        name = os.path.basename(path)
+
+        def progress(stats):
+            sublime.set_timeout(lambda: sublime.status_message(
+                "Transmuting %s... %s of %s" % (name,
+                                                format_bytes(stats.read),
+                                                format_bytes(stats.size))),
+                0)
+
+        def run_async():
+            try:
+                if to_view:
+                    out = io.BytesIO()
+                    stats = transmute_path(pipeline, path, out,
+                                           file_meta(path), progress=progress)
+                else:
+                    with open(target, "wb") as out:
+                        stats = transmute_path(pipeline, path, out,
+                                               file_meta(path),
+                                               progress=progress)
+            except Exception as e:
+                if target and os.path.exists(target):
+                    os.remove(target)
+                message = "Transmute Error: '%s'" % (str(e))
+                sublime.set_timeout(lambda: err_log.display_err(message), 0)
+                return
+            sublime.set_timeout(lambda: on_transmuted(stats, out), 0)
+
+        def on_transmuted(stats, out):
+            message = "Transmuted %s: %s" % (name, stats.describe())
+            if target:
+                message += " to %s" % target
+            sublime.status_message(message)
+            print("TextTransmute: %s" % message)
+            if to_view:
+                view = window.new_file()
+                view.set_name("%s (%s)" % (name, user_input))
+                view.run_command("append", {"characters":
+                                            out.getvalue().decode("utf-8")})
+            elif stats.written <= FILE_OPEN_LIMIT:
+                window.open_file(target)
+            STATE.append_to_history(user_input)
+
+        sublime.status_message("Transmuting %s..." % name)
+        sublime.set_timeout_async(run_async, 0)
+
+
+class TextTransmuteHttpStats(sublime_plugin.TextCommand):
+    """ST3 plugin class for showing pooled http connection statistics"""
 
-    f = open('%s/%s/%s' % (sublime.packages_path(),
-                           "TextTransmute",
-                           "History.sublime-project"), 'r')
-    content = f.readlines()
-    f.close()
-    return [x.strip() for x in content]
+    def run(self, edit):
+        show_output("transmute_http_stats", TRANSPORT.describe_stats())
 
 
-def append_to_history(text):
-    """Append to command usage history in History.sublime-project"""
+class TextTransmuteMarkdownStats(sublime_plugin.TextCommand):
+    """ST3 plugin class for showing markdown render cache statistics"""
 
-    file_name = '%s/%s/%s' % (sublime.packages_path(),
-                              "TextTransmute",
-                              "History.sublime-project")
-    with open(file_name, 'r') as fin:
-        data = fin.read().splitlines(True)
-    with open(file_name, 'w') as fout:
-        if len(data) > HISTORY_LIMIT:
-            fout.writelines(data[1:] + ["\n" + text])
-        elif len(data) < 1:
-            fout.writelines([text])
-        else:
-            fout.writelines(data + ["\n" + text])
+    def run(self, edit):
+        show_output("transmute_markdown_stats",
+                    MARKDOWN_CACHE.describe_stats())
 
 
-def reset_history():
-    """Reset command usage history in History.sublime-project"""
+class TextTransmuteLoadTime(sublime_plugin.TextCommand):
+    """ST3 plugin class for showing how long the plugin took to load"""
 
-    f = open('%s/%s/%s' % (sublime.packages_path(),
-                           "TextTransmute",
-                           "History.sublime-project"), 'w')
-    f.write("")
-    f.close()
+    def run(self, edit):
+        budget = load_time_budget(sublime.load_settings(SETTINGS_FILE))
+        show_output("transmute_load_time", describe_load_times(budget))
+
+
+# Helpers
+
+class ViewPreview(Preview):
+    """Preview of a transmutation in phantoms below the first selections
+    of a view, updated as the input is typed unless turned off"""
+
+    def __init__(self, view):
+        settings = sublime.load_settings(SETTINGS_FILE)
+        limits = PREVIEW_LIMITS._replace(
+            delay=settings.get("preview_delay_ms", PREVIEW_LIMITS.delay),
+            regions=settings.get("preview_max_selections",
+                                 PREVIEW_LIMITS.regions),
+            lines=settings.get("preview_max_lines", PREVIEW_LIMITS.lines),
+            chars=settings.get("preview_max_chars", PREVIEW_LIMITS.chars))
+        self.enabled = settings.get("preview", True)
+        selection = view.sel()
+        self.regions = [selection[i] for i in
+                        range(min(len(selection), limits.regions))]
+        # only the start of every selection is read, one character more
+        # than previewed tells whether it was cut off
+        bodies = [view.substr(sublime.Region(region.begin(),
+                                             min(region.end(),
+                                                 region.begin() +
+                                                 limits.chars + 1)))
+                  for region in self.regions]
+        self.phantoms = sublime.PhantomSet(view, "text_transmute_preview")
+        super(ViewPreview, self).__init__(
+            bodies,
+            view.window().extract_variables(),
+            REGISTRY.resolve,
+            self.show_phantoms,
+            sublime.set_timeout,
+            lambda callback: sublime.set_timeout_async(callback, 0),
+            limits,
+            settings.get("output_budget", OUTPUT_BUDGET),
+            len(selection))
+
+    def update(self, user_input):
+        if self.enabled:
+            super(ViewPreview, self).update(user_input)
+
+    def close(self):
+        super(ViewPreview, self).close()
+        self.phantoms.update([])
+
+    def show_phantoms(self, outputs, note):
+        contents = [preview_html(output, "" if i else note)
+                    for i, output in enumerate(outputs)]
+        if not contents and note:
+            contents = [preview_html("", note)]
+        self.phantoms.update([sublime.Phantom(sublime.Region(region.end()),
+                                              content,
+                                              sublime.LAYOUT_BLOCK)
+                              for region, content in zip(self.regions,
+                                                         contents)])
+
+
+def apply_settings():
+    """Apply settings to http transport, caches, expressions and workers"""
+
+    settings = sublime.load_settings(SETTINGS_FILE)
+    TRANSPORT.configure(settings.get("http_timeout", HTTP_TIMEOUT),
+                        settings.get("http_pool_size", HTTP_POOL_SIZE))
+    HTTP_CACHE.configure('%s/%s/%s' % (sublime.packages_path(),
+                                       "TextTransmute",
+                                       "HttpCache"),
+                         settings.get("http_cache_size", HTTP_CACHE_SIZE),
+                         settings.get("http_cache", False))
+    MARKDOWN_CACHE.configure(settings.get("markdown_cache_blocks",
+                                          MARKDOWN_CACHE_BLOCKS))
+    configure_expr_limits(digits=settings.get("expr_max_digits",
+                                              EXPR_LIMITS.digits),
+                          depth=settings.get("expr_max_depth",
+                                             EXPR_LIMITS.depth),
+                          nodes=settings.get("expr_max_terms",
+                                             EXPR_LIMITS.nodes),
+                          seconds=settings.get("expr_time_limit",
+                                               EXPR_LIMITS.seconds))
+    # workers keep the limits and settings they were forked with
+    WORKER_POOL.close()
+
+
+def report_timings(timer):
+    """Show where the time of a transmutation went, logging the details
+    and writing the profile as configured"""
+
+    settings = sublime.load_settings(SETTINGS_FILE)
+    sublime.status_message(timer.summary())
+    if settings.get("log_timings", False):
+        print(timer.describe())
+    if timer.profiler is not None:
+        path = timer.dump_profile('%s/%s/%s' % (sublime.packages_path(),
+                                                "TextTransmute",
+                                                PROFILE_DIRECTORY))
+        print("TextTransmute: profile of '%s' written to %s" %
+              (timer.user_input, path))
+
+
+def load_time_budget(settings):
+    """Return seconds the plugin is budgeted to load in"""
+
+    return settings.get("load_time_budget_ms",
+                        LOAD_TIME_BUDGET * 1000) / 1000.0
+
+
+def show_output(name, text):
+    """Show text in an output panel of the active window"""
+
+    window = sublime.active_window()
+    panel = window.create_output_panel(name)
+    panel.run_command("append", {"characters": text})
+    window.run_command("show_panel", {"panel": "output." + name})
+
+
+def get_pipeline(user_input, err_log):
+    """Get compiled pipeline for user input, displaying any parse error"""
+
+    try:
+        return PIPELINES.get(user_input, REGISTRY.resolve, err_log)
+    except InvalidTransmutation as e:
+        err_log.display_err("%s: '%s' %s" % ("Transmute Error",
+                                             e.value,
+                                             "is not a command."))
+    except Exception as e:
+        err_log.display_err("Transmute Error: '%s'" % (str(e)))
+    return None
+
+
+def forget_pipelines(info):
+    """Drop compiled pipelines and the worker processes forked with the
+    previous commands once a command is (re)registered"""
+
+    PIPELINES.clear()
+    WORKER_POOL.close()
 
 
 def format_platform(platform):
@@ -338,25 +706,6 @@ def format_platform(platform):
         return platform.upper()
 
 
-def generate_data_files():
-    """Generate data files for use by plugin"""
-
-    data_file_name = '%s/%s/%s' % (sublime.packages_path(),
-                                   "TextTransmute",
-                                   "Data.sublime-project")
-    hist_file_name = '%s/%s/%s' % (sublime.packages_path(),
-                                   "TextTransmute",
-                                   "History.sublime-project")
-    try:
-        file = open(data_file_name, 'r')
-    except FileNotFoundError:
-        file = open(data_file_name, 'w')
-    try:
-        file = open(hist_file_name, 'r')
-    except FileNotFoundError:
-        file = open(hist_file_name, 'w')
-
-
 # Exception Handling
 
 class WindowErrorLogger(object):
@@ -366,11 +715,4 @@ class WindowErrorLogger(object):
         sublime.error_message(message)
 
 
-class InvalidTransmutation(Exception):
-    """Exception describing invalid transmutation"""
-
-    def __init__(self, value):
-        self.value = value
-
-    def __str__(self):
-        return repr(self.value)
+_loaded()
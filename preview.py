@@ -0,0 +1,267 @@
+import html
+import unittest
+from collections import namedtuple
+
+try:
+    from .pipeline import compile_pipeline, InvalidTransmutation
+except (ImportError, ValueError, SystemError):
+    from pipeline import compile_pipeline, InvalidTransmutation
+
+# milliseconds of quiet before the input is previewed, and how much of
+# the selections a preview transmutes and shows
+PreviewLimits = namedtuple("PreviewLimits", ["delay", "regions", "lines",
+                                             "chars"])
+PREVIEW_LIMITS = PreviewLimits(delay=300, regions=10, lines=100,
+                               chars=1 << 16)
+
+
+class Preview(object):
+    """Transmutes the start of the first selections as the input changes
+
+    Every change is previewed once the input stayed the same for delay
+    milliseconds. Pipelines are compiled afresh and run on the async
+    thread, stopping between chunks of output as soon as the input
+    changed again, so only the latest input is ever shown. show is
+    called on the main thread with the output of every previewed body
+    and a note about the preview, such as an error.
+
+    schedule(callback, delay) and run_async(callback) hand callbacks to
+    the main and the async thread, as sublime.set_timeout and
+    sublime.set_timeout_async do.
+    """
+
+    def __init__(self, bodies, meta, resolve, show, schedule, run_async,
+                 limits=PREVIEW_LIMITS, budget=0, total=None):
+        heads = [head(body, limits.lines, limits.chars)
+                 for body in bodies[:limits.regions]]
+        self.samples = [text for text, clipped in heads]
+        self.clipped = any(clipped for text, clipped in heads)
+        self.total = len(bodies) if total is None else total
+        self.meta = meta
+        self.resolve = resolve
+        self.show = show
+        self.schedule = schedule
+        self.run_async = run_async
+        self.limits = limits
+        self.budget = budget
+        self.generation = 0
+
+    def update(self, user_input):
+        """Preview user_input once it has not changed for a while"""
+        self.generation += 1
+        generation = self.generation
+        if not user_input.strip():
+            self.show([], "")
+            return
+
+        def start():
+            if generation == self.generation:
+                self.run_async(lambda: self.evaluate(generation, user_input))
+
+        self.schedule(start, self.limits.delay)
+
+    def close(self):
+        """Forget the input, nothing scheduled or running is shown"""
+        self.generation += 1
+
+    def stale(self, generation):
+        return generation != self.generation
+
+    def evaluate(self, generation, user_input):
+        """Transmute the samples and show the result, unless stale"""
+        if self.stale(generation):
+            return
+        errors = PreviewErrors()
+        try:
+            pipeline = compile_pipeline(user_input, self.resolve, errors)
+        except InvalidTransmutation as e:
+            self.publish(generation, [], "'%s' is not a command" % e.value)
+            return
+        except Exception as e:
+            self.publish(generation, [], str(e))
+            return
+        if any(stage.transmutation.io_bound for stage in pipeline.stages):
+            self.publish(generation, [], "transmutations waiting on the "
+                         "network are not previewed")
+            return
+        if self.budget and sum(map(pipeline.estimate,
+                                   self.samples)) > self.budget:
+            self.publish(generation, [], "output too large to preview")
+            return
+
+        outputs = []
+        try:
+            for body in self.samples:
+                output = []
+                size = 0
+                for chunk in pipeline.run_chunks(body, self.meta):
+                    if self.stale(generation):
+                        return
+                    output.append(chunk)
+                    size += len(chunk)
+                    if size > self.limits.chars:
+                        break
+                outputs.append(head("".join(output), self.limits.lines,
+                                    self.limits.chars)[0])
+        except Exception as e:
+            self.publish(generation, [], str(e) or type(e).__name__)
+            return
+        self.publish(generation, outputs,
+                     errors.messages[0] if errors.messages else self.note())
+
+    def publish(self, generation, outputs, note):
+        def show():
+            if not self.stale(generation):
+                self.show(outputs, note)
+        self.schedule(show, 0)
+
+    def note(self):
+        """Describe what part of the selections is previewed"""
+        notes = []
+        if self.total > len(self.samples):
+            notes.append("first %d of %d selections" % (len(self.samples),
+                                                        self.total))
+        if self.clipped:
+            notes.append("first %d lines" % self.limits.lines)
+        return ", ".join(notes)
+
+
+class PreviewErrors(object):
+    """Error module keeping transmutation errors for the preview"""
+
+    def __init__(self):
+        self.messages = []
+
+    def display_err(self, message):
+        self.messages.append(message)
+
+
+def head(body, lines, chars):
+    """Return the first lines of body, at most chars long, and whether
+    anything was cut off"""
+    end = -1
+    for i in range(lines):
+        end = body.find("\n", end + 1, chars)
+        if end == -1:
+            return body[:chars], len(body) > chars
+    return body[:end], True
+
+
+def preview_html(text, note=""):
+    """Phantom content showing text as it would be inserted"""
+    content = "<br>".join(html.escape(line, quote=False).replace(" ",
+                                                                 "&nbsp;")
+                          for line in text.split("\n"))
+    if note:
+        content += '%s<i>%s</i>' % ("<br>" if text else "",
+                                    html.escape(note, quote=False))
+    return ('<body id="text-transmute-preview">'
+            '<div style="padding: 0.3rem; font-family: monospace">%s</div>'
+            '</body>' % content)
+
+
+class TestPreview(unittest.TestCase):
+    """Unit test for previewing transmutations while typing"""
+
+    def setUp(self):
+        try:
+            from .commands import Swap, Dupl, Http, Mklist
+        except (ImportError, ValueError, SystemError):
+            from commands import Swap, Dupl, Http, Mklist
+        self.resolved = []
+        commands = {"swap": Swap, "dupl": Dupl, "http": Http,
+                    "mklist": Mklist}
+
+        def resolve(name):
+            self.resolved.append(name)
+            return commands.get(name)
+
+        self.resolve = resolve
+        self.main = []
+        self.background = []
+        self.shown = []
+
+    def preview(self, bodies, **kwargs):
+        return Preview(bodies, {}, self.resolve,
+                       lambda outputs, note: self.shown.append((outputs,
+                                                                note)),
+                       lambda callback, delay: self.main.append(callback),
+                       self.background.append, **kwargs)
+
+    def run_all(self):
+        while self.main or self.background:
+            queue = self.main or self.background
+            queue.pop(0)()
+
+    def test_default(self):
+        preview = self.preview(["a1", "ba"])
+        preview.update("swap a x")
+        self.run_all()
+        self.assertEqual(self.shown, [(["x1", "bx"], "")])
+
+    def test_debounce(self):
+        preview = self.preview(["a"])
+        for user_input in ("s", "sw", "swap a", "swap a b"):
+            preview.update(user_input)
+        self.run_all()
+        self.assertEqual(self.shown, [(["b"], "")])
+        self.assertEqual(self.resolved, ["swap a b", "swap a", "swap"])
+
+    def test_stale(self):
+        preview = self.preview(["a"])
+        preview.update("swap a b")
+        self.main.pop(0)()
+        # changed while waiting on the async thread
+        preview.update("swap a c")
+        self.background.pop(0)()
+        self.run_all()
+        self.assertEqual(self.shown, [(["c"], "")])
+        # changed while running
+        preview.update("swap a d")
+        self.main.pop(0)()
+        resolve = preview.resolve
+        preview.resolve = lambda name: preview.update("") or resolve(name)
+        self.run_all()
+        self.assertEqual(self.shown[1:], [([], "")] * 3)
+        preview.resolve = resolve
+        preview.update("swap a e")
+        preview.close()
+        self.run_all()
+        self.assertEqual(len(self.shown), 4)
+
+    def test_limits(self):
+        limits = PREVIEW_LIMITS._replace(regions=2, lines=2)
+        preview = self.preview(["a\na\na", "a", "a"], limits=limits)
+        preview.update("swap a b")
+        self.run_all()
+        self.assertEqual(self.shown, [(["b\nb", "b"], "first 2 of 3 "
+                                       "selections, first 2 lines")])
+        preview = self.preview([""], limits=limits)
+        preview.update("mklist 1 1000000000")
+        self.run_all()
+        self.assertEqual(self.shown[-1], (["1\n2"], ""))
+
+    def test_errors(self):
+        preview = self.preview(["a"], budget=1000)
+        for user_input in ("nope", "http get", "dupl 1000", "swap -x a b"):
+            preview.update(user_input)
+            self.run_all()
+        notes = [note for outputs, note in self.shown]
+        self.assertEqual(notes[:3], ["'nope' is not a command",
+                                     "transmutations waiting on the network "
+                                     "are not previewed",
+                                     "output too large to preview"])
+        self.assertIn("option -x not recognized", notes[3])
+
+    def test_head(self):
+        self.assertEqual(head("a\nb\nc", 2, 100), ("a\nb", True))
+        self.assertEqual(head("a\nb", 2, 100), ("a\nb", False))
+        self.assertEqual(head("abcdef", 2, 3), ("abc", True))
+        self.assertEqual(head("", 2, 3), ("", False))
+
+    def test_html(self):
+        self.assertEqual(preview_html("<a>\n  b", "note"),
+                         '<body id="text-transmute-preview">'
+                         '<div style="padding: 0.3rem; font-family: '
+                         'monospace">&lt;a&gt;<br>&nbsp;&nbsp;b<br>'
+                         '<i>note</i></div></body>')
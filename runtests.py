@@ -1,7 +1,20 @@
 import unittest
 try:
     from commands import *
+    from transport import *
+    from httpcache import *
+    from htmlformat import *
+    from mdcache import *
+    from state import *
+    from loadtime import *
+    from tokenizer import *
+    from pipeline import *
+    from executor import *
+    from timing import *
+    from largefile import *
+    from preview import *
     from custom import *
+    from cli import *
 except ImportError:
     pass
 
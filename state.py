@@ -0,0 +1,149 @@
+import os
+import shutil
+import tempfile
+import threading
+import unittest
+
+HISTORY_LIMIT = 25
+STATE_DELAY = 1.0
+INPUT_FILE = "Data.sublime-project"
+HISTORY_FILE = "History.sublime-project"
+
+
+class SessionState(object):
+    """Current input and command usage history of the plugin
+
+    Both are read from the package data files once and then kept in
+    memory. Changes are written back by a debounced writer, a burst of
+    changes such as typing in the input panel is coalesced into a single
+    write once it has been quiet for delay seconds.
+    """
+
+    def __init__(self, directory=None, delay=STATE_DELAY,
+                 history_limit=HISTORY_LIMIT):
+        self.directory = directory
+        self.delay = delay
+        self.history_limit = history_limit
+        self.current_input = ""
+        self.history = []
+        self.dirty = set()
+        self.timer = None
+        self.lock = threading.Lock()
+
+    def load(self, directory):
+        """Read current input and history from the data files in directory"""
+        with self.lock:
+            self.directory = directory
+            self.current_input = read_file(os.path.join(directory,
+                                                        INPUT_FILE))
+            self.history = [x.strip() for x in
+                            read_file(os.path.join(directory,
+                                                   HISTORY_FILE)).splitlines()]
+            self.dirty.clear()
+
+    def get_current_input(self):
+        return self.current_input
+
+    def set_current_input(self, text):
+        if text != self.current_input:
+            self.current_input = text
+            self.changed(INPUT_FILE)
+
+    def reset_current_input(self):
+        self.set_current_input("")
+
+    def get_history(self):
+        return list(self.history)
+
+    def append_to_history(self, text):
+        self.history = (self.history + [text])[-self.history_limit:]
+        self.changed(HISTORY_FILE)
+
+    def reset_history(self):
+        self.history = []
+        self.changed(HISTORY_FILE)
+
+    def changed(self, file_name):
+        with self.lock:
+            self.dirty.add(file_name)
+            if self.timer is not None:
+                self.timer.cancel()
+            self.timer = threading.Timer(self.delay, self.flush)
+            self.timer.daemon = True
+            self.timer.start()
+
+    def flush(self):
+        """Write every changed data file now"""
+        with self.lock:
+            if self.timer is not None:
+                self.timer.cancel()
+            if self.directory is None:
+                return
+            contents = {INPUT_FILE: self.current_input,
+                        HISTORY_FILE: "\n".join(self.history)}
+            for file_name in sorted(self.dirty):
+                write_atomically(os.path.join(self.directory, file_name),
+                                 contents[file_name])
+            self.dirty.clear()
+
+
+def read_file(path):
+    """Return contents of path, empty if there is no such file"""
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            return f.read()
+    except (OSError, IOError):
+        return ""
+
+
+def write_atomically(path, text):
+    """Replace contents of path without ever leaving it half written"""
+    fd, temp_path = tempfile.mkstemp(dir=os.path.dirname(path) or ".",
+                                     suffix=".tmp")
+    try:
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            f.write(text)
+        os.replace(temp_path, path)
+    except Exception:
+        os.remove(temp_path)
+        raise
+
+
+class TestSessionState(unittest.TestCase):
+    """Unit test for in-memory session state"""
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.state = SessionState(delay=60, history_limit=3)
+        self.state.load(self.directory)
+
+    def tearDown(self):
+        self.state.flush()
+        shutil.rmtree(self.directory)
+
+    def read(self, file_name):
+        return read_file(os.path.join(self.directory, file_name))
+
+    def test_debounce(self):
+        for text in ["s", "sw", "swa", "swap"]:
+            self.state.set_current_input(text)
+        self.assertEqual(os.listdir(self.directory), [])
+        self.state.flush()
+        self.assertEqual(os.listdir(self.directory), [INPUT_FILE])
+        self.assertEqual(self.read(INPUT_FILE), "swap")
+
+    def test_history(self):
+        for text in ["a", "b", "c", "d"]:
+            self.state.append_to_history(text)
+        self.assertEqual(self.state.get_history(), ["b", "c", "d"])
+        self.state.flush()
+        self.assertEqual(self.read(HISTORY_FILE), "b\nc\nd")
+        state = SessionState()
+        state.load(self.directory)
+        self.assertEqual(state.get_history(), ["b", "c", "d"])
+
+    def test_timer(self):
+        self.state.delay = 0
+        self.state.set_current_input("expr")
+        self.state.timer.join()
+        self.assertEqual(self.read(INPUT_FILE), "expr")
@@ -0,0 +1,141 @@
+import os
+import time
+import unittest
+from collections import OrderedDict
+from contextlib import contextmanager
+
+PROFILE_DIRECTORY = "Profiles"
+
+
+class RunTimer(object):
+    """Wall time spent on every part of a transmutation of a view
+
+    Parsing, transmuting and applying the results are timed as a whole,
+    the steps of the pipeline once per selection, wherever it ran. With
+    profile set, what measure times is also profiled, but only on the
+    thread that called it: selections run by worker threads or
+    processes are timed step by step without being profiled.
+    """
+
+    def __init__(self, user_input, profile=False):
+        self.user_input = user_input
+        self.parts = OrderedDict()
+        self.steps = OrderedDict()
+        self.regions = 0
+        self.profiler = None
+        if profile:
+            # imported on first use to keep plugin load fast
+            import cProfile
+            self.profiler = cProfile.Profile()
+
+    @contextmanager
+    def measure(self, part):
+        """Time the body of the with statement as part"""
+        if self.profiler is not None:
+            self.profiler.enable()
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            seconds = time.perf_counter() - started
+            if self.profiler is not None:
+                self.profiler.disable()
+            self.parts[part] = self.parts.get(part, 0) + seconds
+
+    def add_region(self, timings):
+        """Add the (label, seconds) each step took over one selection"""
+        self.regions += 1
+        for label, seconds in timings or ():
+            self.steps.setdefault(label, []).append(seconds)
+
+    def total(self):
+        return sum(self.parts.values())
+
+    def summary(self):
+        """One line of where the time went, for the status bar"""
+        steps = ", ".join("%s %s" % (label, format_ms(sum(times)))
+                          for label, times in self.steps.items())
+        parts = []
+        for part, seconds in self.parts.items():
+            parts.append("%s %s" % (part, format_ms(seconds)))
+            if part == "transmute" and steps:
+                parts[-1] += " [%s]" % steps
+        return "Transmuted %d selection(s) in %s: %s" % (
+            self.regions, format_ms(self.total()), ", ".join(parts))
+
+    def describe(self):
+        """Breakdown of every part and step, for the console"""
+        lines = ["TextTransmute: '%s' over %d selection(s)" %
+                 (self.user_input, self.regions)]
+        for part, seconds in self.parts.items():
+            lines.append("  %-10s %10s" % (part, format_ms(seconds)))
+            if part != "transmute":
+                continue
+            for label, times in self.steps.items():
+                slowest = max(range(len(times)), key=times.__getitem__)
+                lines.append("    %s: %s total, %s mean, %s max "
+                             "(selection %d)" %
+                             (label,
+                              format_ms(sum(times)),
+                              format_ms(sum(times) / len(times)),
+                              format_ms(times[slowest]),
+                              slowest + 1))
+        lines.append("  %-10s %10s" % ("total", format_ms(self.total())))
+        return "\n".join(lines)
+
+    def dump_profile(self, directory):
+        """Write the collected profile to a new file in directory"""
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+        stamp = time.strftime("%Y%m%d-%H%M%S")
+        path = os.path.join(directory, "transmute-%s.prof" % stamp)
+        number = 1
+        while os.path.exists(path):
+            number += 1
+            path = os.path.join(directory, "transmute-%s-%d.prof" %
+                                (stamp, number))
+        self.profiler.dump_stats(path)
+        return path
+
+
+def format_ms(seconds):
+    return "%.1f ms" % (seconds * 1000)
+
+
+class TestRunTimer(unittest.TestCase):
+    """Unit test for timing transmutations"""
+
+    def test_default(self):
+        timer = RunTimer("swap a b | dupl")
+        with timer.measure("parse"):
+            pass
+        with timer.measure("transmute"):
+            timer.add_region([("swap a b", 0.002), ("dupl", 0.001)])
+            timer.add_region([("swap a b", 0.004), ("dupl", 0.001)])
+        with timer.measure("apply"):
+            pass
+        self.assertEqual(list(timer.parts),
+                         ["parse", "transmute", "apply"])
+        self.assertEqual(timer.steps["swap a b"], [0.002, 0.004])
+        summary = timer.summary()
+        self.assertTrue(summary.startswith("Transmuted 2 selection(s) in"))
+        self.assertIn("[swap a b 6.0 ms, dupl 2.0 ms]", summary)
+        description = timer.describe()
+        self.assertIn("swap a b: 6.0 ms total, 3.0 ms mean, 4.0 ms max "
+                      "(selection 2)", description)
+        self.assertIn("total", description)
+
+    def test_profile(self):
+        import shutil
+        import tempfile
+        directory = tempfile.mkdtemp()
+        try:
+            timer = RunTimer("swap a b", profile=True)
+            with timer.measure("transmute"):
+                sorted(range(100))
+            path = timer.dump_profile(os.path.join(directory, "Profiles"))
+            self.assertTrue(os.path.getsize(path))
+            self.assertNotEqual(timer.dump_profile(os.path.dirname(path)),
+                                path)
+        finally:
+            shutil.rmtree(directory)
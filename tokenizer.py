@@ -0,0 +1,79 @@
+import re
+import unittest
+from functools import lru_cache
+
+# a token is a run of anything but whitespace, where quoted or backticked
+# parts may hold whitespace too
+TOKEN_PATTERN = re.compile(r'''((?:[^\s"'`]+|"[^"]*"|'[^']*'|`[^`]*`)+)''')
+TOKEN_CACHE_LIMIT = 256
+# longer strings are tokenized every time rather than kept in the cache
+TOKEN_CACHE_MAX_CHARS = 1024
+
+
+def tokenize(text):
+    """Split text on whitespace outside of quotes and backticks
+
+    Quotes are kept on the tokens, see strip_quotes. Text without any
+    quote or backtick is split by str.split, short strings such as
+    commands typed again and again are remembered. Returns a tuple.
+    """
+    if len(text) <= TOKEN_CACHE_MAX_CHARS:
+        return cached_tokenize(text)
+    return split_tokens(text)
+
+
+@lru_cache(maxsize=TOKEN_CACHE_LIMIT)
+def cached_tokenize(text):
+    return split_tokens(text)
+
+
+def split_tokens(text):
+    if '"' in text or "'" in text or '`' in text:
+        return tuple(TOKEN_PATTERN.findall(text))
+    return tuple(text.split())
+
+
+def strip_quotes(input_string):
+    """Strip quotes from input string"""
+    if ((len(input_string) > 1)
+            and (input_string[0] == input_string[len(input_string)-1])
+            and (input_string[0] in ('"', "'"))):
+        return input_string[1:-1]
+    return input_string
+
+
+class TestTokenizer(unittest.TestCase):
+    """Unit test for splitting user input and selections into tokens"""
+
+    def test_default(self):
+        self.assertEqual(tokenize("swap a  b\n\tc "), ("swap", "a", "b", "c"))
+        self.assertEqual(tokenize("swap 'a b' \"c d\"e `1 + 2`"),
+                         ("swap", "'a b'", '"c d"e', "`1 + 2`"))
+        self.assertEqual(tokenize(""), ())
+        self.assertEqual(tokenize(" \n "), ())
+        self.assertEqual(tokenize("a 'b"), ("a", "b"))
+
+    def test_fast_path(self):
+        # splitting on whitespace agrees with the pattern without quotes
+        texts = ["a b c\x1cd\x85e", "　x  y\r\nz\x0b\x0cw",
+                 "key1 value1\nkey2 value2 " * 3]
+        for text in texts:
+            self.assertEqual(split_tokens(text),
+                             tuple(TOKEN_PATTERN.split(text)[1::2]))
+        long_text = "k 'v w' " * TOKEN_CACHE_MAX_CHARS
+        self.assertEqual(len(tokenize(long_text)), TOKEN_CACHE_MAX_CHARS * 2)
+
+    def test_cache(self):
+        cached_tokenize.cache_clear()
+        tokenize("swap a b")
+        tokenize("swap a b")
+        self.assertEqual(cached_tokenize.cache_info().hits, 1)
+        tokenize("x " * TOKEN_CACHE_MAX_CHARS)
+        self.assertEqual(cached_tokenize.cache_info().currsize, 1)
+
+    def test_strip_quotes(self):
+        self.assertEqual(strip_quotes("'a b'"), "a b")
+        self.assertEqual(strip_quotes('"a"'), "a")
+        self.assertEqual(strip_quotes("'a\""), "'a\"")
+        self.assertEqual(strip_quotes("`a`"), "`a`")
+        self.assertEqual(strip_quotes("'"), "'")
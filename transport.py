@@ -0,0 +1,157 @@
+import json
+import threading
+import unittest
+
+HTTP_TIMEOUT = 30
+HTTP_POOL_SIZE = 10
+
+
+class Transport(object):
+    """Shared keep-alive session used to send http requests
+
+    Connections are pooled per host and reused across transmutations, so
+    repeated requests to the same api skip the tcp and tls handshakes.
+    """
+
+    def __init__(self, timeout=HTTP_TIMEOUT, pool_size=HTTP_POOL_SIZE):
+        self.timeout = timeout
+        self.pool_size = pool_size
+        self.session = None
+        self.lock = threading.Lock()
+
+    def configure(self, timeout=HTTP_TIMEOUT, pool_size=HTTP_POOL_SIZE):
+        with self.lock:
+            self.timeout = timeout
+            if pool_size != self.pool_size:
+                self.pool_size = pool_size
+                self.close_session()
+
+    def get_session(self):
+        with self.lock:
+            if self.session is None:
+                # imported on first use to keep plugin load fast
+                import requests
+                from requests.adapters import HTTPAdapter
+                adapter = HTTPAdapter(pool_connections=self.pool_size,
+                                      pool_maxsize=self.pool_size)
+                self.session = requests.Session()
+                self.session.mount("http://", adapter)
+                self.session.mount("https://", adapter)
+            return self.session
+
+    def request(self, method, url, params=None, headers=None):
+        return self.get_session().request(method,
+                                          url,
+                                          params=params,
+                                          headers=headers,
+                                          timeout=self.timeout)
+
+    def close(self):
+        with self.lock:
+            self.close_session()
+
+    def close_session(self):
+        if self.session is not None:
+            self.session.close()
+            self.session = None
+
+    def stats(self):
+        """Return connections opened and reused per pooled host"""
+        stats = {}
+        session = self.session
+        if session is None:
+            return stats
+        for adapter in set(session.adapters.values()):
+            pools = adapter.poolmanager.pools
+            for key in list(pools.keys()):
+                pool = pools.get(key)
+                if pool is None:
+                    continue
+                host = "%s://%s:%s" % (pool.scheme, pool.host, pool.port)
+                stats[host] = {"opened": pool.num_connections,
+                               "requests": pool.num_requests,
+                               "reused": (pool.num_requests -
+                                          pool.num_connections)}
+        return stats
+
+    def describe_stats(self):
+        stats = self.stats()
+        if not stats:
+            return "No pooled http connections"
+        return "\n".join("%s: %d requests, %d connections opened, %d reused"
+                         % (host, s["requests"], s["opened"], s["reused"])
+                         for host, s in sorted(stats.items()))
+
+
+TRANSPORT = Transport()
+
+
+# Local stand-in server for tests and benchmarks
+
+def serve_locally(handler_class=None):
+    """Start a threaded local http server, returning it and its base url"""
+    import socketserver
+    from http.server import HTTPServer
+
+    class Server(socketserver.ThreadingMixIn, HTTPServer):
+        daemon_threads = True
+
+    server = Server(("127.0.0.1", 0), handler_class or stand_in_handler())
+    thread = threading.Thread(target=server.serve_forever)
+    thread.daemon = True
+    thread.start()
+    return server, "http://127.0.0.1:%d" % server.server_address[1]
+
+
+def stand_in_handler():
+    """Handler echoing method, path and query back as json over keep-alive"""
+    from http.server import BaseHTTPRequestHandler
+
+    class StandInHandler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+        # headers and body go out as separate writes, which would wait on
+        # delayed acknowledgements over keep-alive connections
+        disable_nagle_algorithm = True
+
+        def respond(self):
+            body = json.dumps({"method": self.command,
+                               "path": self.path}).encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Cache-Control", "max-age=60")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            if self.command != "HEAD":
+                self.wfile.write(body)
+
+        do_GET = do_POST = do_PUT = do_DELETE = do_HEAD = respond
+        do_OPTIONS = respond
+
+        def log_message(self, format, *args):
+            pass
+
+    return StandInHandler
+
+
+class TestTransport(unittest.TestCase):
+    """Unit test for pooled http transport"""
+
+    def setUp(self):
+        self.server, self.url = serve_locally()
+        self.transport = Transport(timeout=5)
+
+    def tearDown(self):
+        self.transport.close()
+        self.server.shutdown()
+        self.server.server_close()
+
+    def test_request(self):
+        r = self.transport.request("GET", self.url + "/a", params={"b": "c"})
+        self.assertEqual(r.json(), {"method": "GET", "path": "/a?b=c"})
+
+    def test_stats(self):
+        for i in range(5):
+            self.transport.request("GET", self.url)
+        stats = self.transport.stats()
+        self.assertEqual(list(stats.values()),
+                         [{"opened": 1, "requests": 5, "reused": 4}])